@@ -0,0 +1,114 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllamaServer:
+    """
+    Local HTTP stand-in for an Ollama server (/api/version, /api/tags, /api/chat, /api/generate),
+    with configurable latency and error rate. Usable as a context manager; `host` is the URL for ollama.Client.
+    """
+
+    def __init__(self, models: list[str] | None = None, latency: float = 0.2, latency_jitter: float = 0.05,
+                 error_rate: float = 0.0, response: str = "Q: Was ist ein Seitenlayout?\nA: Die Anordnung der Blöcke.",
+                 port: int = 0, seed: int | None = None) -> None:
+        self.models = models or []
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.response = response
+        self.requests: list[str] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def _delay_and_fail(self, path: str) -> bool:
+        """Records the request, sleeps for the simulated latency and returns True if it should fail."""
+        with self._lock:
+            self.requests.append(path)
+            delay = max(0.0, self.latency + self._random.uniform(-self.latency_jitter, self.latency_jitter))
+            failed = self._random.random() < self.error_rate
+        time.sleep(delay)
+        return failed
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send_json(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                with server._lock:
+                    server.requests.append(self.path)
+                if self.path == "/api/version":
+                    self._send_json(200, {"version": "0.0.0-fake"})
+                elif self.path == "/api/tags":
+                    self._send_json(200, {"models": [{"name": model, "model": model, "size": 0} for model in server.models]})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self) -> None:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path not in ("/api/chat", "/api/generate"):
+                    self._send_json(404, {"error": "not found"})
+                    return
+                if server._delay_and_fail(self.path):
+                    self._send_json(503, {"error": "server busy"})
+                    return
+
+                model = request.get("model", "")
+                if model not in server.models:
+                    self._send_json(404, {"error": f"model '{model}' not found"})
+                    return
+
+                done = {"model": model, "done": True, "done_reason": "stop", "prompt_eval_count": 64,
+                        "eval_count": len(server.response) // 4, "total_duration": int(server.latency * 1e9)}
+                content = ({"message": {"role": "assistant", "content": server.response}} if self.path == "/api/chat"
+                           else {"response": server.response})
+
+                if request.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.end_headers()
+                    for word in server.response.split(" "):
+                        chunk = ({"message": {"role": "assistant", "content": word + " "}} if self.path == "/api/chat"
+                                 else {"response": word + " "})
+                        self.wfile.write(json.dumps({"model": model, "done": False, **chunk}).encode() + b"\n")
+                    empty = {"message": {"role": "assistant", "content": ""}} if self.path == "/api/chat" else {"response": ""}
+                    self.wfile.write(json.dumps({**done, **empty}).encode() + b"\n")
+                else:
+                    self._send_json(200, {**done, **content})
+
+        return Handler
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,589 @@
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import toml
+from loguru import logger
+from PIL import Image
+
+from benchmark.fake_ollama import FakeOllamaServer
+from benchmark.synthetic_pdfs import PAGE_SIZES, generate_corpus, render_page, write_text_pdf
+from gemini_detection.postprocess import postprocess_gemini_boxes
+from gemini_detection.fake_client import FakeGeminiClient
+from main import run_pipeline
+from util.cache_store import DetectionCache, TransformationCache
+from util.config_reader import ConfigLoader
+from util.detection_io import iter_saved_boxes
+from util.page import Page
+from util.page_writer import PAGE_FORMATS, benchmark_page_formats
+from util import metrics
+
+RESULT_SCHEMA = 1
+
+
+def latency_summary(samples: list[float]) -> dict:
+    """Count, mean and nearest-rank percentiles of latencies given in seconds, reported in milliseconds."""
+    if not samples:
+        return {"count": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    ordered = sorted(samples)
+    percentile = lambda p: round(ordered[min(len(ordered) - 1, len(ordered) * p // 100)] * 1000, 3)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+def _current_rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc), falling back to the lifetime peak elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRssSampler:
+    """Samples the RSS of this process on a background thread and keeps the peak of the measured section."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, _current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    @property
+    def peak_mb(self) -> float:
+        return round(self.peak_bytes / 1e6, 1)
+
+    def __enter__(self) -> "PeakRssSampler":
+        self.peak_bytes = _current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, _current_rss_bytes())
+
+
+def _children_peak_rss_mb() -> float:
+    """Lifetime peak RSS of the largest finished child process (e.g. pdftoppm)."""
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round((peak if sys.platform == "darwin" else peak * 1024) / 1e6, 1)
+
+
+def _git_commit() -> tuple[str | None, bool]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], check=True,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def _write_config(workdir: str, base_config: str, ollama_host: str | None = None, text_layer: bool = False) -> ConfigLoader:
+    """
+    Copies the project configuration with all caches redirected into workdir and the Gemini backend selected
+    (and Ollama pointed at ollama_host, e.g. a FakeOllamaServer). The text layer fast path is only on with text_layer.
+    """
+    with open(base_config, "r", encoding="utf-8") as f:
+        config = toml.load(f)
+
+    general = config.setdefault("GENENERAL_CONFIGURATION", {})
+    general["CACHE_FILES"] = {}
+    general["CACHE_DATABASES"] = {
+        "TRANSFORMATION": os.path.join(workdir, "cache", "transformation_cache.sqlite3"),
+        "DETECTION": os.path.join(workdir, "cache", "detection_cache.sqlite3"),
+        "PAGE_SIMILARITY": os.path.join(workdir, "cache", "page_similarity.sqlite3"),
+    }
+    config.setdefault("CROPS", {})["CACHE_DIR"] = os.path.join(workdir, "raster_cache")
+    config.setdefault("DETECTION", {})["BACKEND"] = "gemini"
+    config.setdefault("TEXT_LAYER", {})["ENABLED"] = text_layer
+    config.setdefault("PROCESS_SETTINGS", {})["CACHE_PDF_TO_IMAGE_CREATION"] = True
+    config.setdefault("GEMINI_SETTINGS", {})["CACHE_ENABLED"] = True
+    if ollama_host:
+        config.setdefault("OLLAMA", {})["HOST"] = ollama_host
+
+    config_path = os.path.join(workdir, "config.toml")
+    with open(config_path, "w", encoding="utf-8") as f:
+        toml.dump(config, f)
+    return ConfigLoader(config_path)
+
+
+def bench_pipeline(config_loader: ConfigLoader, pdf_files: set[str], workdir: str, client: FakeGeminiClient) -> dict:
+    """Runs the full pipeline once and returns pages/s, peak RSS and the per-stage statistics."""
+    calls_before = len(client.calls)
+    with PeakRssSampler() as rss:
+        started = time.perf_counter()
+        pipeline = run_pipeline(
+            config_loader,
+            pdf_files,
+            processed_dir=os.path.join(workdir, "processed"),
+            detections_dir=os.path.join(workdir, "detections"),
+            visualizations_dir=os.path.join(workdir, "visualizations"),
+            gemini_client=client,
+            # Up-to-date pages are normally skipped; the warm run measures serving them from the caches
+            force=True,
+        )
+        seconds = time.perf_counter() - started
+
+    pages = len(pipeline.results) if pipeline else 0
+    return {
+        "pages": pages,
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(pages / seconds, 3) if seconds else None,
+        "peak_rss_mb": rss.peak_mb,
+        "gemini_calls": len(client.calls) - calls_before,
+        "stages": pipeline.summary() if pipeline else {},
+    }
+
+
+def bench_startup(workdir: str, runs: int = 3) -> dict:
+    """
+    Wall time of `python src/main.py` in a project folder whose PDFs are processed already, with the phases of its
+    startup report. The folder shares the corpus and the detection cache of the pipeline runs, so its first run only
+    rasterizes and replays cached detections; the fastest of the following no-op runs counts. Interpreter start and
+    imports included, a fully cached run should stay well under a second.
+    """
+    root = os.path.join(workdir, "startup")
+    os.makedirs(os.path.join(root, "config"), exist_ok=True)
+    os.makedirs(os.path.join(root, "data"), exist_ok=True)
+    if not os.path.lexists(os.path.join(root, "data", "to_process")):
+        os.symlink(os.path.join(workdir, "to_process"), os.path.join(root, "data", "to_process"))
+
+    # main.py reads config/config.toml of its working directory; everything but the detection cache is its own
+    with open(os.path.join(workdir, "config.toml"), "r", encoding="utf-8") as f:
+        config = toml.load(f)
+    databases = config["GENENERAL_CONFIGURATION"]["CACHE_DATABASES"]
+    for name in ("TRANSFORMATION", "PAGE_SIMILARITY"):
+        databases[name] = os.path.join(root, "cache", os.path.basename(databases[name]))
+    config["CROPS"]["CACHE_DIR"] = os.path.join(root, "raster_cache")
+    with open(os.path.join(root, "config", "config.toml"), "w", encoding="utf-8") as f:
+        toml.dump(config, f)
+
+    main_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+    seconds, output = [], ""
+    for run in range(runs + 1):
+        started = time.perf_counter()
+        process = subprocess.run([sys.executable, main_script], cwd=root, capture_output=True, text=True)
+        if run:
+            seconds.append(time.perf_counter() - started)
+        output = process.stderr
+    report = re.search(r"Startup report: (.*)", output)
+    phases = {phase: float(value) for phase, value in re.findall(r"(\w+) ([\d.]+)s", report.group(1))} if report else {}
+
+    result = {
+        "seconds": round(min(seconds), 3),
+        "imports_seconds": phases.get("imports"),
+        "phases": phases,
+        "up_to_date": "nothing to process" in output,
+    }
+    if not result["up_to_date"] or result["seconds"] >= 1.0:
+        logger.warning(f"⚠️ A fully cached run took {result['seconds']}s (imports {result['imports_seconds']}s, "
+                       f"up to date: {result['up_to_date']}), expected well under a second")
+    return result
+
+
+def bench_caching(workdir: str, entries: int) -> dict:
+    """Latencies of the conversion cache (per-page insert, full scan) and the detection cache (hit and miss lookups)."""
+    transformation = TransformationCache(os.path.join(workdir, "cache", "bench_transformation.sqlite3"))
+    detection = DetectionCache(os.path.join(workdir, "cache", "bench_detection.sqlite3"))
+    put_latencies, scan_latencies, hit_latencies, miss_latencies, store_latencies = [], [], [], [], []
+
+    with PeakRssSampler() as rss:
+        for index in range(entries):
+            started = time.perf_counter()
+            transformation.put_many([(f"data/processed/doc_{index // 50}/page_{index:05d}.png", f"data/to_process/doc_{index // 50}.pdf")])
+            put_latencies.append(time.perf_counter() - started)
+
+        for _ in range(5):
+            started = time.perf_counter()
+            transformation.items()
+            scan_latencies.append(time.perf_counter() - started)
+
+        request_digests = [(model, DetectionCache.request_digest("prompt", model, "{}")) for model in ("model-a", "model-b")]
+        for index in range(entries):
+            started = time.perf_counter()
+            detection.put(f"{index:064x}", request_digests[0][1], "model-a", "[]", 1.0, 1300)
+            store_latencies.append(time.perf_counter() - started)
+        for index in range(entries):
+            started = time.perf_counter()
+            detection.lookup(f"{index:064x}", request_digests)
+            hit_latencies.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            detection.lookup(f"{index + entries:064x}", request_digests)
+            miss_latencies.append(time.perf_counter() - started)
+
+    transformation.close()
+    detection.close()
+    return {
+        "entries": entries,
+        "peak_rss_mb": rss.peak_mb,
+        "transformation_put": latency_summary(put_latencies),
+        "transformation_scan": latency_summary(scan_latencies),
+        "detection_put": latency_summary(store_latencies),
+        "detection_hit": latency_summary(hit_latencies),
+        "detection_miss": latency_summary(miss_latencies),
+    }
+
+
+def bench_dedup(config_loader: ConfigLoader, workdir: str, client: FakeGeminiClient, slides: int = 5, seed: int = 42) -> dict:
+    """
+    Gemini calls saved by page deduplication on an incremental-reveal deck (every slide shows one more block),
+    followed by an identical copy of the deck in a second document.
+    """
+    import random
+
+    from PIL import ImageDraw
+
+    from gemini_detection.detect import detect_logical_blocks_with_gemini
+
+    image, boxes = render_page(PAGE_SIZES["a4_landscape"], 100, random.Random(seed))
+    slides = min(slides, len(boxes))
+    pages = []
+    for document in ("dedup_deck", "dedup_deck_copy"):
+        os.makedirs(os.path.join(workdir, "dedup", document), exist_ok=True)
+        for slide in range(1, slides + 1):
+            revealed = image.copy()
+            # Blocks not revealed yet are blank
+            for box in boxes[slide:]:
+                ImageDraw.Draw(revealed).rectangle(box, fill="white")
+            image_path = os.path.join(workdir, "dedup", document, f"page_{slide:05d}.png")
+            revealed.save(image_path, compress_level=1)
+            pages.append(image_path)
+
+    output_dir = os.path.join(workdir, "dedup", "detections")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    calls_before = len(client.calls)
+    started = time.perf_counter()
+    detected = detect_logical_blocks_with_gemini(pages, output_dir, config_loader, client=client, max_in_flight=1)
+    return {
+        "pages": len(pages),
+        "detected_pages": len(detected),
+        "gemini_calls": len(client.calls) - calls_before,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def bench_text_layer(base_config: str, workdir: str, client: FakeGeminiClient, slides: int = 8, seed: int = 42) -> dict:
+    """
+    Gemini calls left when a born-digital slide deck is processed next to a scanned document of the same length:
+    with the text layer fast path only the scanned pages should reach the detector. Uses caches of its own.
+    """
+    folder = os.path.join(workdir, "text_layer")
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    config_loader = _write_config(folder, base_config, text_layer=True)
+    digital = write_text_pdf(os.path.join(folder, "to_process", "text_slides.pdf"), slides, seed=seed)
+    scanned = generate_corpus(os.path.join(folder, "to_process"), documents=1, min_pages=slides, max_pages=slides, seed=seed + 1)[0]["pdf"]
+
+    calls_before = len(client.calls)
+    started = time.perf_counter()
+    pipeline = run_pipeline(
+        config_loader,
+        {digital, scanned},
+        processed_dir=os.path.join(folder, "processed"),
+        detections_dir=os.path.join(folder, "detections"),
+        visualizations_dir=os.path.join(folder, "visualizations"),
+        gemini_client=client,
+        force=True,
+    )
+    return {
+        "pages": len(pipeline.results) if pipeline else 0,
+        "gemini_calls": len(client.calls) - calls_before,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def bench_box_conversion(boxes: list[dict], iterations: int) -> dict:
+    """Latency of post-processing one page of normalized Gemini boxes (conversion, clamping, overlap merging)."""
+    latencies = []
+    with PeakRssSampler() as rss:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            postprocess_gemini_boxes(boxes, (2480, 3508))
+            latencies.append(time.perf_counter() - started)
+    return {"boxes_per_page": len(boxes), "peak_rss_mb": rss.peak_mb, **latency_summary(latencies)}
+
+
+def bench_ollama(server: FakeOllamaServer, requests: int) -> dict:
+    """Round-trip latency of model listing and chat requests through the ollama client against the fake server."""
+    from ollama import Client
+
+    client = Client(host=server.host)
+    list_latencies, chat_latencies, errors = [], [], 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.list()
+        list_latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        try:
+            client.chat(server.models[0], messages=[{"role": "user", "content": "Erstelle eine Karteikarte."}])
+            chat_latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors += 1
+    return {"requests": requests, "errors": errors, "list": latency_summary(list_latencies), "chat": latency_summary(chat_latencies)}
+
+
+def _detected_pages(config_loader: ConfigLoader, workdir: str) -> list[tuple[str, dict]]:
+    """(image_path, boxes record) of every detected page of the pipeline run whose image exists, in the configured page format."""
+    extension = PAGE_FORMATS[config_loader.get("PROCESS_SETTINGS_PAGE_IMAGE_FORMAT", "png")][0]
+    pages = [(os.path.join(workdir, "processed", f"{key}{extension}"), record)
+             for key, record in iter_saved_boxes(os.path.join(workdir, "detections"))]
+    return [(image_path, record) for image_path, record in pages if os.path.exists(image_path)]
+
+
+def bench_flashcards(config_loader: ConfigLoader, workdir: str) -> dict:
+    """Cards per second and time to first card for the detected pages of the pipeline run, against the fake Ollama server."""
+    from concurrent.futures import ThreadPoolExecutor
+    from flashcards.generate import FlashcardGenerator
+
+    output_dir = os.path.join(workdir, "flashcards")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    generator = FlashcardGenerator(config_loader, output_dir)
+    generator.warm_up()
+
+    pages = [(Page(image_path), record["boxes"]) for image_path, record in _detected_pages(config_loader, workdir)]
+
+    with PeakRssSampler() as rss:
+        with ThreadPoolExecutor(max_workers=generator.max_in_flight) as executor:
+            list(executor.map(lambda item: generator.generate_page(*item), pages))
+    return {"pages": len(pages), "max_in_flight": generator.max_in_flight, "peak_rss_mb": rss.peak_mb, **generator.summary()}
+
+
+def bench_crops(config_loader: ConfigLoader, workdir: str, repeats: int = 50) -> dict:
+    """
+    Region extraction from memory-mapped page rasters for the detected pages of the pipeline run:
+    every box is cut repeats times (zero-copy views), then encoded once as PNG.
+    """
+    from util.crops import RasterCache
+
+    cache = RasterCache(os.path.join(workdir, "raster_cache"), max_mapped_pages=8)
+    pages = _detected_pages(config_loader, workdir)
+
+    regions = 0
+    with PeakRssSampler() as rss:
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for image_path, record in pages:
+                regions += len(cache.crops(image_path, record["boxes"]))
+        extract_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        encoded = sum(len(crop.encode("png")) for image_path, record in pages for crop in cache.crops(image_path, record["boxes"]))
+        encode_seconds = time.perf_counter() - started
+
+    stats = cache.stats()
+    return {
+        "pages": len(pages),
+        "regions": regions,
+        "regions_per_second": round(regions / extract_seconds, 1) if extract_seconds else None,
+        "decodes_per_page": round(stats["decodes"] / len(pages), 2) if pages else None,
+        "png_encode_seconds": round(encode_seconds, 3),
+        "png_megabytes": round(encoded / 1e6, 2),
+        "peak_rss_mb": rss.peak_mb,
+    }
+
+
+def bench_instrumentation(iterations: int) -> dict:
+    """Cost of one timing span while metrics are disabled and enabled, in nanoseconds."""
+    was_enabled = metrics.enabled()
+    result = {}
+    for state in (False, True):
+        metrics.configure({"METRICS_ENABLED": state})
+        started = time.perf_counter()
+        for _ in range(iterations):
+            with metrics.span("benchmark_noop", stage="bench"):
+                pass
+        result["enabled_ns" if state else "disabled_ns"] = round((time.perf_counter() - started) / iterations * 1e9, 1)
+    metrics.configure({"METRICS_ENABLED": was_enabled})
+    return result
+
+
+def _synthetic_boxes(count: int) -> list[dict]:
+    step = 1000 // max(1, count)
+    return [{"box_2d": [index * step, 80, index * step + step - 10, 920], "label": "text"} for index in range(count)]
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    # Absolute, so the configuration also holds for the main.py runs of bench_startup
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="karteikarten-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    logger.info(f"🏁 Benchmark in {workdir}")
+
+    corpus = generate_corpus(os.path.join(workdir, "to_process"), documents=args.documents, min_pages=args.min_pages,
+                             max_pages=args.max_pages, seed=args.seed)
+    pdf_files = {document["pdf"] for document in corpus}
+    config_loader = _write_config(workdir, args.config)
+
+    client = FakeGeminiClient(latency=args.gemini_latency, latency_jitter=args.gemini_latency / 4,
+                              error_rate=args.gemini_error_rate, boxes=_synthetic_boxes(args.boxes_per_page), seed=args.seed)
+    # Cold run: empty caches; warm run: every page served from the conversion and detection caches
+    cold = bench_pipeline(config_loader, pdf_files, workdir, client)
+    warm = bench_pipeline(config_loader, pdf_files, workdir, client)
+    startup = bench_startup(workdir)
+
+    with FakeOllamaServer(models=args.ollama_models, latency=args.ollama_latency, error_rate=args.ollama_error_rate,
+                          seed=args.seed) as ollama_server:
+        ollama = bench_ollama(ollama_server, args.ollama_requests)
+        flashcards = bench_flashcards(_write_config(workdir, args.config, ollama_server.host), workdir)
+
+    commit, dirty = _git_commit()
+    result = {
+        "schema": RESULT_SCHEMA,
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "workdir")},
+        },
+        "corpus": {
+            "documents": len(corpus),
+            "pages": sum(document["pages"] for document in corpus),
+            "megabytes": round(sum(document["bytes"] for document in corpus) / 1e6, 2),
+        },
+        "pipeline": {"cold": cold, "warm": warm},
+        "startup": startup,
+        "stages": {
+            "rasterization": cold["stages"]["rasterize"],
+            "detection": cold["stages"]["detect"],
+            "visualization": cold["stages"]["visualize"],
+            "caching": bench_caching(workdir, args.cache_entries),
+            "box_conversion": bench_box_conversion(_synthetic_boxes(args.boxes_per_page), args.iterations),
+        },
+        "ollama": ollama,
+        "flashcards": flashcards,
+        "crops": bench_crops(config_loader, workdir),
+        "dedup": bench_dedup(config_loader, workdir, client, seed=args.seed),
+        "text_layer": bench_text_layer(args.config, workdir, client, seed=args.seed),
+        "instrumentation": bench_instrumentation(args.iterations),
+        "peak_rss_children_mb": _children_peak_rss_mb(),
+    }
+
+    if not args.workdir and not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def _metrics(result: dict) -> dict[str, tuple[float, bool]]:
+    """Flattens the comparable numbers of a result: name -> (value, higher_is_better)."""
+    metrics = {}
+    for run, summary in result.get("pipeline", {}).items():
+        metrics[f"pipeline.{run}.pages_per_second"] = (summary.get("pages_per_second"), True)
+        metrics[f"pipeline.{run}.peak_rss_mb"] = (summary.get("peak_rss_mb"), False)
+    for stage, summary in result.get("stages", {}).items():
+        for name, value in summary.items():
+            if name in ("p50_ms", "p95_ms"):
+                metrics[f"stages.{stage}.{name}"] = (value, False)
+            elif isinstance(value, dict) and "p95_ms" in value:
+                metrics[f"stages.{stage}.{name}.p95_ms"] = (value["p95_ms"], False)
+    flashcards = result.get("flashcards", {})
+    metrics["flashcards.cards_per_second"] = (flashcards.get("cards_per_second"), True)
+    metrics["flashcards.time_to_first_card"] = (flashcards.get("time_to_first_card"), False)
+    metrics["dedup.gemini_calls"] = (result.get("dedup", {}).get("gemini_calls"), False)
+    metrics["text_layer.gemini_calls"] = (result.get("text_layer", {}).get("gemini_calls"), False)
+    metrics["startup.seconds"] = (result.get("startup", {}).get("seconds"), False)
+    metrics["startup.imports_seconds"] = (result.get("startup", {}).get("imports_seconds"), False)
+    metrics["crops.regions_per_second"] = (result.get("crops", {}).get("regions_per_second"), True)
+    return metrics
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.1) -> list[str]:
+    """Returns a line per metric that got worse by more than threshold (relative) between two result files."""
+    regressions = []
+    baseline_metrics = _metrics(baseline)
+    for name, (value, higher_is_better) in _metrics(current).items():
+        old_value = baseline_metrics.get(name, (None, True))[0]
+        if not old_value or value is None:
+            continue
+        change = (value - old_value) / old_value
+        if (-change if higher_is_better else change) > threshold:
+            regressions.append(f"{name}: {old_value} -> {value} ({change:+.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark with synthetic PDFs and fake Gemini/Ollama backends.")
+    parser.add_argument("--documents", type=int, default=6)
+    parser.add_argument("--min-pages", type=int, default=1)
+    parser.add_argument("--max-pages", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--boxes-per-page", type=int, default=8)
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="seconds per fake Gemini request")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--ollama-models", nargs="+", default=["gemma3:12b", "gpt-oss:20b"])
+    parser.add_argument("--ollama-latency", type=float, default=0.2)
+    parser.add_argument("--ollama-error-rate", type=float, default=0.0)
+    parser.add_argument("--ollama-requests", type=int, default=20)
+    parser.add_argument("--cache-entries", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=10000, help="box conversion repetitions")
+    parser.add_argument("--config", default="config/config.toml", help="project configuration the benchmark starts from")
+    parser.add_argument("--workdir", default=None, help="keep corpus, caches and outputs here (default: temporary)")
+    parser.add_argument("--keep", action="store_true", help="do not delete the temporary working directory")
+    parser.add_argument("--output", default=None, help="result file (default: data/benchmarks/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="baseline result file; exits with 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as regression")
+    parser.add_argument("--page-formats", default=None, metavar="IMAGE",
+                        help="only compare the page storage formats on one rasterized page and exit")
+    args = parser.parse_args()
+
+    if args.page_formats:
+        with Image.open(args.page_formats) as page:
+            for row in benchmark_page_formats(page.convert("RGB")):
+                logger.info(row)
+        return
+
+    if shutil.which("pdftoppm") is None:
+        logger.error("❌ pdftoppm (poppler) is required for the rasterization stage.")
+        sys.exit(2)
+
+    result = run_benchmark(args)
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join("data", "benchmarks", f"{stamp}_{(result['meta']['commit'] or 'nogit')[:8]}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    logger.info(f"💾 Benchmark results written to {output}")
+    logger.info(f"📊 cold: {result['pipeline']['cold']['pages_per_second']} pages/s, "
+                f"warm: {result['pipeline']['warm']['pages_per_second']} pages/s")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare_results(json.load(f), result, args.threshold)
+        for line in regressions:
+            logger.warning(f"⚠️ Regression {line}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"✅ No regressions beyond {args.threshold:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    # Usage (from the repository root): PYTHONPATH=src python -m benchmark.run [--compare data/benchmarks/<baseline>.json]
+    main()
@@ -0,0 +1,160 @@
+import os
+import random
+
+from PIL import Image, ImageDraw
+
+# Page sizes in inches (width, height)
+PAGE_SIZES = {
+    "a4": (8.27, 11.69),
+    "a4_landscape": (11.69, 8.27),
+    "letter": (8.5, 11.0),
+    "a5": (5.83, 8.27),
+}
+
+
+def _draw_text_block(draw: ImageDraw.ImageDraw, rng: random.Random, box: tuple[int, int, int, int], line_height: int) -> None:
+    """Fills a box with lines of word-like dark bars (printed text)."""
+    x1, y1, x2, y2 = box
+    for y in range(y1, y2 - line_height, line_height):
+        x = x1
+        line_end = x2 - rng.randint(0, (x2 - x1) // 3)
+        while x < line_end:
+            word = rng.randint(line_height, line_height * 4)
+            draw.rectangle([x, y, min(x + word, line_end), y + line_height * 6 // 10], fill=(30, 30, 30))
+            x += word + line_height // 2
+
+
+def _draw_handwriting(draw: ImageDraw.ImageDraw, rng: random.Random, box: tuple[int, int, int, int], line_height: int) -> None:
+    """Fills a box with wavy pen strokes (handwritten notes)."""
+    x1, y1, x2, y2 = box
+    for y in range(y1, y2 - line_height, line_height):
+        points = [(x, y + rng.randint(0, line_height // 2)) for x in range(x1, x2, max(4, line_height // 3))]
+        draw.line(points, fill=(20, 40, 120), width=max(2, line_height // 12))
+
+
+def _draw_table(draw: ImageDraw.ImageDraw, rng: random.Random, box: tuple[int, int, int, int], line_height: int) -> None:
+    """Draws a grid with short text bars in its cells."""
+    x1, y1, x2, y2 = box
+    rows, columns = rng.randint(3, 8), rng.randint(2, 5)
+    cell_width, cell_height = (x2 - x1) // columns, (y2 - y1) // rows
+    for row in range(rows + 1):
+        draw.line([x1, y1 + row * cell_height, x1 + columns * cell_width, y1 + row * cell_height], fill=(0, 0, 0), width=2)
+    for column in range(columns + 1):
+        draw.line([x1 + column * cell_width, y1, x1 + column * cell_width, y1 + rows * cell_height], fill=(0, 0, 0), width=2)
+    for row in range(rows):
+        for column in range(columns):
+            cx, cy = x1 + column * cell_width + line_height // 2, y1 + row * cell_height + line_height // 2
+            draw.rectangle([cx, cy, cx + rng.randint(cell_width // 4, cell_width * 3 // 4), cy + line_height // 2], fill=(40, 40, 40))
+
+
+def _draw_figure(draw: ImageDraw.ImageDraw, rng: random.Random, box: tuple[int, int, int, int], line_height: int) -> None:
+    """Draws a colored diagram with shapes and a plotted curve."""
+    x1, y1, x2, y2 = box
+    draw.rectangle(box, outline=(0, 0, 0), width=3, fill=(235, 240, 250))
+    for _ in range(rng.randint(2, 6)):
+        sx, sy = rng.randint(x1, x2 - 40), rng.randint(y1, y2 - 40)
+        color = tuple(rng.randint(40, 220) for _ in range(3))
+        draw.ellipse([sx, sy, min(x2, sx + rng.randint(20, 200)), min(y2, sy + rng.randint(20, 200))], fill=color)
+    curve = [(x, y1 + (y2 - y1) // 2 + rng.randint(-(y2 - y1) // 4, (y2 - y1) // 4)) for x in range(x1, x2, 12)]
+    draw.line(curve, fill=(200, 30, 30), width=4)
+
+
+_BLOCKS = [_draw_text_block, _draw_text_block, _draw_handwriting, _draw_table, _draw_figure]
+
+
+def render_page(size_inches: tuple[float, float], dpi: int, rng: random.Random) -> tuple[Image.Image, list[list[int]]]:
+    """Renders one synthetic page; returns the image and the pixel boxes of its content blocks."""
+    width, height = round(size_inches[0] * dpi), round(size_inches[1] * dpi)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    margin, line_height = width // 12, max(8, dpi // 6)
+    boxes = []
+
+    y = margin
+    while y < height - margin * 2:
+        block_height = rng.randint(height // 12, height // 4)
+        y2 = min(y + block_height, height - margin)
+        box = (margin, y, width - margin, y2)
+        rng.choice(_BLOCKS)(draw, rng, box, line_height)
+        boxes.append(list(box))
+        y = y2 + line_height * 2
+
+    return image, boxes
+
+
+def generate_corpus(output_dir: str, documents: int = 6, min_pages: int = 1, max_pages: int = 24, dpi: int = 100,
+                    seed: int = 0) -> list[dict]:
+    """
+    Writes `documents` synthetic image PDFs (text, handwriting, tables and figures on varying page sizes and counts)
+    to output_dir. The same seed always produces the same corpus. Returns one description per document.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    corpus = []
+
+    for index in range(documents):
+        page_size = rng.choice(list(PAGE_SIZES))
+        page_count = rng.randint(min_pages, max_pages)
+        pages = [render_page(PAGE_SIZES[page_size], dpi, rng) for _ in range(page_count)]
+
+        pdf_path = os.path.join(output_dir, f"synthetic_{index:03d}.pdf")
+        images = [image for image, _ in pages]
+        images[0].save(pdf_path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+
+        corpus.append({
+            "pdf": pdf_path,
+            "page_size": page_size,
+            "pages": page_count,
+            "blocks": sum(len(boxes) for _, boxes in pages),
+            "bytes": os.path.getsize(pdf_path),
+        })
+
+    return corpus
+
+
+def _text_slide(rng: random.Random, width: float, height: float) -> list[tuple[float, float, float, str]]:
+    """A slide as (x, y from the top, font size, text) lines in points: a title and one or two columns of bullet points."""
+    words = ["Daten", "Modell", "Analyse", "Schritt", "Ergebnis", "Beispiel", "Methode", "Prozess", "Wert", "System"]
+    lines = [(width * 0.08, height * 0.12, 28.0, " ".join(rng.choice(words) for _ in range(rng.randint(2, 4))))]
+    columns = rng.choice([1, 2])
+    column_width = width * 0.84 / columns
+    for column in range(columns):
+        y = height * 0.25
+        for _ in range(rng.randint(2, 4)):
+            for line in range(rng.randint(1, 3)):
+                text = ("- " if line == 0 else "  ") + " ".join(rng.choice(words) for _ in range(rng.randint(2, 5)))
+                lines.append((width * 0.08 + column * column_width, y, 16.0, text))
+                y += 20
+            y += 22
+    return lines
+
+
+def write_text_pdf(pdf_path: str, pages: int = 8, size_inches: tuple[float, float] = PAGE_SIZES["a4_landscape"],
+                   seed: int = 0) -> str:
+    """Writes a born-digital slide deck with a real text layer (Helvetica text, no images), e.g. for the text layer fast path."""
+    rng = random.Random(seed)
+    width, height = size_inches[0] * 72, size_inches[1] * 72
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for _ in range(pages):
+        content = "".join(f"BT /F1 {size:g} Tf {x:.1f} {height - y:.1f} Td ({text}) Tj ET\n"
+                          for x, y, size, text in _text_slide(rng, width, height))
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}endstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:.1f} {height:.1f}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {pages} >>"
+
+    data, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+
+    os.makedirs(os.path.dirname(pdf_path) or ".", exist_ok=True)
+    with open(pdf_path, "wb") as f:
+        f.write(data)
+    return pdf_path
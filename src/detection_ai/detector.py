@@ -0,0 +1,103 @@
+import os
+from pathlib import Path
+from typing import Iterator
+
+from loguru import logger
+from ultralytics import YOLO
+
+from util.config_reader import ConfigLoader
+from util.detection_io import page_key, write_boxes
+from util.page import Page
+
+
+class YoloLayoutDetector:
+    """
+    Hält ein trainiertes YOLO-Layoutmodell geladen und führt Batch-Inferenz über Seitenbilder aus.
+    Standardmäßig auf der CPU, mit konfigurierbarer Batch-Größe und Thread-Anzahl.
+    """
+
+    def __init__(self, weights: str, device: str = "cpu", batch_size: int = 16, threads: int | None = None,
+                 conf: float = 0.6, imgsz: int = 640) -> None:
+        weights = Path(weights)
+        if not weights.exists():
+            raise FileNotFoundError(f"❌ Modell nicht gefunden: {weights}")
+
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+
+        logger.info(f"🔄 Lade Modell: {weights} ({device}, Batch {batch_size})")
+        self.model = YOLO(str(weights))
+        self.device = device
+        self.batch_size = max(1, batch_size)
+        self.conf = conf
+        self.imgsz = imgsz
+
+    def predict_with_scores(self, image_paths: list[Page | str]) -> Iterator[tuple[str, list[list[int]], list[str], list[float]]]:
+        """
+        Liefert pro Bild (image_path, [[x1, y1, x2, y2], ...], Klassennamen, Scores) in Pixeln des Originalbilds,
+        Batch für Batch. Page-Objekte werden direkt aus dem Speicher übergeben, Pfade lädt Ultralytics selbst.
+        """
+        for start in range(0, len(image_paths), self.batch_size):
+            batch = image_paths[start:start + self.batch_size]
+            results = self.model.predict(
+                source=[page.image if isinstance(page, Page) else page for page in batch],
+                device=self.device,
+                conf=self.conf,
+                imgsz=self.imgsz,
+                batch=len(batch),
+                verbose=False,
+            )
+            for page, result in zip(batch, results):
+                boxes = result.boxes.xyxy.cpu().numpy().round().astype(int).tolist()
+                labels = [result.names[int(cls)] for cls in result.boxes.cls.cpu().numpy()]
+                scores = [round(float(score), 4) for score in result.boxes.conf.cpu().numpy()]
+                yield Page.of(page).image_path, boxes, labels, scores
+
+    def predict(self, image_paths: list[Page | str]) -> Iterator[tuple[str, list[list[int]]]]:
+        """Liefert pro Bild (image_path, [[x1, y1, x2, y2], ...]) in Pixeln des Originalbilds, Batch für Batch."""
+        for image_path, boxes, _, _ in self.predict_with_scores(image_paths):
+            yield image_path, boxes
+
+    def detect_to_json(self, image_paths: list[Page | str], output_dir: str) -> dict:
+        """Führt die Inferenz aus und speichert Boxen, Klassen und Scores pro Dokument als JSON Lines, wie das Gemini-Backend."""
+        os.makedirs(output_dir, exist_ok=True)
+        results = {}
+
+        for image_path, boxes, labels, scores in self.predict_with_scores(image_paths):
+            output_file = write_boxes(image_path, boxes, output_dir, labels, scores)
+            logger.info(f"💾 Ergebnisse gespeichert in: {output_file}")
+            results[page_key(image_path)] = boxes
+
+        return results
+
+
+_detectors: dict[tuple, YoloLayoutDetector] = {}
+
+
+def get_yolo_detector(config_loader: ConfigLoader) -> YoloLayoutDetector:
+    """Gibt den prozessweiten Detektor für die DETECTION-Einstellungen zurück; die Gewichte werden nur einmal geladen."""
+    config = config_loader.view()
+    key = (
+        config.get("DETECTION_YOLO_WEIGHTS", "runs/train/yolo_split_run5/weights/best.pt"),
+        config.get("DETECTION_YOLO_DEVICE", "cpu"),
+        config.get("DETECTION_YOLO_BATCH_SIZE", 16),
+        config.get("DETECTION_YOLO_THREADS", 0) or None,
+        config.get("DETECTION_YOLO_CONF", 0.6),
+        config.get("DETECTION_YOLO_IMGSZ", 640),
+    )
+    if key not in _detectors:
+        _detectors[key] = YoloLayoutDetector(*key)
+    return _detectors[key]
+
+
+def detect_logical_blocks_with_yolo(image_paths: list[Page | str], output_dir: str, config_loader: ConfigLoader, page_limit: int | None = None) -> dict:
+    """
+    Offline-Gegenstück zu detect_logical_blocks_with_gemini mit dem trainierten Layoutmodell.
+    Gibt ein Dictionary der erkannten Bounding Boxes zurück und speichert sie als JSON.
+    """
+    if page_limit:
+        image_paths = image_paths[:page_limit]
+        logger.info(f"🔍 Seitenlimit aktiv – analysiere nur die ersten {page_limit} Bilder.")
+
+    return get_yolo_detector(config_loader).detect_to_json(image_paths, output_dir)
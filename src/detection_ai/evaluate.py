@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+
+def load_yolo_labels(label_path: Path, image_size: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+    """Liest eine YOLO-Labeldatei (cls cx cy w h, normalisiert) und gibt (xyxy-Boxen in Pixeln, Klassen) zurück."""
+    if not label_path.exists():
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    rows = [line.split() for line in label_path.read_text().splitlines() if line.strip()]
+    if not rows:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    data = np.asarray(rows, dtype=np.float32)
+    width, height = image_size
+    cx, cy, w, h = data[:, 1] * width, data[:, 2] * height, data[:, 3] * width, data[:, 4] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return boxes, data[:, 0].astype(np.int64)
+
+
+def load_test_set(test_dir: str) -> list[tuple[str, np.ndarray, np.ndarray]]:
+    """Gibt für ein YOLO-Split-Verzeichnis (images/ + labels/) [(image_path, gt_boxes, gt_classes), ...] zurück."""
+    test_dir = Path(test_dir)
+    samples = []
+    for image_path in sorted(test_dir.glob("images/*")):
+        if image_path.suffix.lower() not in [".jpg", ".png", ".jpeg"]:
+            continue
+        with Image.open(image_path) as image:
+            size = image.size
+        boxes, classes = load_yolo_labels(test_dir / "labels" / f"{image_path.stem}.txt", size)
+        samples.append((str(image_path), boxes, classes))
+    return samples
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Paarweise IoU zweier xyxy-Boxmengen (N x M)."""
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _average_precision(recall: np.ndarray, precision: np.ndarray) -> float:
+    """COCO-artige AP mit 101 Stützstellen."""
+    recall = np.concatenate([[0.0], recall, [1.0]])
+    precision = np.concatenate([[1.0], precision, [0.0]])
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    points = np.linspace(0, 1, 101)
+    return float(np.mean(precision[np.searchsorted(recall, points, side="left").clip(0, len(precision) - 1)]))
+
+
+def mean_average_precision(predictions: dict, ground_truth: dict, iou_thresholds=None) -> dict:
+    """
+    Berechnet mAP50 und mAP50-95.
+    predictions: {image: (boxes, scores, classes)}, ground_truth: {image: (boxes, classes)}.
+    """
+    if iou_thresholds is None:
+        iou_thresholds = np.linspace(0.5, 0.95, 10)
+
+    classes = sorted({int(c) for _, gt_classes in ground_truth.values() for c in gt_classes})
+    ap = np.zeros((len(classes), len(iou_thresholds)))
+
+    for class_index, cls in enumerate(classes):
+        for threshold_index, threshold in enumerate(iou_thresholds):
+            detections = []
+            n_ground_truth = 0
+            for image, (gt_boxes, gt_classes) in ground_truth.items():
+                gt = gt_boxes[gt_classes == cls]
+                n_ground_truth += len(gt)
+                boxes, scores, pred_classes = predictions.get(image, (np.zeros((0, 4)), np.zeros(0), np.zeros(0)))
+                mask = pred_classes == cls
+                boxes, scores = boxes[mask], scores[mask]
+                matched = np.zeros(len(gt), dtype=bool)
+                ious = box_iou(boxes, gt) if len(gt) and len(boxes) else np.zeros((len(boxes), len(gt)))
+                for i in scores.argsort()[::-1]:
+                    hit = False
+                    if len(gt):
+                        candidates = np.where(~matched & (ious[i] >= threshold))[0]
+                        if len(candidates):
+                            matched[candidates[ious[i, candidates].argmax()]] = True
+                            hit = True
+                    detections.append((scores[i], hit))
+
+            if not n_ground_truth:
+                continue
+            detections.sort(key=lambda d: -d[0])
+            hits = np.asarray([hit for _, hit in detections], dtype=np.float64)
+            true_positives = np.cumsum(hits)
+            false_positives = np.cumsum(1 - hits)
+            recall = true_positives / n_ground_truth
+            precision = true_positives / np.maximum(true_positives + false_positives, 1e-9)
+            ap[class_index, threshold_index] = _average_precision(recall, precision) if len(hits) else 0.0
+
+    return {
+        "mAP50": float(ap[:, 0].mean()) if len(classes) else 0.0,
+        "mAP50-95": float(ap.mean()) if len(classes) else 0.0,
+    }
@@ -0,0 +1,140 @@
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from ultralytics import YOLO
+
+from detection_ai.evaluate import load_test_set, mean_average_precision
+from detection_ai.onnx_runner import OnnxLayoutDetector
+
+
+def export_onnx(weights: str, imgsz: int = 640, quantize: str | None = "int8", dynamic: bool = True) -> dict[str, str]:
+    """
+    Exportiert trainierte .pt-Gewichte nach ONNX und erzeugt optional eine quantisierte Variante.
+    quantize: None, "int8" (dynamische Gewichtsquantisierung mit ONNX Runtime) oder "fp16".
+    Gibt die Pfade der erzeugten Modelle zurück, z. B. {"fp32": ".../best.onnx", "int8": ".../best.int8.onnx"}.
+    """
+    weights = Path(weights)
+    if not weights.exists():
+        raise FileNotFoundError(f"❌ Modell nicht gefunden: {weights}")
+
+    print(f"📤 Exportiere {weights} nach ONNX ...")
+    onnx_path = Path(YOLO(str(weights)).export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True))
+    paths = {"fp32": str(onnx_path)}
+
+    if quantize == "int8":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = onnx_path.with_name(f"{onnx_path.stem}.int8.onnx")
+        quantize_dynamic(str(onnx_path), str(int8_path), weight_type=QuantType.QUInt8)
+        paths["int8"] = str(int8_path)
+    elif quantize == "fp16":
+        try:
+            import onnx
+            from onnxconverter_common import float16
+        except ImportError:
+            raise RuntimeError("❌ Für FP16 bitte zuerst installieren: pip install onnx onnxconverter-common")
+
+        fp16_path = onnx_path.with_name(f"{onnx_path.stem}.fp16.onnx")
+        onnx.save(float16.convert_float_to_float16(onnx.load(str(onnx_path)), keep_io_types=True), str(fp16_path))
+        paths["fp16"] = str(fp16_path)
+    elif quantize is not None:
+        raise ValueError(f"❌ Unbekannte Quantisierung: {quantize}")
+
+    for variant, path in paths.items():
+        print(f"✅ {variant}: {path} ({Path(path).stat().st_size / 1e6:.1f} MB)")
+    return paths
+
+
+def _summarize(latencies: list[float], load_seconds: float, metrics: dict) -> dict:
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "latency_ms_mean": round(float(latencies_ms.mean()), 2),
+        "latency_ms_p50": round(float(np.percentile(latencies_ms, 50)), 2),
+        "latency_ms_p95": round(float(np.percentile(latencies_ms, 95)), 2),
+        "images_per_second": round(1000 / float(latencies_ms.mean()), 2),
+        **{name: round(value, 4) for name, value in metrics.items()},
+    }
+
+
+def compare_with_pytorch(
+    pt_weights: str,
+    onnx_models: dict[str, str],
+    test_dir: str = "data/ai/yolo_split/test",
+    imgsz: int = 640,
+    conf: float = 0.001,
+    iou: float = 0.7,
+    warmup: int = 2,
+    report_path: str | None = None,
+) -> dict:
+    """
+    Vergleicht das .pt-Modell (Ultralytics, CPU) mit den ONNX-Varianten auf dem Test-Split:
+    Ladezeit, Latenz pro Bild, Durchsatz, mAP50/mAP50-95 und die mAP-Abweichung zum .pt-Modell.
+    """
+    samples = load_test_set(test_dir)
+    if not samples:
+        raise RuntimeError(f"❌ Keine Testbilder gefunden in {test_dir}")
+    ground_truth = {image: (boxes, classes) for image, boxes, classes in samples}
+    image_paths = [image for image, _, _ in samples]
+    print(f"🖼️  {len(image_paths)} Testbilder")
+
+    report = {}
+
+    # Referenz: PyTorch / Ultralytics
+    started = time.perf_counter()
+    model = YOLO(pt_weights)
+    load_seconds = time.perf_counter() - started
+    for image_path in image_paths[:warmup]:
+        model.predict(source=image_path, device="cpu", conf=conf, iou=iou, imgsz=imgsz, verbose=False)
+
+    predictions, latencies = {}, []
+    for image_path in image_paths:
+        started = time.perf_counter()
+        result = model.predict(source=image_path, device="cpu", conf=conf, iou=iou, imgsz=imgsz, verbose=False)[0]
+        latencies.append(time.perf_counter() - started)
+        predictions[image_path] = (
+            result.boxes.xyxy.cpu().numpy(),
+            result.boxes.conf.cpu().numpy(),
+            result.boxes.cls.cpu().numpy().astype(np.int64),
+        )
+    report["pt"] = _summarize(latencies, load_seconds, mean_average_precision(predictions, ground_truth))
+
+    # ONNX-Varianten
+    for variant, onnx_path in onnx_models.items():
+        started = time.perf_counter()
+        detector = OnnxLayoutDetector(onnx_path, conf=conf, iou=iou, imgsz=imgsz, batch_size=1)
+        load_seconds = time.perf_counter() - started
+        for image_path in image_paths[:warmup]:
+            list(detector.predict_arrays([image_path]))
+
+        predictions, latencies = {}, []
+        for image_path in image_paths:
+            started = time.perf_counter()
+            _, boxes, scores, classes = next(detector.predict_arrays([image_path]))
+            latencies.append(time.perf_counter() - started)
+            predictions[image_path] = (boxes, scores, classes)
+
+        summary = _summarize(latencies, load_seconds, mean_average_precision(predictions, ground_truth))
+        summary["mAP50_drift"] = round(summary["mAP50"] - report["pt"]["mAP50"], 4)
+        summary["mAP50-95_drift"] = round(summary["mAP50-95"] - report["pt"]["mAP50-95"], 4)
+        summary["speedup"] = round(report["pt"]["latency_ms_mean"] / summary["latency_ms_mean"], 2)
+        report[variant] = summary
+
+    for variant, summary in report.items():
+        print(f"📊 {variant}: {summary}")
+
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Vergleich gespeichert unter: {report_path}")
+
+    return report
+
+
+if __name__ == "__main__":
+    # Beispiel-Aufruf:
+    weights = "runs/train/yolo_split_run5/weights/best.pt"
+    onnx_models = export_onnx(weights, imgsz=640, quantize="int8")
+    compare_with_pytorch(weights, onnx_models, test_dir="data/ai/yolo_split/test", report_path="runs/train/yolo_split_run5/onnx_comparison.json")
@@ -0,0 +1,160 @@
+import ast
+import os
+from typing import Iterator
+
+import numpy as np
+import onnxruntime as ort
+from loguru import logger
+
+from util.config_reader import ConfigLoader
+from util.detection_io import page_key, write_boxes
+from util.page import Page
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy non-maximum suppression on xyxy boxes; returns the kept indices, best first."""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[best] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def decode_predictions(output: np.ndarray, conf: float, iou: float, ratio: float, pad: tuple[int, int],
+                       image_size: tuple[int, int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Dekodiert eine YOLOv8/11-Ausgabe (4 + nc, N) mit cx, cy, w, h in Eingabepixeln.
+    Gibt (xyxy-Boxen im Originalbild, Scores, Klassen) nach klassenweiser NMS zurück.
+    """
+    predictions = output.T
+    class_scores = predictions[:, 4:]
+    classes = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(classes)), classes]
+    mask = scores >= conf
+    predictions, scores, classes = predictions[mask], scores[mask], classes[mask]
+
+    if not len(scores):
+        return np.zeros((0, 4), dtype=np.float32), scores, classes
+
+    cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    # Klassenweise NMS über Versatz der Boxen je Klasse
+    offsets = classes[:, None].astype(np.float32) * 10_000
+    keep = nms(boxes + offsets, scores, iou)
+    boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+
+    # Letterbox rückgängig machen
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / ratio
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / ratio
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, image_size[0])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, image_size[1])
+    return boxes, scores, classes
+
+
+class OnnxLayoutDetector:
+    """
+    Leichtgewichtige Inferenz des exportierten Layoutmodells mit ONNX Runtime – ohne torch/ultralytics.
+    Übernimmt Letterboxing, Dekodierung und NMS selbst.
+    """
+
+    def __init__(self, model_path: str, conf: float = 0.6, iou: float = 0.7, imgsz: int = 640,
+                 threads: int | None = None, batch_size: int = 1) -> None:
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"❌ Modell nicht gefunden: {model_path}")
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        logger.info(f"🔄 Lade ONNX-Modell: {model_path}")
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_type = np.float16 if "float16" in self.session.get_inputs()[0].type else np.float32
+        # Ultralytics legt die Klassennamen als Metadaten ab, z. B. "{0: 'logic-component', 1: 'logic-block'}"
+        names = self.session.get_modelmeta().custom_metadata_map.get("names", "{}")
+        try:
+            self.class_names = {int(k): str(v) for k, v in ast.literal_eval(names).items()}
+        except (ValueError, SyntaxError, AttributeError):
+            self.class_names = {}
+        # Statisch exportierte Modelle erlauben nur Batch 1
+        static_batch = self.session.get_inputs()[0].shape[0]
+        self.batch_size = static_batch if isinstance(static_batch, int) else max(1, batch_size)
+        self.conf = conf
+        self.iou = iou
+        self.imgsz = imgsz
+
+    def predict_arrays(self, image_paths: list[Page | str]) -> Iterator[tuple[str, np.ndarray, np.ndarray, np.ndarray]]:
+        """Liefert pro Bild (image_path, xyxy-Boxen, Scores, Klassen), Batch für Batch. Akzeptiert Pfade oder Page-Objekte."""
+        for start in range(0, len(image_paths), self.batch_size):
+            batch = [Page.of(page) for page in image_paths[start:start + self.batch_size]]
+            inputs, metas = [], []
+            for page in batch:
+                array, ratio, pad = page.for_yolo(self.imgsz)
+                metas.append((ratio, pad, page.size))
+                inputs.append(array)
+
+            outputs = self.session.run(None, {self.input_name: np.stack(inputs).astype(self.input_type)})[0]
+            for page, output, (ratio, pad, size) in zip(batch, outputs, metas):
+                boxes, scores, classes = decode_predictions(output.astype(np.float32), self.conf, self.iou, ratio, pad, size)
+                yield page.image_path, boxes, scores, classes
+
+    def predict(self, image_paths: list[Page | str]) -> Iterator[tuple[str, list[list[int]]]]:
+        """Liefert pro Bild (image_path, [[x1, y1, x2, y2], ...]) in Pixeln des Originalbilds."""
+        for image_path, boxes, _, _ in self.predict_arrays(image_paths):
+            yield image_path, boxes.round().astype(int).tolist()
+
+    def detect_to_json(self, image_paths: list[Page | str], output_dir: str) -> dict:
+        """Führt die Inferenz aus und speichert Boxen, Klassen und Scores pro Dokument als JSON Lines, wie das Gemini-Backend."""
+        os.makedirs(output_dir, exist_ok=True)
+        results = {}
+
+        for image_path, boxes, scores, classes in self.predict_arrays(image_paths):
+            boxes = boxes.round().astype(int).tolist()
+            labels = [self.class_names.get(int(cls), str(int(cls))) for cls in classes]
+            output_file = write_boxes(image_path, boxes, output_dir, labels, [round(float(score), 4) for score in scores])
+            logger.info(f"💾 Ergebnisse gespeichert in: {output_file}")
+            results[page_key(image_path)] = boxes
+
+        return results
+
+
+_detectors: dict[tuple, OnnxLayoutDetector] = {}
+
+
+def get_onnx_detector(config_loader: ConfigLoader) -> OnnxLayoutDetector:
+    """Gibt den prozessweiten ONNX-Detektor für die DETECTION-Einstellungen zurück; das Modell wird nur einmal geladen."""
+    config = config_loader.view()
+    key = (
+        config.get("DETECTION_ONNX_MODEL", "runs/train/yolo_split_run5/weights/best.int8.onnx"),
+        config.get("DETECTION_YOLO_CONF", 0.6),
+        config.get("DETECTION_ONNX_IOU", 0.7),
+        config.get("DETECTION_YOLO_IMGSZ", 640),
+        config.get("DETECTION_YOLO_THREADS", 0) or None,
+        config.get("DETECTION_YOLO_BATCH_SIZE", 16),
+    )
+    if key not in _detectors:
+        _detectors[key] = OnnxLayoutDetector(*key)
+    return _detectors[key]
+
+
+def detect_logical_blocks_with_onnx(image_paths: list[Page | str], output_dir: str, config_loader: ConfigLoader, page_limit: int | None = None) -> dict:
+    """
+    Wie detect_logical_blocks_with_yolo, aber mit dem exportierten (ggf. quantisierten) ONNX-Modell.
+    Gibt ein Dictionary der erkannten Bounding Boxes zurück und speichert sie als JSON.
+    """
+    if page_limit:
+        image_paths = image_paths[:page_limit]
+        logger.info(f"🔍 Seitenlimit aktiv – analysiere nur die ersten {page_limit} Bilder.")
+
+    return get_onnx_detector(config_loader).detect_to_json(image_paths, output_dir)
@@ -1,13 +1,50 @@
+import hashlib
+import json
 import os
 import zipfile
 import random
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def adjust_label_classes(label_path: Path, out_path: Path):
+from PIL import Image
+
+from util.page import letterbox_image
+
+# Label-Studio-Klassen -> Trainingsklassen; nicht aufgeführte IDs bleiben gleich
+DEFAULT_CLASS_MAP = {1: 0, 3: 0, 2: 1}
+
+IMAGE_SUFFIXES = (".jpg", ".png", ".jpeg")
+MANIFEST_NAME = ".manifest.json"
+# Nach so vielen fertigen Dateien wird das Manifest zwischengespeichert (Abbruch-sicher)
+MANIFEST_FLUSH_EVERY = 500
+SPLITS = ("train", "val", "test")
+TRAINING_CACHE_INFO = ".training_cache.json"
+
+FICLONE = 0x40049409  # Linux ioctl für Reflinks (btrfs, XFS, ...)
+
+
+def remap_label_text(text: str, class_map: dict[int, int] | None = None) -> str:
+    """
+    Ersetzt die Klassen-IDs einer YOLO-Labeldatei nach class_map (Standard: DEFAULT_CLASS_MAP).
+    Leere Zeilen fallen weg, die Koordinaten bleiben unverändert.
+    """
+    class_map = DEFAULT_CLASS_MAP if class_map is None else class_map
+    new_lines = []
+    for line in text.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        cls = int(parts[0])
+        new_lines.append(" ".join([str(class_map.get(cls, cls))] + parts[1:]))
+    return "\n".join(new_lines)
+
+
+def adjust_label_classes(label_path: Path, out_path: Path, class_map: dict[int, int] | None = None):
     """
     Liest eine YOLO-Labeldatei und schreibt sie neu mit angepassten Klassen-IDs.
-    Mapping:
+    Mapping aus class_map, Standard DEFAULT_CLASS_MAP:
       1, 3 -> 0
       2    -> 1
       andere bleiben gleich
@@ -15,24 +52,241 @@ def adjust_label_classes(label_path: Path, out_path: Path):
     if not label_path.exists():
         return
 
-    new_lines = []
     with open(label_path, "r") as f:
-        for line in f:
-            parts = line.strip().split()
-            if not parts:
-                continue
-            cls = int(parts[0])
-            # Mapping anwenden
-            if cls in [1, 3]:
-                cls = 0
-            elif cls == 2:
-                cls = 1
-            # Rest unverändert
-            new_line = " ".join([str(cls)] + parts[1:])
-            new_lines.append(new_line)
+        text = f.read()
+
+    _write_atomic(out_path, remap_label_text(text, class_map).encode())
+
+
+def _write_atomic(out_path: Path, data: bytes) -> None:
+    tmp_path = out_path.with_name(f".{out_path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+
+
+def link_or_copy(src: Path, dst: Path) -> str:
+    """
+    Legt dst ohne zweite Kopie der Daten an: Reflink (copy-on-write), sonst Hardlink, sonst normale Kopie.
+    Gibt die verwendete Methode zurück ("reflink", "hardlink" oder "copy").
+    """
+    if dst.exists():
+        dst.unlink()
+
+    try:
+        import fcntl
+
+        with open(src, "rb") as source, open(dst, "wb") as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        if dst.exists():
+            dst.unlink()
+
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        shutil.copy2(src, dst)
+        return "copy"
+
+
+def _assign_splits(image_names: list[str], train_ratio: float, val_ratio: float, seed: int) -> dict[str, list[str]]:
+    """Mischt die Bildnamen mit seed und teilt sie auf – gleiche Eingabe und gleicher Seed ergeben gleiche Splits."""
+    image_names = sorted(image_names)
+    random.Random(seed).shuffle(image_names)
+
+    n_total = len(image_names)
+    n_train = int(n_total * train_ratio)
+    n_val = int(n_total * val_ratio)
+
+    return {
+        "train": image_names[:n_train],
+        "val": image_names[n_train:n_train + n_val],
+        "test": image_names[n_train + n_val:],
+    }
+
+
+def _find_yolo_root_in_zip(names: list[str]) -> str | None:
+    """Findet das Präfix im ZIP, unter dem images/ und labels/ liegen (z. B. "" oder "export/")."""
+    image_roots = {name.rsplit("images/", 1)[0] for name in names if "images/" in name}
+    for root in sorted(image_roots, key=len):
+        if root and not root.endswith("/"):
+            continue
+        if any(name.startswith(f"{root}labels/") for name in names):
+            return root
+    return None
+
+
+def _find_yolo_dirs(extract_dir: Path) -> tuple[Path, Path] | tuple[None, None]:
+    for root, dirs, files in os.walk(extract_dir):
+        if "images" in dirs and "labels" in dirs:
+            return Path(root) / "images", Path(root) / "labels"
+    return None, None
+
+
+def _class_map_digest(class_map: dict[int, int]) -> str:
+    return hashlib.sha256(json.dumps(sorted(class_map.items())).encode()).hexdigest()[:16]
+
 
-    with open(out_path, "w") as f:
-        f.write("\n".join(new_lines))
+class _Manifest:
+    """
+    Merkt sich pro Zieldatei den Fingerabdruck ihrer Quelle (CRC/Größe im ZIP bzw. Größe/mtime entpackter Dateien).
+    Unveränderte Dateien werden beim nächsten Lauf übersprungen, nicht mehr zugeordnete Dateien entfernt.
+    """
+
+    def __init__(self, output_dir: Path) -> None:
+        self.path = output_dir / MANIFEST_NAME
+        self.output_dir = output_dir
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.previous = json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            self.previous = {}
+        self.entries: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def is_current(self, dest: str, fingerprint: str) -> bool:
+        return self.previous.get(dest) == fingerprint and (self.output_dir / dest).exists()
+
+    def record(self, dest: str, fingerprint: str) -> None:
+        with self._lock:
+            self.entries[dest] = fingerprint
+            self._pending += 1
+            if self._pending >= MANIFEST_FLUSH_EVERY:
+                self._save({**self.previous, **self.entries})
+                self._pending = 0
+
+    def remove_stale(self) -> int:
+        """Löscht Zieldateien des letzten Laufs, die jetzt nicht mehr (oder in einem anderen Split) vorkommen."""
+        stale = [dest for dest in self.previous if dest not in self.entries]
+        for dest in stale:
+            (self.output_dir / dest).unlink(missing_ok=True)
+        return len(stale)
+
+    def save(self) -> None:
+        with self._lock:
+            self._save(self.entries)
+
+    def _save(self, entries: dict[str, str]) -> None:
+        _write_atomic(self.path, json.dumps({"entries": entries}, indent=0, sort_keys=True).encode())
+
+
+def _split_jobs(label_names: set[str], splits: dict[str, list[str]]):
+    """Erzeugt (Split, Bildname, Labelname oder None) für alle Bilder."""
+    for split, names in splits.items():
+        for image_name in names:
+            label_name = f"{Path(image_name).stem}.txt"
+            yield split, image_name, label_name if label_name in label_names else None
+
+
+def _stream_from_zip(zip_path: str, output_dir: Path, splits: dict[str, list[str]], label_names: set[str], root: str,
+                     class_map: dict[int, int], manifest: _Manifest, workers: int) -> dict[str, int]:
+    """Schreibt Bilder und umgemappte Labels direkt aus dem ZIP in die Split-Ordner, ohne Zwischenentpacken."""
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+    map_digest = _class_map_digest(class_map)
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        infos = {info.filename: info for info in zip_ref.infolist()}
+
+    def zip_file() -> zipfile.ZipFile:
+        # Eigenes Handle pro Thread, damit Lesen und Entpacken parallel laufen
+        if not hasattr(local, "zip_ref"):
+            local.zip_ref = zipfile.ZipFile(zip_path, "r")
+            with handles_lock:
+                handles.append(local.zip_ref)
+        return local.zip_ref
+
+    def process(job) -> dict[str, int]:
+        split, image_name, label_name = job
+        stats = {"written": 0, "skipped": 0, "missing_labels": 0}
+
+        image_info = infos[f"{root}images/{image_name}"]
+        dest = f"{split}/images/{image_name}"
+        fingerprint = f"{image_info.CRC:08x}:{image_info.file_size}"
+        if manifest.is_current(dest, fingerprint):
+            stats["skipped"] += 1
+        else:
+            tmp_path = output_dir / split / "images" / f".{image_name}.tmp"
+            with zip_file().open(image_info) as source, open(tmp_path, "wb") as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            os.replace(tmp_path, output_dir / dest)
+            stats["written"] += 1
+        manifest.record(dest, fingerprint)
+
+        if label_name is None:
+            print(f"⚠️ Kein Label für {image_name}")
+            stats["missing_labels"] += 1
+            return stats
+
+        label_info = infos[f"{root}labels/{label_name}"]
+        dest = f"{split}/labels/{label_name}"
+        fingerprint = f"{label_info.CRC:08x}:{label_info.file_size}:{map_digest}"
+        if manifest.is_current(dest, fingerprint):
+            stats["skipped"] += 1
+        else:
+            text = zip_file().read(label_info).decode("utf-8")
+            _write_atomic(output_dir / dest, remap_label_text(text, class_map).encode())
+            stats["written"] += 1
+        manifest.record(dest, fingerprint)
+        return stats
+
+    try:
+        return _run_jobs(process, _split_jobs(label_names, splits), workers)
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def _link_from_extracted(images_dir: Path, labels_dir: Path, output_dir: Path, splits: dict[str, list[str]],
+                         label_names: set[str], class_map: dict[int, int], manifest: _Manifest, workers: int) -> dict[str, int]:
+    """Verlinkt bereits entpackte Bilder per Reflink/Hardlink in die Split-Ordner und schreibt die Labels neu."""
+    map_digest = _class_map_digest(class_map)
+
+    def fingerprint_of(path: Path) -> str:
+        stat = path.stat()
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def process(job) -> dict[str, int]:
+        split, image_name, label_name = job
+        stats = {"written": 0, "skipped": 0, "missing_labels": 0}
+
+        dest = f"{split}/images/{image_name}"
+        fingerprint = fingerprint_of(images_dir / image_name)
+        if manifest.is_current(dest, fingerprint):
+            stats["skipped"] += 1
+        else:
+            link_or_copy(images_dir / image_name, output_dir / dest)
+            stats["written"] += 1
+        manifest.record(dest, fingerprint)
+
+        if label_name is None:
+            print(f"⚠️ Kein Label für {image_name}")
+            stats["missing_labels"] += 1
+            return stats
+
+        dest = f"{split}/labels/{label_name}"
+        fingerprint = f"{fingerprint_of(labels_dir / label_name)}:{map_digest}"
+        if manifest.is_current(dest, fingerprint):
+            stats["skipped"] += 1
+        else:
+            adjust_label_classes(labels_dir / label_name, output_dir / dest, class_map)
+            stats["written"] += 1
+        manifest.record(dest, fingerprint)
+        return stats
+
+    return _run_jobs(process, _split_jobs(label_names, splits), workers)
+
+
+def _run_jobs(process, jobs, workers: int) -> dict[str, int]:
+    totals = {"written": 0, "skipped": 0, "missing_labels": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for stats in executor.map(process, jobs):
+            for key, value in stats.items():
+                totals[key] += value
+    return totals
 
 
 def split_yolo_dataset(
@@ -42,86 +296,200 @@ def split_yolo_dataset(
     val_ratio: float = 0.2,
     test_ratio: float = 0.1,
     seed: int = 42,
+    class_map: dict[int, int] | None = None,
+    stream: bool = True,
+    workers: int | None = None,
 ):
     """
-    Entpackt ein YOLO-Dataset (.zip), teilt es in train/val/test auf
-    und passt Label-Klassen nach definiertem Mapping an.
+    Teilt ein YOLO-Dataset (.zip) in train/val/test auf und passt Label-Klassen nach class_map an
+    (Standard: DEFAULT_CLASS_MAP).
     Erwartet: images/ + labels/ Struktur im ZIP.
+
+    stream=True liest die Dateien mit `workers` Threads direkt aus dem ZIP in die Split-Ordner.
+    stream=False entpackt nach output_dir/extracted (falls noch nicht geschehen) und verlinkt die Bilder
+    per Reflink/Hardlink statt sie zu kopieren.
+    Ein Manifest in output_dir sorgt dafür, dass ein erneuter Lauf mit gleichem Seed nur geänderte Dateien schreibt.
     """
 
     assert abs(train_ratio + val_ratio + test_ratio - 1.0) < 1e-6, "Summe der Splits muss 1 sein!"
 
-    random.seed(seed)
+    class_map = DEFAULT_CLASS_MAP if class_map is None else class_map
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    output_dir = Path(output_dir)
+    extract_dir = output_dir / "extracted"
 
     # -------------------------
-    # 1️⃣ ZIP entpacken
+    # 1️⃣ YOLO-Struktur finden
     # -------------------------
-    extract_dir = Path(output_dir) / "extracted"
-    extract_dir.mkdir(parents=True, exist_ok=True)
+    if stream:
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            names = zip_ref.namelist()
+        root = _find_yolo_root_in_zip(names)
+        if root is None:
+            raise RuntimeError("❌ Konnte keine 'images' und 'labels' Verzeichnisse im ZIP finden!")
+        image_names = [name[len(f"{root}images/"):] for name in names if name.startswith(f"{root}images/")]
+        label_names = {name[len(f"{root}labels/"):] for name in names if name.startswith(f"{root}labels/")}
+    else:
+        images_dir, labels_dir = _find_yolo_dirs(extract_dir)
+        if images_dir is None:
+            print(f"📦 Entpacke {zip_path} ...")
+            extract_dir.mkdir(parents=True, exist_ok=True)
+            with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                zip_ref.extractall(extract_dir)
+            print("✅ Entpackt!")
+            images_dir, labels_dir = _find_yolo_dirs(extract_dir)
+        else:
+            print(f"♻️  Verwende bereits entpackte Dateien in {extract_dir}")
 
-    print(f"📦 Entpacke {zip_path} ...")
-    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(extract_dir)
-    print("✅ Entpackt!")
-
-    # YOLO-Struktur finden
-    images_dir = None
-    labels_dir = None
-    for root, dirs, files in os.walk(extract_dir):
-        if "images" in dirs and "labels" in dirs:
-            images_dir = Path(root) / "images"
-            labels_dir = Path(root) / "labels"
-            break
-
-    if images_dir is None or labels_dir is None:
-        raise RuntimeError("❌ Konnte keine 'images' und 'labels' Verzeichnisse im ZIP finden!")
+        if images_dir is None or labels_dir is None:
+            raise RuntimeError("❌ Konnte keine 'images' und 'labels' Verzeichnisse im ZIP finden!")
+        image_names = [f.name for f in images_dir.glob("*")]
+        label_names = {f.name for f in labels_dir.glob("*.txt")}
 
     # -------------------------
-    # 2️⃣ Dateien listen
+    # 2️⃣ Dateien listen + aufteilen
     # -------------------------
-    image_files = sorted([f for f in images_dir.glob("*") if f.suffix.lower() in [".jpg", ".png", ".jpeg"]])
-    print(f"🖼️  {len(image_files)} Bilder gefunden")
-
-    # Shuffle
-    random.shuffle(image_files)
-
-    n_total = len(image_files)
-    n_train = int(n_total * train_ratio)
-    n_val = int(n_total * val_ratio)
-
-    splits = {
-        "train": image_files[:n_train],
-        "val": image_files[n_train:n_train + n_val],
-        "test": image_files[n_train + n_val:],
-    }
+    image_names = [name for name in image_names if "/" not in name and Path(name).suffix.lower() in IMAGE_SUFFIXES]
+    print(f"🖼️  {len(image_names)} Bilder gefunden")
+    splits = _assign_splits(image_names, train_ratio, val_ratio, seed)
 
     # -------------------------
     # 3️⃣ Split-Ordner erstellen
     # -------------------------
-    for split in splits:
-        (Path(output_dir) / split / "images").mkdir(parents=True, exist_ok=True)
-        (Path(output_dir) / split / "labels").mkdir(parents=True, exist_ok=True)
+    for split, files in splits.items():
+        (output_dir / split / "images").mkdir(parents=True, exist_ok=True)
+        (output_dir / split / "labels").mkdir(parents=True, exist_ok=True)
+        print(f"✂️  Split '{split}': {len(files)} Dateien")
 
     # -------------------------
-    # 4️⃣ Dateien kopieren + Label anpassen
+    # 4️⃣ Dateien schreiben + Label anpassen
     # -------------------------
-    for split, files in splits.items():
-        print(f"✂️  Erstelle Split '{split}' ({len(files)} Dateien)")
-        for img_path in files:
-            label_path = labels_dir / f"{img_path.stem}.txt"
+    manifest = _Manifest(output_dir)
+    if stream:
+        totals = _stream_from_zip(zip_path, output_dir, splits, label_names, root, class_map, manifest, workers)
+    else:
+        totals = _link_from_extracted(images_dir, labels_dir, output_dir, splits, label_names, class_map, manifest, workers)
+    removed = manifest.remove_stale()
+    manifest.save()
+
+    print(f"📊 {totals['written']} Dateien geschrieben, {totals['skipped']} unverändert übersprungen, "
+          f"{removed} veraltete entfernt, {totals['missing_labels']} ohne Label")
+    print("✅ Fertig! Aufteilung gespeichert in:", output_dir.resolve())
+
+
+def letterbox_label_text(text: str, scaled_size: tuple[int, int], pad: tuple[int, int], imgsz: int) -> str:
+    """
+    Rechnet normierte YOLO-Labels (Boxen "cls cx cy w h" oder Polygone "cls x1 y1 x2 y2 ...") vom Originalbild
+    auf das letterboxte imgsz x imgsz Bild um, in dem das Original scaled_size Pixel groß bei pad liegt.
+    """
+    width, height = scaled_size
+    pad_x, pad_y = pad
+    new_lines = []
+    for line in text.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        coords = [float(value) for value in parts[1:]]
+        if len(coords) == 4:
+            cx, cy, w, h = coords
+            coords = [(cx * width + pad_x) / imgsz, (cy * height + pad_y) / imgsz, w * width / imgsz, h * height / imgsz]
+        else:
+            coords = [(value * width + pad_x) / imgsz if i % 2 == 0 else (value * height + pad_y) / imgsz
+                      for i, value in enumerate(coords)]
+        new_lines.append(" ".join([parts[0]] + [f"{value:.6f}" for value in coords]))
+    return "\n".join(new_lines)
+
+
+def _cache_training_image(image_path: Path, label_path: Path, out_image: Path, out_label: Path, imgsz: int,
+                          npy: bool) -> None:
+    with Image.open(image_path) as image:
+        # draft() lässt JPEGs schon beim Dekodieren verkleinern
+        image.draft("RGB", (imgsz, imgsz))
+        canvas, ratio, pad = letterbox_image(image, imgsz)
+        scaled_size = (round(image.size[0] * ratio), round(image.size[1] * ratio))
+
+    canvas.save(out_image, compress_level=1)
+    if npy:
+        import numpy as np
+
+        # Ultralytics lädt <bild>.npy (BGR, HWC) statt das Bild zu dekodieren
+        np.save(out_image.with_suffix(".npy"), np.ascontiguousarray(np.asarray(canvas)[:, :, ::-1]))
+
+    if label_path.exists():
+        text = label_path.read_text()
+        _write_atomic(out_label, letterbox_label_text(text, scaled_size, pad, imgsz).encode())
+
+
+def build_training_cache(
+    dataset_dir: str,
+    cache_dir: str | None = None,
+    imgsz: int = 640,
+    npy: bool = True,
+    workers: int | None = None,
+) -> str:
+    """
+    Schreibt letterboxte imgsz x imgsz Kopien aller Split-Bilder (train/val/test) als schnelle PNGs
+    samt umgerechneter YOLO-Labels nach cache_dir (Standard: <dataset_dir>_<imgsz>).
+    npy=True legt zusätzlich dekodierte Arrays daneben, die der Ultralytics-Dataloader per np.load liest,
+    statt große PNGs in jeder Epoche zu dekodieren und zu verkleinern.
+    Bereits aktuelle Dateien (gleiche Größe, neuer als die Quelle) werden übersprungen.
+    Gibt cache_dir zurück.
+    """
+    dataset_dir = Path(dataset_dir)
+    cache_dir = Path(cache_dir) if cache_dir else dataset_dir.with_name(f"{dataset_dir.name}_{imgsz}")
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+
+    info_path = cache_dir / TRAINING_CACHE_INFO
+    try:
+        with open(info_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+    settings = {"imgsz": imgsz, "npy": npy}
+    rebuild = previous != settings
+
+    jobs = []
+    expected = set()
+    for split in SPLITS:
+        images_dir = dataset_dir / split / "images"
+        if not images_dir.exists():
+            continue
+        (cache_dir / split / "images").mkdir(parents=True, exist_ok=True)
+        (cache_dir / split / "labels").mkdir(parents=True, exist_ok=True)
+
+        for image_path in sorted(images_dir.iterdir()):
+            if image_path.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            label_path = dataset_dir / split / "labels" / f"{image_path.stem}.txt"
+            out_image = cache_dir / split / "images" / f"{image_path.stem}.png"
+            out_label = cache_dir / split / "labels" / f"{image_path.stem}.txt"
+            expected.add((split, out_image.name))
+
+            newest_source = max(image_path.stat().st_mtime_ns,
+                                label_path.stat().st_mtime_ns if label_path.exists() else 0)
+            if not rebuild and out_image.exists() and out_image.stat().st_mtime_ns >= newest_source:
+                continue
+            jobs.append((image_path, label_path, out_image, out_label, imgsz, npy))
 
-            # Zielpfade
-            out_img = Path(output_dir) / split / "images" / img_path.name
-            out_lbl = Path(output_dir) / split / "labels" / label_path.name
+    print(f"🗜️  Trainings-Cache ({imgsz}px): {len(jobs)} Bilder neu, {len(expected) - len(jobs)} aktuell")
 
-            shutil.copy(img_path, out_img)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(lambda job: _cache_training_image(*job), jobs):
+            pass
 
-            if label_path.exists():
-                adjust_label_classes(label_path, out_lbl)
-            else:
-                print(f"⚠️ Kein Label für {img_path.name}")
+    # Bilder, die nicht mehr im Dataset sind, auch aus dem Cache entfernen
+    for split in SPLITS:
+        for path in (cache_dir / split / "images").glob("*"):
+            if (split, path.with_suffix(".png").name) not in expected:
+                path.unlink()
+                (cache_dir / split / "labels" / f"{path.stem}.txt").unlink(missing_ok=True)
+            elif path.suffix == ".npy" and not npy:
+                path.unlink()
 
-    print("✅ Fertig! Aufteilung gespeichert in:", Path(output_dir).resolve())
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(info_path, json.dumps(settings).encode())
+    print(f"✅ Trainings-Cache gespeichert in: {cache_dir.resolve()}")
+    return str(cache_dir)
 
 
 if __name__ == "__main__":
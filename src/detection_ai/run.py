@@ -2,7 +2,7 @@ import cv2
 from ultralytics import YOLO
 from pathlib import Path
 
-def predict_and_show(model_path: str, image_path: str, save_result: bool = False):
+def predict_and_show(model_path: str, image_path: str, save_result: bool = False, device: str = "mps"):
     """
     Lädt ein YOLO-Modell, führt Inferenz auf einem Bild aus und zeigt das Ergebnis.
     """
@@ -18,7 +18,7 @@ def predict_and_show(model_path: str, image_path: str, save_result: bool = False
     model = YOLO(model_path)
 
     print(f"🖼️ Analysiere Bild: {image_path}")
-    results = model.predict(source=str(image_path), device="mps", verbose=False, conf=0.6)
+    results = model.predict(source=str(image_path), device=device, verbose=False, conf=0.6)
 
     # Erstes Ergebnis extrahieren
     result = results[0]
@@ -40,9 +40,15 @@ def train_yolo_model(
     imgsz=640,
     device="mps", 
     project_dir="runs/train",
+    cache_dir=None,
+    workers=8,
 ):
     """
     Trainiert ein YOLOv8-Modell auf dem angegebenen Dataset.
+    Mit cache_dir wird aus einem vorab letterboxten Trainings-Cache in imgsz trainiert (siehe
+    prep_dataset.build_training_cache, wird bei Bedarf aktualisiert), statt große Seiten-PNGs
+    in jeder Epoche zu dekodieren und zu verkleinern. cache_dir=True nutzt <dataset_dir>_<imgsz>.
+    Als Skript aus dem Projektordner starten: PYTHONPATH=src python -m detection_ai.train
     """
 
     if class_names is None:
@@ -56,6 +62,11 @@ def train_yolo_model(
     except ImportError:
         raise RuntimeError("❌ Bitte zuerst installieren: pip install ultralytics")
 
+    run_name = f"{Path(dataset_dir).name}_run"
+    if cache_dir:
+        from detection_ai.prep_dataset import build_training_cache
+        dataset_dir = build_training_cache(dataset_dir, None if cache_dir is True else cache_dir, imgsz=imgsz)
+
     # data.yaml erzeugen (falls fehlt)
     data_yaml = create_data_yaml(dataset_dir, class_names)
 
@@ -73,7 +84,8 @@ def train_yolo_model(
         device=device,
         project=project_dir,
         augment=False,
-        name=f"{Path(dataset_dir).name}_run",
+        workers=workers,
+        name=run_name,
     )
 
     print("✅ Training abgeschlossen!")
@@ -95,4 +107,5 @@ if __name__ == "__main__":
         epochs=100,
         imgsz=640,
         device="mps",  
+        cache_dir=True,
     )
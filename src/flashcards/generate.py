@@ -0,0 +1,368 @@
+import json
+import os
+import threading
+import time
+from typing import Iterable
+
+from loguru import logger
+
+from util.config_reader import ConfigLoader
+from util.crops import RasterCache
+from util.detection_io import document_name
+from util.ollama_checker import ollama_host
+from util.page import Page
+from util import metrics
+from gemini_detection.scheduler import backoff_delay, is_retryable
+
+
+CARD_PROMPT = (
+    """ Du erstellst Karteikarten zum Lernen aus Ausschnitten einer Vorlesungs- oder Skriptseite.
+        Jedes Bild ist ein zusammenhängender Inhaltsblock (Text, Tabelle, Formel, Diagramm oder Abbildung).
+
+        Erstelle zu den wichtigsten Aussagen der Blöcke jeweils eine Karteikarte im Format:
+        Q: <präzise Frage>
+        A: <knappe, vollständige Antwort>
+
+        Trenne Karten durch eine Leerzeile. Gib nichts anderes aus und erfinde keine Inhalte,
+        die nicht in den Blöcken stehen. Enthalten die Blöcke keinen lernbaren Inhalt, gib nichts aus."""
+)
+
+
+def pack_blocks(boxes: list[list[int]], image_size: tuple[int, int], max_blocks: int = 4,
+                max_area_fraction: float = 0.35) -> list[list[int]]:
+    """
+    Groups the blocks of a page (in reading order) into prompts: consecutive blocks share one request until
+    max_blocks blocks or max_area_fraction of the page area are reached; a large block gets a request of its own.
+    Returns lists of block indices.
+    """
+    page_area = max(1, image_size[0] * image_size[1])
+    groups, current, current_area = [], [], 0.0
+
+    for index, box in enumerate(boxes):
+        area = max(0, box[2] - box[0]) * max(0, box[3] - box[1]) / page_area
+        if current and (len(current) >= max_blocks or current_area + area > max_area_fraction):
+            groups.append(current)
+            current, current_area = [], 0.0
+        current.append(index)
+        current_area += area
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+class CardStreamParser:
+    """
+    Parses "Q: ... / A: ..." cards out of a streamed response. A card is complete once the next "Q:" starts
+    or the stream ends, so cards can be written while the model is still generating.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._question: list[str] | None = None
+        self._answer: list[str] | None = None
+
+    def feed(self, text: str) -> list[tuple[str, str]]:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        cards = []
+        for line in lines:
+            card = self._line(line)
+            if card:
+                cards.append(card)
+        return cards
+
+    def close(self) -> list[tuple[str, str]]:
+        cards = self.feed("\n")
+        card = self._finish()
+        return cards + ([card] if card else [])
+
+    def _line(self, line: str) -> tuple[str, str] | None:
+        stripped = line.strip().lstrip("*# ").strip()
+        if stripped[:2].upper() in ("Q:", "F:"):
+            card = self._finish()
+            self._question, self._answer = [stripped[2:].strip(" *")], None
+            return card
+        if stripped[:2].upper() == "A:" and self._question is not None:
+            self._answer = [stripped[2:].strip(" *")]
+        elif stripped and self._answer is not None:
+            self._answer.append(stripped)
+        elif stripped and self._question is not None:
+            self._question.append(stripped)
+        return None
+
+    def _finish(self) -> tuple[str, str] | None:
+        question, answer = self._question, self._answer
+        self._question = self._answer = None
+        if question and answer and " ".join(answer).strip():
+            return " ".join(question).strip(), "\n".join(answer).strip()
+        return None
+
+
+class CardWriter:
+    """
+    Appends cards as JSON Lines to <output_dir>/<document>.cards.jsonl; each card is flushed as soon as it is parsed.
+    Once every block of a page got its answer, a {"document", "page", "complete": true} record marks the page done.
+    """
+
+    def __init__(self, output_dir: str) -> None:
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        # Per document: file stamp when read, pages with card lines, completed pages
+        self._pages: dict[str, tuple[tuple[int, int] | None, set[str], set[str]]] = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def path(self, document: str) -> str:
+        return os.path.join(self.output_dir, f"{document}.cards.jsonl")
+
+    def has_page(self, document: str, page: str) -> bool:
+        """True if the page was completed before (the document file is read again only when it changed)."""
+        with self._lock:
+            return page in self._state(document)[2]
+
+    def _stamp(self, document: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.path(document))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _state(self, document: str) -> tuple[tuple[int, int] | None, set[str], set[str]]:
+        stamp = self._stamp(document)
+        # Another process (e.g. a second worker renumbering pages) may have rewritten the file
+        if document not in self._pages or self._pages[document][0] != stamp:
+            written, complete = set(), set()
+            if stamp is not None:
+                with open(self.path(document), "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                            (complete if record.get("complete") else written).add(record["page"])
+                        except (json.JSONDecodeError, KeyError, AttributeError):
+                            continue
+            self._pages[document] = (stamp, written, complete)
+        return self._pages[document]
+
+    def rename_pages(self, document: str, renames: dict[str, str], removed: Iterable[str] = ()) -> None:
+        """Moves the cards of renumbered pages to their new page names (applied at once) and drops removed pages."""
+        path = self.path(document)
+        with self._lock:
+            if not os.path.exists(path):
+                return
+            dropped = set(removed) | (set(renames.values()) - set(renames))
+            lines = []
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        card = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if card.get("page") in renames:
+                        card["page"] = renames[card["page"]]
+                    elif card.get("page") in dropped:
+                        continue
+                    lines.append(json.dumps(card, ensure_ascii=False, separators=(",", ":")) + "\n")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+            os.replace(tmp_path, path)
+            self._pages.pop(document, None)
+
+    def drop_pages(self, document: str, pages: Iterable[str], keep_complete: bool = False) -> None:
+        """
+        Removes the cards and completion records of the given pages (with keep_complete only those of pages that were
+        not completed, i.e. cards left by an interrupted run) in a single rewrite of the file, if there are any.
+        """
+        pages = set(pages)
+        with self._lock:
+            _, written, complete = self._state(document)
+            pages &= written - complete if keep_complete else written | complete
+            if not pages:
+                return
+        self.rename_pages(document, {}, pages)
+
+    def append(self, card: dict) -> None:
+        self._write_line(card, card["page"], complete=False)
+
+    def complete_page(self, document: str, page: str) -> None:
+        """Marks a page done after the last of its cards was written."""
+        self._write_line({"document": document, "page": page, "complete": True}, page, complete=True)
+
+    def _write_line(self, record: dict, page: str, complete: bool) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        document = record["document"]
+        with self._lock:
+            _, written, completed = self._state(document)
+            with open(self.path(document), "a", encoding="utf-8") as f:
+                f.write(line)
+            (completed if complete else written).add(page)
+            # Our own append must not count as an outside change
+            self._pages[document] = (self._stamp(document), written, completed)
+
+
+class FlashcardGenerator:
+    """
+    Turns the detected blocks of a page into flashcards with a local Ollama model.
+    One pooled HTTP client is shared by all worker threads (FLASHCARDS.MAX_IN_FLIGHT concurrent requests),
+    the model stays loaded between requests (FLASHCARDS.KEEP_ALIVE) and several small blocks share one prompt.
+    A custom client (e.g. one pointing at benchmark.fake_ollama.FakeOllamaServer) can be injected for testing.
+    """
+
+    def __init__(self, config_loader: ConfigLoader, output_dir: str | None = None, client=None) -> None:
+        config = config_loader.view()
+        self.model = config.get("FLASHCARDS_MODEL") or (config.get("CHAT_MODELS_MODELS") or [""])[0]
+        self.max_in_flight = config.get("FLASHCARDS_MAX_IN_FLIGHT", 4)
+        self.keep_alive = config.get("FLASHCARDS_KEEP_ALIVE", "30m")
+        self.max_blocks = config.get("FLASHCARDS_MAX_BLOCKS_PER_PROMPT", 4)
+        self.max_area = config.get("FLASHCARDS_MAX_AREA_PER_PROMPT", 0.35)
+        self.image_max_side = config.get("FLASHCARDS_IMAGE_MAX_SIDE", 1024)
+        self.image_quality = config.get("FLASHCARDS_IMAGE_QUALITY", 85)
+        self.max_retries = config.get("FLASHCARDS_MAX_RETRIES", 3)
+        self.writer = CardWriter(output_dir or config.get("FLASHCARDS_OUTPUT_DIR", "data/flashcards/"))
+        # Blocks are cut from the memory-mapped page raster instead of decoding the page image again
+        self.rasters = RasterCache.from_settings(config)
+
+        if client is None:
+            # Imported here: ollama (httpx) is only needed once cards are generated
+            import httpx
+            from ollama import Client
+
+            client = Client(
+                host=ollama_host(config.get("OLLAMA_HOST") or None),
+                timeout=config.get("FLASHCARDS_TIMEOUT_SECONDS", 300),
+                limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight),
+            )
+        self.client = client
+
+        self._lock = threading.Lock()
+        self._started: float | None = None
+        self._first_card: float | None = None
+        self._last_card: float | None = None
+        self.cards = 0
+        self.requests = 0
+        self.errors = 0
+        self.skipped_pages = 0
+
+    def warm_up(self) -> None:
+        """Loads the model into memory before the first page arrives (an empty generate request only loads it)."""
+        try:
+            self.client.generate(model=self.model, prompt="", keep_alive=self.keep_alive)
+        except Exception as e:
+            logger.warning(f"⚠️ Modell {self.model} konnte nicht vorgeladen werden: {e}")
+
+    def has_cards(self, page: Page) -> bool:
+        """True if the cards of the page were completely generated (its document's cards file has its completion record)."""
+        return self.writer.has_page(document_name(page.image_path), os.path.splitext(page.name)[0])
+
+    def drop_cards(self, pages: Iterable[Page], force: bool = False) -> None:
+        """
+        Drops the cards of pages about to be generated with one rewrite per cards file: cards left by an interrupted
+        run and, with force, those of completed pages. Called before a run, it spares generate_page a rewrite per page.
+        """
+        by_document: dict[str, list[str]] = {}
+        for page in pages:
+            by_document.setdefault(document_name(page.image_path), []).append(os.path.splitext(page.name)[0])
+        for document, page_names in by_document.items():
+            self.writer.drop_pages(document, page_names, keep_complete=not force)
+
+    def generate_page(self, page: Page, boxes: list[list[int]], force: bool = False) -> int:
+        """
+        Generates the cards of one page, appends them to the document's cards file and returns their number.
+        A completed page is skipped unless force; cards left by an interrupted or forced earlier run are dropped first
+        (nothing to do if drop_cards ran for the page before).
+        The page is marked complete only if every request succeeded, so a failed page is retried on the next run.
+        """
+        document = document_name(page.image_path)
+        page_name = os.path.splitext(page.name)[0]
+        with self._lock:
+            if self._started is None:
+                self._started = time.perf_counter()
+
+        if not force and self.writer.has_page(document, page_name):
+            with self._lock:
+                self.skipped_pages += 1
+            return 0
+        self.writer.drop_pages(document, [page_name])
+
+        cards, complete = 0, True
+        if boxes:
+            try:
+                blocks = self.rasters.crops(page, boxes)
+                height, width = self.rasters.page_array(page).shape[:2]
+                for group in pack_blocks(boxes, (width, height), self.max_blocks, self.max_area):
+                    images = [blocks[index].encode("jpeg", self.image_max_side, self.image_quality)
+                              for index in group if blocks[index].array.size]
+                    if not images:
+                        continue
+                    with metrics.span("flashcard_request", model=self.model, blocks=len(group)):
+                        written, ok = self._request(images, {"document": document, "page": page_name, "blocks": group})
+                    cards += written
+                    complete = complete and ok
+            finally:
+                self.rasters.release(page)
+        if complete:
+            self.writer.complete_page(document, page_name)
+        return cards
+
+    def _request(self, images: list[bytes], card_info: dict) -> tuple[int, bool]:
+        """
+        Streams one prompt; every completed card is written immediately. Retries throttling and server errors.
+        Returns the number of cards written and whether the response was received completely.
+        """
+        messages = [{"role": "user", "content": CARD_PROMPT, "images": images}]
+
+        for attempt in range(self.max_retries + 1):
+            parser = CardStreamParser()
+            cards = 0
+            try:
+                with self._lock:
+                    self.requests += 1
+                for part in self.client.chat(self.model, messages=messages, stream=True, keep_alive=self.keep_alive):
+                    cards += self._write(parser.feed(part["message"]["content"]), card_info)
+                return cards + self._write(parser.close(), card_info), True
+            except Exception as e:
+                status_code = getattr(e, "status_code", None)
+                with self._lock:
+                    self.errors += 1
+                metrics.count("flashcard_errors", model=self.model, status=status_code or "exception")
+                # Cards already written stay; a retry only makes sense if nothing was streamed yet
+                if cards == 0 and is_retryable(status_code) and attempt < self.max_retries:
+                    delay = backoff_delay(attempt)
+                    logger.warning(f"⚠️ {status_code} bei Modell {self.model}, neuer Versuch in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+                logger.error(f"❌ Karteikarten fehlgeschlagen für {card_info['document']}/{card_info['page']}: {e}")
+                return cards, False
+        return 0, False
+
+    def _write(self, cards: list[tuple[str, str]], card_info: dict) -> int:
+        for question, answer in cards:
+            self.writer.append({**card_info, "model": self.model, "question": question, "answer": answer})
+            now = time.perf_counter()
+            with self._lock:
+                self.cards += 1
+                self._last_card = now
+                if self._first_card is None:
+                    self._first_card = now
+            metrics.count("flashcards", model=self.model)
+        return len(cards)
+
+    def summary(self) -> dict:
+        """Cards, requests, errors, cards per second and time to first card (seconds since the first page arrived)."""
+        with self._lock:
+            elapsed = (self._last_card - self._started) if self._last_card and self._started else 0.0
+            return {
+                "cards": self.cards,
+                "requests": self.requests,
+                "errors": self.errors,
+                "skipped_pages": self.skipped_pages,
+                "cards_per_second": round(self.cards / elapsed, 2) if elapsed > 0 else 0.0,
+                "time_to_first_card": round(self._first_card - self._started, 3) if self._first_card else None,
+            }
+
+    def log_summary(self) -> None:
+        stats = self.summary()
+        logger.info(
+            f"🗂️  Karteikarten: {stats['cards']} aus {stats['requests']} Anfragen ({stats['errors']} Fehler), "
+            f"{stats['cards_per_second']} Karten/s, erste Karte nach {stats['time_to_first_card']}s"
+        )
@@ -1,97 +1,367 @@
-from google import genai
-from google.genai import types
-from google.genai.errors import ServerError
-
 from PIL import Image
+import hashlib
+import io
 import json
+import math
 import os
+import threading
+import time
 from loguru import logger
 from dotenv import load_dotenv
 from util.config_reader import ConfigLoader
+from util.cache_store import DetectionCache, get_detection_cache
+from util.detection_io import document_name, load_document_boxes, page_key, write_boxes
+from util import metrics
+from util.page import Page
+from util.page_similarity import PageMatch, get_page_deduplicator
+from gemini_detection.postprocess import postprocess_gemini_boxes
+from gemini_detection.model_router import ModelRouter, get_model_router
+from gemini_detection.scheduler import ModelRateLimiter, backoff_delay, error_status_code, is_retryable, is_timeout, map_in_order
+
+
+DETECTION_PROMPT = (
+    """ Detect and label all distinct logical content regions in the image, such as handwritten text blocks, printed text boxes, images, tables, diagrams, or formulas.
+        For each detected region, return its bounding box coordinates as [ymin, xmin, ymax, xmax], normalized to a 0–1000 scale.
+
+        Ensure that:
+        -   Each bounding box tightly encloses its corresponding content region.
+        -   Overlapping or nested boxes are avoided unless clearly separate content types exist (e.g., an image inside a text block).
+        -   Ignore irrelevant margins, decorations, or background noise.
+        -   Use consistent scaling across the entire image."""
+)
+
+
+# Generation settings; the fingerprint equals GenerateContentConfig(**GENERATION_CONFIG).model_dump_json(exclude_none=True),
+# so cache lookups need not import google.genai
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+GENERATION_CONFIG_FINGERPRINT = json.dumps(GENERATION_CONFIG, separators=(",", ":"))
+
+
+class _LazyClient:
+    """Creates the genai client on first use, so runs served entirely from the cache need no API access."""
 
+    def __init__(self) -> None:
+        self._client = None
+        self._lock = threading.Lock()
 
-def detect_logical_blocks_with_gemini(image_paths: list[str], output_dir: str, config_loader: ConfigLoader, test_mode=False):
+    @property
+    def models(self):
+        with self._lock:
+            if self._client is None:
+                # Imported on first use: google.genai takes longer to import than a fully cached run
+                from google import genai
+                load_dotenv()
+                self._client = genai.Client()
+        return self._client.models
+
+
+def _estimate_tokens(image_size: tuple[int, int], prompt: str) -> int:
+    """Rough input token estimate: 258 tokens per started 768x768 image tile plus ~4 characters per text token."""
+    width, height = image_size
+    tiles = math.ceil(width / 768) * math.ceil(height / 768)
+    return tiles * 258 + len(prompt) // 4
+
+
+def _count_tokens(usage, model: str, image_path: str) -> None:
+    """Books the usage_metadata token counts of one response per model and document."""
+    if usage is None or not metrics.enabled():
+        return
+    document = document_name(image_path)
+    for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"), ("total", "total_token_count")):
+        tokens = getattr(usage, field, None)
+        if tokens:
+            metrics.count("gemini_tokens", tokens, model=model, kind=kind, document=document)
+
+
+def _generate_with_fallback(client, router: ModelRouter, contents: list, config, limiter: ModelRateLimiter,
+                            estimated_tokens: int, settings: dict, image_path: str):
     """
-    Uses Google Gemini to detect logical blocks (text, images, tables) in images.
-    Returns a dictionary of detected bounding boxes and saves them as JSON.
+    Sends one request to the healthiest available model, retrying throttling and server errors with jittered
+    exponential backoff. Falls back to the next model once the retries are exhausted or the model's circuit opens.
+    Returns (response, model) or (None, None), also if every circuit stays open for CIRCUIT_MAX_WAIT_SECONDS.
     """
+    max_retries = settings.get("MAX_RETRIES", 4)
 
-    load_dotenv()
-    client = genai.Client()
-    
-    prompt = (
-        """ Detect and label all distinct logical content regions in the image, such as handwritten text blocks, printed text boxes, images, tables, diagrams, or formulas.
-            For each detected region, return its bounding box coordinates as [ymin, xmin, ymax, xmax], normalized to a 0–1000 scale.
-
-            Ensure that:
-            -   Each bounding box tightly encloses its corresponding content region.
-            -   Overlapping or nested boxes are avoided unless clearly separate content types exist (e.g., an image inside a text block).
-            -   Ignore irrelevant margins, decorations, or background noise.
-            -   Use consistent scaling across the entire image."""
-    )
+    candidates = router.candidates()
+    if not candidates:
+        logger.warning(f"⚠️ Kein Modell verfügbar (alle Circuits offen) für {image_path}")
+    for rank, model in enumerate(candidates):
+        for attempt in range(max_retries + 1):
+            limiter.acquire(model, estimated_tokens)
+            started = time.perf_counter()
+            try:
+                # Failed calls carry an error label; gemini_requests_total counts them per status code
+                with metrics.span("gemini_generate_content", model=model, fallback=rank > 0):
+                    response = client.models.generate_content(model=model, contents=contents, config=config)
+            except Exception as e:
+                status_code = error_status_code(e)
+                timeout = status_code is None and is_timeout(e)
+                metrics.count("gemini_requests", model=model, status=status_code or ("timeout" if timeout else "exception"))
+                if status_code is None and not timeout:
+                    raise
+                retryable = timeout or is_retryable(status_code)
+                # Client errors (400, 403, 404) are caused by the page or prompt, not by the model's health
+                if retryable:
+                    router.record_failure(model, time.perf_counter() - started)
+                if retryable and attempt < max_retries and router.is_available(model):
+                    delay = backoff_delay(attempt, settings.get("BACKOFF_BASE_SECONDS", 1.0), settings.get("BACKOFF_MAX_SECONDS", 30.0))
+                    logger.warning(f"⚠️ {status_code or 'Timeout'} bei Modell {model} für {image_path}, neuer Versuch in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+                logger.warning(f"⚠️ Fehler bei Modell {model}: {e}")
+                break
 
-    os.makedirs(output_dir, exist_ok=True)
-    results = {}
+            router.record_success(model, time.perf_counter() - started)
+            usage = getattr(response, "usage_metadata", None)
+            limiter.record_usage(model, estimated_tokens, getattr(usage, "total_token_count", None))
+            metrics.count("gemini_requests", model=model, status="ok")
+            _count_tokens(usage, model, image_path)
+            return response, model
 
-    if test_mode:
-        image_paths = image_paths[:3]
-        logger.info("🔍 Testmodus aktiviert – analysiere nur ersten 3 Bilder.")
+    return None, None
 
-    for image_path in image_paths:
-        logger.info(f"Analysiere Bild: {image_path}")
-        image = Image.open(image_path)
 
-        config = types.GenerateContentConfig(
-            response_mime_type="application/json"
-        )
+def _request_boxes(page: Page, client, router: ModelRouter, limiter: ModelRateLimiter, settings: dict,
+                   cache: DetectionCache | None = None) -> dict | None:
+    """
+    Detects the logical blocks of one page image and returns {"boxes", "labels", "scores"} or None if every model failed.
+    Gemini receives a downscaled JPEG/WebP of the image; boxes are mapped back to full-resolution pixels.
+    Cached responses for the same image bytes, prompt, model and generation config are reused without an API call.
+    """
+    image_path = page.image_path
+    image_bytes, mime_type = page.for_gemini(
+        max_side=settings.get("IMAGE_MAX_SIDE", 1568),
+        fmt=settings.get("IMAGE_FORMAT", "JPEG"),
+        quality=settings.get("IMAGE_QUALITY", 85),
+    )
 
-        response = None
-        models = config_loader.to_dict().get("CHAT_MODELS_GEMINI_MODELS", [])
-        index = 0
+    cached = None
+    if cache is not None:
+        image_digest = hashlib.sha256(image_bytes).hexdigest()
+        request_digests = [(model, DetectionCache.request_digest(DETECTION_PROMPT, model, GENERATION_CONFIG_FINGERPRINT))
+                           for model in router.models]
+        cached = cache.lookup(image_digest, request_digests)
+
+    if cached is not None:
+        response_text, model = cached
+        logger.info(f"♻️  Cache-Treffer für {image_path} ({model})")
+    else:
+        from google.genai import types
+
+        config = types.GenerateContentConfig(**GENERATION_CONFIG)
+        started = time.perf_counter()
+        response, model = _generate_with_fallback(
+            client, router, [types.Part.from_bytes(data=image_bytes, mime_type=mime_type), DETECTION_PROMPT], config, limiter,
+            _estimate_tokens(Image.open(io.BytesIO(image_bytes)).size, DETECTION_PROMPT), settings, image_path
+        )
 
-        # Try available Gemini models in order until one succeeds
-        while response is None and index < len(models):
-            try:
-                # Send request to Gemini
-                response = client.models.generate_content(
-                    model=models[index],
-                    contents=[image, prompt],
-                    config=config
-                )
-            except ServerError as e:
-                logger.warning(f"⚠️ Fehler bei Modell {models[index]}: {e}")
-                index += 1
-        
         if response is None:
             logger.error(f"❌ Alle Modelle fehlgeschlagen für Bild {image_path}. Überspringe...")
-            continue
+            return None
 
-        # Parse Bounding Boxes from JSON response
+        response_text = response.text
+        if cache is not None:
+            usage = getattr(response, "usage_metadata", None)
+            cache.put(image_digest, dict(request_digests)[model], model, response_text,
+                      time.perf_counter() - started, getattr(usage, "total_token_count", None))
+
+    # Parse Bounding Boxes from JSON response
+    with metrics.span("parse_response"):
         try:
-            bounding_boxes = json.loads(response.text)
+            bounding_boxes = json.loads(response_text)
         except json.JSONDecodeError:
             logger.warning(f"⚠️ JSON konnte für {image_path} nicht dekodiert werden.")
+            metrics.count("invalid_responses", model=model)
             bounding_boxes = []
 
-        width, height = image.size
-        converted_bounding_boxes = []
+    # Umrechnen, auf das Bild begrenzen und Überlappungen zusammenführen (Labels bleiben erhalten)
+    with metrics.span("box_conversion"):
+        result = postprocess_gemini_boxes(
+            bounding_boxes if isinstance(bounding_boxes, list) else [],
+            page.size,
+            iou_threshold=settings.get("MERGE_IOU_THRESHOLD", 0.5),
+            containment_threshold=settings.get("MERGE_CONTAINMENT_THRESHOLD", 0.9),
+        )
+    return result
+
+
+def _detect_page(page: Page | str, output_dir: str, client, router: ModelRouter, limiter: ModelRateLimiter, settings: dict,
+                 cache: DetectionCache | None = None):
+    """
+    Detects the logical blocks of one page and appends them to its document's JSON Lines file. Returns the boxes or None if every model failed.
+    """
+    page = Page.of(page)
+    logger.info(f"Analysiere Bild: {page.image_path}")
+    result = _request_boxes(page, client, router, limiter, settings, cache)
+    if result is None:
+        return None
 
-        # Convert normalized coordinates (0-1000) to absolute pixel coordinates
-        for bbox in bounding_boxes:
-            abs_y1 = int(bbox["box_2d"][0] / 1000 * height)
-            abs_x1 = int(bbox["box_2d"][1] / 1000 * width)
-            abs_y2 = int(bbox["box_2d"][2] / 1000 * height)
-            abs_x2 = int(bbox["box_2d"][3] / 1000 * width)
-            converted_bounding_boxes.append([abs_x1, abs_y1, abs_x2, abs_y2])
+    # Save results to the document's JSON Lines file
+    output_file = write_boxes(page.image_path, result["boxes"], output_dir, result["labels"], result["scores"])
 
-        # Save results to JSON file
-        base_name = os.path.basename(image_path)
-        output_file = os.path.join(output_dir, f"{os.path.splitext(base_name)[0]}_boxes.json")
+    logger.info(f"💾 Ergebnisse gespeichert in: {output_file}")
+    return result["boxes"]
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(converted_bounding_boxes, f, indent=2, ensure_ascii=False)
 
+def _intersects(box: list[int], region: list[int]) -> bool:
+    return box[0] < region[2] and region[0] < box[2] and box[1] < region[3] and region[1] < box[3]
+
+
+def _expand_region(region: list[int], boxes: list[list[int]]) -> list[int]:
+    """Grows the region until every box it cuts lies completely inside, so no block is split at its border."""
+    region = list(region)
+    grown = True
+    while grown:
+        grown = False
+        for box in boxes:
+            if _intersects(box, region) and not (region[0] <= box[0] and region[1] <= box[1]
+                                                 and box[2] <= region[2] and box[3] <= region[3]):
+                region = [min(region[0], box[0]), min(region[1], box[1]), max(region[2], box[2]), max(region[3], box[3])]
+                grown = True
+    return region
+
+
+class GeminiBlockDetector:
+    """
+    Detects the logical blocks of single pages with shared client, model router, rate limiter and detection cache,
+    so pages can be submitted one at a time from several threads (e.g. a pipeline stage with MAX_IN_FLIGHT workers).
+    With GEMINI_SETTINGS.DEDUP_ENABLED, identical pages reuse the boxes of an earlier page (in any document) and
+    near duplicates (e.g. incremental-reveal slides) only send their changed region to Gemini.
+    """
+
+    def __init__(self, output_dir: str, config_loader: ConfigLoader, client=None) -> None:
+        self.output_dir = output_dir
+        self.client = client if client is not None else _LazyClient()
+        self.cache = get_detection_cache(config_loader)
+        self.settings = config_loader._config.get("GEMINI_SETTINGS", {})
+        self.router = get_model_router(config_loader, config_loader.get("CHAT_MODELS_GEMINI_MODELS", []))
+        self.limiter = ModelRateLimiter(
+            self.settings.get("RATE_LIMITS", {}),
+            default_rpm=self.settings.get("DEFAULT_RPM", 60),
+            default_tpm=self.settings.get("DEFAULT_TPM", 1_000_000),
+        )
+        self.max_in_flight = self.settings.get("MAX_IN_FLIGHT", 1)
+        self.dedup = get_page_deduplicator(config_loader)
+        os.makedirs(output_dir, exist_ok=True)
+
+    def detect_page(self, page: Page | str) -> list[list[int]] | None:
+        """Detects one page and saves its boxes, labels and scores; returns the boxes or None if every model failed."""
+        if self.dedup is None:
+            return _detect_page(page, self.output_dir, self.client, self.router, self.limiter, self.settings, self.cache)
+
+        page = Page.of(page)
+        key = page_key(page.image_path)
+        fingerprint, match = self.dedup.match(key, page.image, lambda other: self._saved_record(other) is not None)
+        boxes = None
+        try:
+            if match is not None:
+                boxes = self._detect_from_match(page, match)
+            if boxes is None:
+                boxes = _detect_page(page, self.output_dir, self.client, self.router, self.limiter, self.settings, self.cache)
+                if match is None:
+                    self.dedup.record("unique")
+        finally:
+            self.dedup.done(key, fingerprint, boxes is not None)
+        return boxes
+
+    def _saved_record(self, key: str) -> dict | None:
+        document, _, page = key.rpartition("/")
+        return load_document_boxes(document, self.output_dir).get(page)
+
+    def _detect_from_match(self, page: Page, match: PageMatch) -> list[list[int]] | None:
+        """
+        Reuses the saved boxes of a matching page: all of them for an identical page, otherwise the ones outside
+        the changed region, which alone is sent to Gemini. Returns None if the page has to be detected in full.
+        """
+        record = self._saved_record(match.key)
+        if record is None:
+            return None
+        width, height = page.size
+        scale_x, scale_y = width / match.size[0], height / match.size[1]
+        boxes = [[round(box[0] * scale_x), round(box[1] * scale_y), round(box[2] * scale_x), round(box[3] * scale_y)]
+                 for box in record["boxes"]]
+        labels, scores = list(record["labels"]), list(record["scores"])
+
+        if match.region is None:
+            logger.info(f"♻️  {page.image_path} gleicht {match.key}, Boxen übernommen")
+            output_file = write_boxes(page.image_path, boxes, self.output_dir, labels, scores, {"duplicate_of": match.key})
+            self.dedup.record("duplicate")
+            logger.info(f"💾 Ergebnisse gespeichert in: {output_file}")
+            return boxes
+
+        region = _expand_region(match.region, boxes)
+        area = (region[2] - region[0]) * (region[3] - region[1]) / (width * height)
+        if area > self.dedup.max_diff_area:
+            # Flagged as near duplicate, but the changed blocks cover too much of the page
+            self.dedup.record("near")
+            return None
+
+        logger.info(f"🔍 {page.image_path} ähnelt {match.key}, analysiere nur den geänderten Bereich {region}")
+        crop = Page(page.image_path, page.pdf_file, page.page_number, page.image.crop(tuple(region)))
+        result = _request_boxes(crop, self.client, self.router, self.limiter, self.settings, self.cache)
+        if result is None:
+            return None
+
+        kept = [index for index, box in enumerate(boxes) if not _intersects(box, region)]
+        merged = sorted(
+            [(boxes[index], labels[index], scores[index]) for index in kept]
+            + [([box[0] + region[0], box[1] + region[1], box[2] + region[0], box[3] + region[1]], label, score)
+               for box, label, score in zip(result["boxes"], result["labels"], result["scores"])],
+            key=lambda entry: (entry[0][1], entry[0][0]),
+        )
+        boxes = [box for box, _, _ in merged]
+        output_file = write_boxes(page.image_path, boxes, self.output_dir, [label for _, label, _ in merged],
+                                  [score for _, _, score in merged], {"near_duplicate_of": match.key, "detected_region": region})
+        self.dedup.record("partial", area)
         logger.info(f"💾 Ergebnisse gespeichert in: {output_file}")
-        results[base_name] = converted_bounding_boxes
+        return boxes
+
+    def log_summary(self) -> None:
+        logger.info(f"🧭 Modell-Routing: {self.router.snapshot()}")
+
+        if self.dedup is not None:
+            stats = self.dedup.stats()
+            logger.info(
+                f"🪞 Seiten-Deduplizierung: {stats['duplicates']} Duplikate von {stats['pages']} Seiten "
+                f"({stats['saved_api_calls']} API-Aufrufe gespart), {stats['partial']} nur im geänderten Bereich analysiert "
+                f"(Ø {stats['partial_mean_area']:.0%} der Seite), {stats['near']} Beinahe-Duplikate vollständig analysiert"
+            )
+
+        if self.cache is not None:
+            stats = self.cache.stats()
+            logger.info(
+                f"📊 Detection-Cache: {stats['hits']} Treffer / {stats['misses']} Fehlschläge, "
+                f"gespart: {stats['saved_latency_seconds']}s API-Latenz, {stats['saved_tokens']} Tokens"
+            )
+
+
+def detect_logical_blocks_with_gemini(image_paths: list[Page | str], output_dir: str, config_loader: ConfigLoader,
+                                      page_limit: int | None = None, client=None, max_in_flight: int | None = None):
+    """
+    Uses Google Gemini to detect logical blocks (text, images, tables) in images.
+    Responses are served from the detection cache (GEMINI_SETTINGS.CACHE_ENABLED) before any API call is made,
+    duplicate pages reuse earlier boxes (GEMINI_SETTINGS.DEDUP_ENABLED).
+    Up to GEMINI_SETTINGS.MAX_IN_FLIGHT requests run concurrently, throttled per model by RPM/TPM token buckets.
+    Returns a dictionary of detected bounding boxes (in page order) and saves them per document as JSON Lines.
+    Accepts image paths or in-memory Page objects; page_limit analyses only the first pages.
+    A custom client (e.g. gemini_detection.fake_client.FakeGeminiClient) can be injected for testing.
+    """
+    detector = GeminiBlockDetector(output_dir, config_loader, client)
+    results = {}
+
+    if page_limit:
+        image_paths = image_paths[:page_limit]
+        logger.info(f"🔍 Seitenlimit aktiv – analysiere nur die ersten {page_limit} Bilder.")
+
+    page_results = map_in_order(
+        detector.detect_page,
+        image_paths,
+        max_in_flight=max_in_flight or detector.max_in_flight,
+    )
+
+    for image_path, converted_bounding_boxes in zip(image_paths, page_results):
+        if converted_bounding_boxes is not None:
+            results[page_key(Page.of(image_path).image_path)] = converted_bounding_boxes
 
+    detector.log_summary()
     return results
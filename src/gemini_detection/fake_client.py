@@ -0,0 +1,80 @@
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeAPIError(Exception):
+    """Error with an HTTP status code, shaped like google.genai.errors.APIError."""
+
+    def __init__(self, code: int, message: str = "") -> None:
+        super().__init__(f"{code} {message}".strip())
+        self.code = code
+
+
+class _FakeModels:
+    def __init__(self, client: "FakeGeminiClient") -> None:
+        self._client = client
+
+    def generate_content(self, model: str, contents=None, config=None):
+        return self._client._generate(model)
+
+
+class FakeGeminiClient:
+    """
+    Local stand-in for genai.Client to exercise the detection scheduler without network access.
+    Simulates latency, a per-model requests-per-minute limit (429) and random server errors (503).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        latency_jitter: float = 0.1,
+        rpm_limit: int | None = None,
+        error_rate: float = 0.0,
+        failing_models: set[str] | None = None,
+        boxes: list[dict] | None = None,
+        seed: int | None = None,
+    ) -> None:
+        self.models = _FakeModels(self)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rpm_limit = rpm_limit
+        self.error_rate = error_rate
+        self.failing_models = failing_models or set()
+        self.boxes = boxes if boxes is not None else [{"box_2d": [100, 100, 400, 900], "label": "text"}]
+        self.calls: list[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._windows: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def _generate(self, model: str):
+        with self._lock:
+            self.calls.append(model)
+            now = time.monotonic()
+            window = [t for t in self._windows.get(model, []) if now - t < 60]
+            throttled = self.rpm_limit is not None and len(window) >= self.rpm_limit
+            if not throttled:
+                window.append(now)
+            self._windows[model] = window
+            failed = model in self.failing_models or self._random.random() < self.error_rate
+            delay = max(0.0, self.latency + self._random.uniform(-self.latency_jitter, self.latency_jitter))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            if throttled:
+                raise FakeAPIError(429, "RESOURCE_EXHAUSTED")
+            time.sleep(delay)
+            if failed:
+                raise FakeAPIError(503, "UNAVAILABLE")
+            text = json.dumps(self.boxes)
+            usage = SimpleNamespace(prompt_token_count=1290, candidates_token_count=len(text) // 4,
+                                    total_token_count=1290 + len(text) // 4)
+            return SimpleNamespace(text=text, usage_metadata=usage)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+
+from util.config_reader import ConfigLoader
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile of a small sample (rounded to milliseconds), None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))], 3)
+
+
+class ModelHealth:
+    """Rolling outcome window and circuit breaker state of one model."""
+
+    def __init__(self, window: int) -> None:
+        self.outcomes: deque[tuple[bool, float]] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_started_at: float | None = None
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for ok, _ in self.outcomes if not ok) / len(self.outcomes)
+
+    def latencies(self) -> list[float]:
+        return [latency for ok, latency in self.outcomes if ok]
+
+
+class ModelRouter:
+    """
+    Orders Gemini models per request by health.
+    A model whose requests fail `failure_threshold` times in a row is taken out of rotation (circuit open);
+    after `cooldown_seconds` a single probe request is let through (half open) and decides whether it returns.
+    While every circuit is open, requests wait for a model at most `max_wait_seconds` (None = without limit).
+    """
+
+    def __init__(self, models: list[str], routing: str = "preference", failure_threshold: int = 3,
+                 cooldown_seconds: float = 60, window: int = 50, degraded_error_rate: float = 0.5,
+                 max_wait_seconds: float | None = None) -> None:
+        self.models = list(models)
+        self.routing = routing
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.degraded_error_rate = degraded_error_rate
+        self._health = {model: ModelHealth(window) for model in self.models}
+        self._lock = threading.Lock()
+        # Wakes requests waiting in candidates() when a probe finishes
+        self._changed = threading.Condition(self._lock)
+
+    def candidates(self, max_wait: float | None = None) -> list[str]:
+        """
+        Returns the models to try for the next request, best first.
+        A model due for a probe is put in front so the probe actually happens; open circuits are left out.
+        While every circuit is open (or its probe is still running), blocks until the earliest cooldown ends
+        or a result is recorded instead of returning nothing. Returns [] only after `max_wait` seconds
+        (default: the router's max_wait_seconds).
+        """
+        max_wait = self.max_wait_seconds if max_wait is None else max_wait
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+
+        with self._changed:
+            while True:
+                now = time.monotonic()
+                probes, allowed = [], []
+                for model in self.models:
+                    health = self._health[model]
+                    if health.state == OPEN and now - health.opened_at >= self.cooldown_seconds:
+                        health.state = HALF_OPEN
+                        health.probe_started_at = None
+                    if health.state == HALF_OPEN:
+                        probe_running = health.probe_started_at is not None and now - health.probe_started_at < self.cooldown_seconds
+                        if not probe_running:
+                            health.probe_started_at = now
+                            probes.append(model)
+                    elif health.state == CLOSED:
+                        allowed.append(model)
+
+                if probes or allowed or not self.models:
+                    allowed.sort(key=self._sort_key)
+                    return probes + allowed
+
+                wait = self._next_change(now)
+                if deadline is not None:
+                    if now >= deadline:
+                        return []
+                    wait = min(wait, deadline - now)
+                self._changed.wait(wait)
+
+    def _next_change(self, now: float) -> float:
+        """Seconds until the earliest open circuit may be probed or a running probe is considered lost."""
+        waits = []
+        for health in self._health.values():
+            if health.state == OPEN:
+                waits.append(self.cooldown_seconds - (now - health.opened_at))
+            elif health.state == HALF_OPEN and health.probe_started_at is not None:
+                waits.append(self.cooldown_seconds - (now - health.probe_started_at))
+        return max(0.0, min(waits, default=self.cooldown_seconds))
+
+    def _sort_key(self, model: str):
+        health = self._health[model]
+        degraded = health.error_rate() >= self.degraded_error_rate
+        preference = self.models.index(model)
+        if self.routing == "fastest":
+            p50 = _percentile(health.latencies(), 50)
+            return (degraded, p50 if p50 is not None else 0.0, preference)
+        return (degraded, preference)
+
+    def is_available(self, model: str) -> bool:
+        """False while the model's circuit is open."""
+        with self._lock:
+            return self._health[model].state != OPEN
+
+    def record_success(self, model: str, latency: float) -> None:
+        with self._lock:
+            health = self._health[model]
+            health.outcomes.append((True, latency))
+            health.consecutive_failures = 0
+            health.state = CLOSED
+            health.probe_started_at = None
+            self._changed.notify_all()
+
+    def record_failure(self, model: str, latency: float) -> None:
+        with self._lock:
+            health = self._health[model]
+            health.outcomes.append((False, latency))
+            health.consecutive_failures += 1
+            if health.state == HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+                health.state = OPEN
+                health.opened_at = time.monotonic()
+                health.probe_started_at = None
+            self._changed.notify_all()
+
+    def snapshot(self) -> dict[str, dict]:
+        """Returns the routing state per model: circuit state, error rate and latency percentiles."""
+        now = time.monotonic()
+        with self._lock:
+            snapshot = {}
+            for model in self.models:
+                health = self._health[model]
+                latencies = health.latencies()
+                snapshot[model] = {
+                    "state": health.state,
+                    "requests": len(health.outcomes),
+                    "error_rate": round(health.error_rate(), 3),
+                    "consecutive_failures": health.consecutive_failures,
+                    "latency_p50": _percentile(latencies, 50),
+                    "latency_p95": _percentile(latencies, 95),
+                    "reopens_in": max(0.0, round(self.cooldown_seconds - (now - health.opened_at), 1)) if health.state == OPEN else None,
+                }
+            return snapshot
+
+
+_routers: dict[tuple, ModelRouter] = {}
+
+
+def get_model_router(config_loader: ConfigLoader, models: list[str]) -> ModelRouter:
+    """Returns the process-wide router for the given model list, so health is kept across calls."""
+    key = tuple(models)
+    if key not in _routers:
+        settings = config_loader._config.get("GEMINI_SETTINGS", {})
+        _routers[key] = ModelRouter(
+            models,
+            routing=settings.get("ROUTING", "preference"),
+            failure_threshold=settings.get("CIRCUIT_FAILURE_THRESHOLD", 3),
+            cooldown_seconds=settings.get("CIRCUIT_COOLDOWN_SECONDS", 60),
+            window=settings.get("HEALTH_WINDOW", 50),
+            degraded_error_rate=settings.get("DEGRADED_ERROR_RATE", 0.5),
+            max_wait_seconds=settings.get("CIRCUIT_MAX_WAIT_SECONDS", 300) or None,
+        )
+    return _routers[key]
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def gemini_boxes_to_arrays(bounding_boxes: list, image_size: tuple[int, int]) -> tuple[np.ndarray, list[str], np.ndarray]:
+    """
+    Converts Gemini boxes ({"box_2d": [ymin, xmin, ymax, xmax], "label": ...} on a 0-1000 scale) in one vectorized step
+    to absolute [x1, y1, x2, y2] pixels, clamped to the image. Swapped corners are ordered, malformed entries dropped.
+    Returns (float boxes of shape (n, 4), labels, scores); Gemini sends no confidence, so scores default to 1.
+    """
+    entries = [bbox for bbox in bounding_boxes
+               if isinstance(bbox, dict) and isinstance(bbox.get("box_2d"), (list, tuple)) and len(bbox["box_2d"]) == 4]
+    if not entries:
+        return np.zeros((0, 4)), [], np.zeros(0, dtype=np.float32)
+
+    try:
+        normalized = np.asarray([bbox["box_2d"] for bbox in entries], dtype=np.float64)
+    except (TypeError, ValueError):
+        # Non-numeric coordinates somewhere: fall back to filtering entry by entry
+        entries = [bbox for bbox in entries if all(isinstance(value, (int, float)) for value in bbox["box_2d"])]
+        return gemini_boxes_to_arrays(entries, image_size)
+
+    width, height = image_size
+    # [ymin, xmin, ymax, xmax] -> [x1, y1, x2, y2]
+    boxes = normalized[:, [1, 0, 3, 2]] * np.array([width, height, width, height], dtype=np.float64) / 1000
+    boxes = np.concatenate([np.minimum(boxes[:, :2], boxes[:, 2:]), np.maximum(boxes[:, :2], boxes[:, 2:])], axis=1)
+    boxes = np.clip(boxes, 0, np.array([width, height, width, height], dtype=np.float64))
+
+    labels = [str(bbox.get("label", "")) for bbox in entries]
+    scores = np.asarray([_score(bbox.get("score")) for bbox in entries], dtype=np.float32)
+    return boxes, labels, scores
+
+
+def _score(value) -> float:
+    """A finite numeric (or numeric string) score as float; missing, null, boolean or malformed scores count as 1."""
+    if isinstance(value, bool):
+        return 1.0
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return 1.0
+    return score if np.isfinite(score) else 1.0
+
+
+def _pairwise_overlaps(boxes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the IoU matrix and the containment matrix (intersection / area of the row box)."""
+    top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    areas = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    union = areas[:, None] + areas[None, :] - intersection
+    iou = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    containment = np.divide(intersection, areas[:, None], out=np.zeros_like(intersection), where=areas[:, None] > 0)
+    return iou, containment
+
+
+def merge_overlapping_boxes(boxes: np.ndarray, labels: list[str], scores: np.ndarray, iou_threshold: float = 0.5,
+                            containment_threshold: float = 0.9) -> np.ndarray:
+    """
+    Greedy NMS over score, then area: a box is dropped if it overlaps a kept box by more than iou_threshold,
+    or lies to more than containment_threshold inside a kept box with the same label (a nested box of another
+    content type, e.g. an image inside a text block, is kept). Returns the indices of the kept boxes.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    iou, containment = _pairwise_overlaps(boxes)
+    label_ids = np.unique(np.asarray(labels, dtype=str), return_inverse=True)[1].reshape(-1)
+    same_label = label_ids[:, None] == label_ids[None, :]
+    duplicate = (iou > iou_threshold) | (same_label & (containment > containment_threshold))
+
+    areas = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    order = np.lexsort((-areas, -scores))
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for index in order:
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        suppressed |= duplicate[:, index]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess_gemini_boxes(bounding_boxes: list, image_size: tuple[int, int], iou_threshold: float = 0.5,
+                             containment_threshold: float = 0.9, min_side: int = 2) -> dict:
+    """
+    Box post-processing for one Gemini response: coordinate conversion, clamping, removal of boxes thinner than
+    min_side pixels and overlap merging. Returns {"boxes": [[x1, y1, x2, y2], ...], "labels": [...], "scores": [...]}
+    in reading order (top to bottom, left to right).
+    """
+    boxes, labels, scores = gemini_boxes_to_arrays(bounding_boxes, image_size)
+    sizes = boxes[:, 2:] - boxes[:, :2]
+    valid = np.flatnonzero((sizes >= min_side).all(axis=1))
+    boxes, labels, scores = boxes[valid], [labels[i] for i in valid], scores[valid]
+
+    keep = merge_overlapping_boxes(boxes, labels, scores, iou_threshold, containment_threshold)
+    keep = keep[np.lexsort((boxes[keep, 0], boxes[keep, 1]))]
+    return {
+        "boxes": boxes[keep].astype(np.int64).tolist(),
+        "labels": [labels[i] for i in keep],
+        "scores": [round(float(score), 4) for score in scores[keep]],
+    }
@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    `acquire` blocks until enough tokens are available; `adjust` books corrections after the fact.
+    clock and sleep can be replaced, e.g. by a fake clock in tests.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep) -> None:
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Takes `amount` tokens (capped at capacity), waiting as long as needed. Returns the time waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate_per_second
+            self._sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """Removes (positive) or returns (negative) tokens without waiting; the balance may go negative."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class ModelRateLimiter:
+    """Keeps one requests-per-minute and one tokens-per-minute bucket per model (on the given clock, see TokenBucket)."""
+
+    def __init__(self, limits: dict[str, dict], default_rpm: float = 60, default_tpm: float = 1_000_000,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep) -> None:
+        self._limits = limits
+        self._default_rpm = default_rpm
+        self._default_tpm = default_tpm
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets: dict[str, tuple[TokenBucket, TokenBucket]] = {}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, model: str) -> tuple[TokenBucket, TokenBucket]:
+        with self._lock:
+            if model not in self._buckets:
+                limits = self._limits.get(model, {})
+                self._buckets[model] = (
+                    TokenBucket(limits.get("RPM", self._default_rpm), clock=self._clock, sleep=self._sleep),
+                    TokenBucket(limits.get("TPM", self._default_tpm), clock=self._clock, sleep=self._sleep),
+                )
+            return self._buckets[model]
+
+    def acquire(self, model: str, tokens: int) -> float:
+        """Blocks until one request with an estimated `tokens` cost may be sent to `model`."""
+        requests, token_bucket = self._buckets_for(model)
+        return requests.acquire(1) + token_bucket.acquire(tokens)
+
+    def record_usage(self, model: str, estimated_tokens: int, actual_tokens: int | None) -> None:
+        """Books the difference between the estimated and the reported token usage."""
+        if actual_tokens is None:
+            return
+        self._buckets_for(model)[1].adjust(actual_tokens - estimated_tokens)
+
+
+def error_status_code(error: Exception) -> int | None:
+    """Returns the HTTP status of an API error (google.genai APIError or compatible), otherwise None."""
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(status_code: int | None) -> bool:
+    """Request timeouts (408), throttling (429) and server errors (5xx) are worth retrying."""
+    return status_code is not None and (status_code in (408, 429) or status_code >= 500)
+
+
+def is_timeout(error: Exception) -> bool:
+    """True for timeouts raised below the API client (e.g. httpx.TimeoutException), which carry no HTTP status."""
+    return isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
+
+
+def backoff_delay(attempt: int, base: float = 1.0, maximum: float = 30.0) -> float:
+    """Exponential backoff with full jitter for the given 0-based attempt."""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def map_in_order(fn: Callable[[T], R], items: Iterable[T], max_in_flight: int = 1) -> list[R]:
+    """
+    Applies fn to every item with up to `max_in_flight` calls running concurrently.
+    Results are returned in input order, regardless of completion order.
+    """
+    items = list(items)
+    if max_in_flight <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(items))) as executor:
+        futures = [executor.submit(fn, item) for item in items]
+        return [future.result() for future in futures]
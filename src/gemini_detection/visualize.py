@@ -1,49 +1,196 @@
 from PIL import Image, ImageDraw
-import json
 import os
+from typing import Iterable
+from loguru import logger
+from util.config_reader import ConfigLoader
+from util.cache_store import get_transformation_cache
+from util.detection_io import iter_saved_boxes, move_files, page_key, read_page_boxes
+from util.page import Page
+from util.page_writer import PAGE_EXTENSIONS
+from util import metrics
 
+PREVIEW_FORMATS = {"png": ("PNG", ".png"), "jpeg": ("JPEG", ".jpg"), "webp": ("WEBP", ".webp")}
 
-def visualize_bounding_boxes(image_dir, boxes_dir, output_dir=None, show=True):
+
+def _is_up_to_date(output_path: str, *input_paths: str, since: float = 0.0) -> bool:
+    """True if output_path exists and is newer than every input and than since (e.g. when the boxes were saved)."""
+    if not os.path.exists(output_path):
+        return False
+    output_mtime = os.stat(output_path).st_mtime
+    return since <= output_mtime and all(os.stat(path).st_mtime <= output_mtime for path in input_paths)
+
+
+def _draw_boxes(image: Image.Image, boxes: list, output_path: str, preview_max_side: int | None, preview_format: str,
+                full_width: int | None = None) -> str:
+    """Draws the boxes (full-resolution pixel coordinates) onto an optionally downscaled copy and saves it."""
+    with metrics.span("render", format=preview_format):
+        return _draw_and_save(image, boxes, output_path, preview_max_side, preview_format, full_width)
+
+
+def _draw_and_save(image: Image.Image, boxes: list, output_path: str, preview_max_side: int | None, preview_format: str,
+                   full_width: int | None) -> str:
+    full_width = full_width or image.size[0]
+    image = image.convert("RGB")
+    if preview_max_side:
+        image.thumbnail((preview_max_side, preview_max_side))
+    scale = image.size[0] / full_width
+
+    draw = ImageDraw.Draw(image)
+
+    # Draw each bounding box
+    for box in boxes:
+        x1, y1, x2, y2 = (coordinate * scale for coordinate in box[:4])
+        draw.rectangle([x1, y1, x2, y2], outline="red", width=max(1, round(3 * scale)))
+
+    # Write next to the target and swap in, so an interrupted run never leaves a fresh-looking partial file
+    fmt = PREVIEW_FORMATS[preview_format][0]
+    tmp_path = f"{output_path}.part"
+    image.save(tmp_path, fmt, **({"quality": 85} if fmt in ("JPEG", "WEBP") else {"compress_level": 1}))
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _image_index(image_dir: str | None, config_loader: ConfigLoader | None) -> dict[str, str]:
+    """Maps page keys (document/page) to page images, from the conversion cache and/or a single image directory."""
+    index = {}
+    if config_loader is not None:
+        for image_path, _ in get_transformation_cache(config_loader).items():
+            index[page_key(image_path)] = image_path
+    if image_dir and os.path.isdir(image_dir):
+        for file_name in os.listdir(image_dir):
+            if file_name.endswith(PAGE_EXTENSIONS):
+                image_path = os.path.join(image_dir, file_name)
+                index.setdefault(page_key(image_path), image_path)
+                # Legacy flat detection layout: boxes files without document folder
+                index.setdefault(os.path.splitext(file_name)[0], image_path)
+    return index
+
+
+def visualization_path(image_path: str, output_dir: str, preview_format: str = "png") -> str:
+    """Returns output_dir/<document>/<page>_visualized.<ext> for a page image."""
+    return os.path.join(output_dir, f"{page_key(image_path)}_visualized{PREVIEW_FORMATS[preview_format][1]}")
+
+
+def rename_visualizations(document: str, output_dir: str, renames: dict[str, str], removed: Iterable[str] = ()) -> None:
+    """Renames the visualizations of renumbered pages (old page name -> new page name) and deletes those of removed pages."""
+    folder = os.path.join(output_dir, document)
+    for _, extension in PREVIEW_FORMATS.values():
+        move_files({os.path.join(folder, f"{old}_visualized{extension}"): os.path.join(folder, f"{new}_visualized{extension}")
+                    for old, new in renames.items()})
+        for page in removed:
+            path = os.path.join(folder, f"{page}_visualized{extension}")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def is_page_done(image_path: str, boxes_dir: str, output_dir: str, preview_format: str = "png") -> bool:
+    """True if the saved boxes of a page are newer than its image and its visualization is newer than both."""
+    record = read_page_boxes(image_path, boxes_dir)
+    return (record is not None and os.stat(image_path).st_mtime <= record["written"]
+            and _is_up_to_date(visualization_path(image_path, output_dir, preview_format), since=record["written"]))
+
+
+def visualize_page(page: Page, boxes: list, output_dir: str, preview_max_side: int | None = None,
+                   preview_format: str = "png", boxes_dir: str | None = None, force: bool = False) -> str:
+    """
+    Renders one in-memory page with its boxes to output_dir/<document>/<page>_visualized.<ext> (pipeline stage).
+    Skipped if the output is newer than the page image and (with boxes_dir) its saved boxes, unless force.
+    """
+    output_path = visualization_path(page.image_path, output_dir, preview_format)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    record = read_page_boxes(page.image_path, boxes_dir) if boxes_dir else None
+    since = record["written"] if record else 0.0
+    if not force and _is_up_to_date(output_path, page.wait_written(), since=since):
+        return output_path
+    return _draw_boxes(page.image, boxes, output_path, preview_max_side, preview_format)
+
+
+def _visualize_file(image_path: str, boxes: list, output_dir: str, preview_max_side: int | None, preview_format: str) -> str:
+    """Process pool task: renders one page from its image file (already known to be out of date)."""
+    page = Page(image_path)
+    try:
+        return visualize_page(page, boxes, output_dir, preview_max_side, preview_format, force=True)
+    finally:
+        page.release()
+
+
+def visualize_bounding_boxes(image_dir=None, boxes_dir="data/detections", output_dir=None, show=True,
+                             pages: list[Page] | None = None, config_loader: ConfigLoader | None = None,
+                             workers: int | None = None, preview_max_side: int | None = None,
+                             preview_format: str = "png", force: bool = False):
     """
-    Draws bounding boxes on images based on JSON detection files.
+    Draws bounding boxes on images based on the saved detections (one JSON Lines file per document, read in one go).
+    Page images of all documents are resolved through the conversion cache (config_loader) and/or image_dir.
+    Renders incrementally: outputs newer than both the page image and its saved boxes are skipped (unless force).
+    Rendering runs on a process pool; preview_max_side draws on a downscaled copy, saved as preview_format.
+    Pages that are still in memory (pages) are drawn without re-opening their image file.
     Optionally saves and/or displays the visualized images.
     """
     results = {}
     os.makedirs(output_dir, exist_ok=True) if output_dir else None
+    pages_by_key = {page_key(page.image_path): page for page in pages or []}
+    image_index = _image_index(image_dir, config_loader)
+
+    file_tasks, memory_tasks, skipped = [], [], 0
 
-    # Iterate through all JSON detection files
-    for file_name in os.listdir(boxes_dir):
-        if not file_name.endswith("_boxes.json"):
+    # Iterate through all saved detections, document by document
+    for key, record in iter_saved_boxes(boxes_dir):
+        boxes = record["boxes"]
+        page = pages_by_key.get(key)
+        image_path = page.image_path if page else image_index.get(key)
+
+        if page is None and (image_path is None or not os.path.exists(image_path)):
+            logger.warning(f"⚠️ Kein passendes Bild gefunden für {key}")
             continue
 
-        base_name = file_name.replace("_boxes.json", "")
-        image_path = os.path.join(image_dir, f"{base_name}.png")
+        if not output_dir:
+            memory_tasks.append((key, page or Page(image_path), boxes, None))
+            continue
 
-        print(f"Lade Bild: {image_path}")
-        if not os.path.exists(image_path):
-            print(f"⚠️ Kein passendes Bild gefunden für {file_name}")
+        output_path = visualization_path(image_path, output_dir, preview_format)
+        if not force and _is_up_to_date(output_path, image_path, since=record["written"]):
+            skipped += 1
+            results[key] = output_path
             continue
 
-        # Load bounding boxes from JSON
-        json_path = os.path.join(boxes_dir, file_name)
-        with open(json_path, "r", encoding="utf-8") as f:
-            boxes = json.load(f)
+        if page is not None:
+            memory_tasks.append((key, page, boxes, output_path))
+        else:
+            file_tasks.append((key, image_path, boxes))
+
+    # In-memory pages are drawn right here, files are rendered on the process pool; both through visualize_page
+    for key, page, boxes, output_path in memory_tasks:
+        if output_path:
+            results[key] = visualize_page(page, boxes, output_dir, preview_max_side, preview_format, force=True)
+        elif show:
+            image = page.image.convert("RGB")
+            draw = ImageDraw.Draw(image)
+            for box in boxes:
+                draw.rectangle(box[:4], outline="red", width=3)
+            image.show(title=key)
 
-        image = Image.open(image_path).convert("RGB")
-        draw = ImageDraw.Draw(image)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(file_tasks) <= 1:
+        for key, *task in file_tasks:
+            results[key] = _visualize_file(*task, output_dir, preview_max_side, preview_format)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
 
-        # Draw each bounding box
-        for box in boxes:
-            x1, y1, x2, y2 = box
-            draw.rectangle([x1, y1, x2, y2], outline="red", width=3)
+        with ProcessPoolExecutor(max_workers=min(workers, len(file_tasks))) as executor:
+            futures = {key: executor.submit(_visualize_file, *task, output_dir, preview_max_side, preview_format)
+                       for key, *task in file_tasks}
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    logger.error(f"❌ Visualisierung fehlgeschlagen für {key}: {e}")
 
-        if output_dir:
-            output_path = os.path.join(output_dir, f"{base_name}_visualized.png")
-            image.save(output_path)
-            results[base_name] = output_path
-            print(f"💾 Visualisiertes Bild gespeichert unter: {output_path}")
+    rendered = len(file_tasks) + sum(1 for task in memory_tasks if task[3])
+    logger.info(f"💾 Visualisierungen: {rendered} neu gerendert, {skipped} aktuell (übersprungen)")
 
-        if show:
-            image.show(title=base_name)
+    if show and output_dir:
+        for output_path in results.values():
+            Image.open(output_path).show(title=os.path.basename(output_path))
 
     return results
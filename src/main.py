@@ -1,41 +1,290 @@
-from util.pdf_helper import pdfs_to_images, cache_image_creation, load_cached_pdfs
+import time
+
+# Taken before the remaining imports so the startup report includes them
+_STARTED = time.perf_counter()
+
+from util.pdf_helper import iter_page_range, plan_page_ranges, plan_page_updates
 from util.ollama_checker import check_ollama_and_models
-from gemini_detection.detect import detect_logical_blocks_with_gemini
-from gemini_detection.visualize import visualize_bounding_boxes
+from util.cache_store import get_transformation_cache
+from util.detection_io import page_key, rename_pages
+from util.page import Page
+from util.page_writer import PageWriter
+from util.pipeline import Pipeline, Stage
+from util import metrics
+from gemini_detection.visualize import is_page_done, rename_visualizations, visualize_page
 from util.config_reader import ConfigLoader
+from loguru import logger
+import argparse
 import os
+import threading
+
+
+def detection_backend(config_loader: ConfigLoader, output_dir: str, gemini_client=None):
+    """
+    Creates the detector of the configured backend. Returns (detect_batch, batch_size, workers, log_summary):
+    detect_batch(pages) saves and returns [(page, boxes or None)], batches hold up to batch_size pages and
+    workers batches may run at once; log_summary logs the backend's own summary after a run.
+    With TEXT_LAYER.ENABLED, pages of born-digital PDFs get their text blocks from the PDF's text layer instead.
+    """
+    from util.text_layer import get_text_layer_analyzer
+
+    detect_batch, batch_size, workers, log_summary = _detector(config_loader, output_dir, gemini_client)
+    text_layer = get_text_layer_analyzer(config_loader)
+    if text_layer is None:
+        return detect_batch, batch_size, workers, log_summary
+
+    def detect_with_text_layer(pages: list[Page]) -> list[tuple[Page, list | None]]:
+        # Only pages without a usable text layer reach the detector; the order of the batch is kept
+        results = [(page, text_layer.detect_page(page, output_dir)) for page in pages]
+        remaining = [page for page, boxes in results if boxes is None]
+        detected = iter(detect_batch(remaining) if remaining else [])
+        return [(page, boxes) if boxes is not None else next(detected) for page, boxes in results]
+
+    def log_summaries() -> None:
+        text_layer.log_summary()
+        log_summary()
+
+    return detect_with_text_layer, batch_size, workers, log_summaries
+
+
+def _detector(config_loader: ConfigLoader, output_dir: str, gemini_client=None):
+    """Creates the ML detector of the configured backend (see detection_backend)."""
+    config = config_loader.view()
+    backend = config.get("DETECTION_BACKEND", "gemini")
+
+    if backend in ("yolo", "onnx"):
+        # Local models are fed in batches by a single worker
+        if backend == "yolo":
+            from detection_ai.detector import get_yolo_detector
+            detector = get_yolo_detector(config_loader)
+        else:
+            from detection_ai.onnx_runner import get_onnx_detector
+            detector = get_onnx_detector(config_loader)
+
+        def detect_batch(pages: list[Page]) -> list[tuple[Page, list | None]]:
+            results = detector.detect_to_json(pages, output_dir)
+            return [(page, results.get(page_key(page.image_path))) for page in pages]
+
+        return detect_batch, detector.batch_size, 1, lambda: None
+
+    # Gemini API: one page per request, one worker thread per request in flight, rate limited per model
+    from gemini_detection.detect import GeminiBlockDetector
+    detector = GeminiBlockDetector(output_dir, config_loader, gemini_client)
+    return (lambda pages: [(page, detector.detect_page(page)) for page in pages]), 1, detector.max_in_flight, detector.log_summary
+
+
+def _detection_stage(config_loader: ConfigLoader, output_dir: str, queue_size: int, batch_timeout: float, gemini_client=None):
+    """
+    Builds the detection stage for the configured backend; every item becomes (page, boxes or None).
+    Returns (stage, callback logging the backend's own summary after the run).
+    """
+    detect_batch, batch_size, workers, log_summary = detection_backend(config_loader, output_dir, gemini_client)
+    if batch_size > 1:
+        stage = Stage("detect", detect_batch, workers=workers, queue_size=max(queue_size, batch_size),
+                      batch_size=batch_size, batch_timeout=batch_timeout)
+    else:
+        stage = Stage("detect", lambda page: detect_batch([page])[0], workers=workers, queue_size=queue_size)
+    return stage, log_summary
+
+
+def renumber_outputs(config_loader: ConfigLoader, detections_dir: str, visualizations_dir: str, flashcards_dir: str | None):
+    """Returns the callback moving boxes, visualizations, flashcards, page rasters and page fingerprints of renumbered pages."""
+    config = config_loader.view()
+
+    def renumber(document: str, renames: dict[str, str], removed: list[str]) -> None:
+        rename_pages(document, detections_dir, renames, removed)
+        rename_visualizations(document, visualizations_dir, renames, removed)
+        cards_dir = flashcards_dir or config.get("FLASHCARDS_OUTPUT_DIR", "data/flashcards/")
+        if os.path.isdir(cards_dir):
+            from flashcards.generate import CardWriter
+            CardWriter(cards_dir).rename_pages(document, renames, removed)
+        # numpy (via util.crops) is only imported once pages are actually renumbered
+        from util.crops import RasterCache
+        RasterCache.from_settings(config).rename_pages(document, renames, removed)
+        from util.page_similarity import get_page_similarity_index
+        index = get_page_similarity_index(config_loader)
+        if index is not None:
+            index.rename_pages({f"{document}/{old}": f"{document}/{new}" for old, new in renames.items()},
+                               [f"{document}/{page}" for page in removed])
+
+    return renumber
+
+
+def run_pipeline(config_loader: ConfigLoader, pdf_files: set[str], page_limit: int = 0, processed_dir: str = "data/processed",
+                 detections_dir: str = "data/detections", visualizations_dir: str = "data/visualizations",
+                 gemini_client=None, force: bool = False, flashcards_dir: str | None = None,
+                 ollama_client=None) -> Pipeline | None:
+    """
+    Rasterizes, detects, postprocesses and visualizes the given PDFs as one overlapped pipeline and returns it
+    (with its per-stage statistics). A gemini_client can be injected, e.g. a FakeGeminiClient for benchmarks.
+    With FLASHCARDS.ENABLED a card generation stage on the local Ollama model (ollama_client) runs before visualizing.
+    Cached pages whose boxes and visualization are up to date are skipped unless force; returns None if nothing is left.
+    Of a changed PDF only pages with changed content are rasterized again; renumbered pages keep their results.
+    """
+    config = config_loader.view()
+    flashcards = None
+    if config.get("FLASHCARDS_ENABLED", False):
+        from flashcards.generate import FlashcardGenerator
+        flashcards = FlashcardGenerator(config_loader, flashcards_dir, ollama_client)
+
+    # A limited run converts documents only partially, so they must not be recorded as up to date
+    use_cache = config.get("PROCESS_SETTINGS_CACHE_PDF_TO_IMAGE_CREATION", False) and not page_limit
+
+    # If caching is enabled, only pages whose content changed are rasterized again (renumbered pages are renamed);
+    # the other cached pages enter the pipeline directly, without rasterizing
+    cached_pages = []
+    page_plans = {}
+    if config.get("PROCESS_SETTINGS_CACHE_PDF_TO_IMAGE_CREATION", False):
+        page_plans = plan_page_updates(set(pdf_files), config_loader,
+                                       renumber_outputs(config_loader, detections_dir, visualizations_dir, flashcards_dir))
+        pdf_files = set(page_plans)
+        cache = get_transformation_cache(config_loader)
+        cached_pages = [
+            Page(image_path, pdf_file, page_number)
+            for pdf_file in sorted({pdf_file for _, pdf_file in cache.items()})
+            for image_path, page_number, _ in cache.pages_for_pdf(pdf_file)
+            if os.path.exists(image_path) and not (
+                pdf_file in page_plans and (page_plans[pdf_file]["pages"] is None or page_number in page_plans[pdf_file]["pages"]))
+        ]
+    preview_format = config.get("VISUALIZATION_PREVIEW_FORMAT", "png")
+    if not force:
+        cached_pages = [page for page in cached_pages
+                        if not is_page_done(page.image_path, detections_dir, visualizations_dir, preview_format)
+                        or (flashcards is not None and not flashcards.has_cards(page))]
+
+    if not pdf_files and not cached_pages:
+        logger.info("✅ Everything is up to date, nothing to process.")
+        return None
+    if flashcards is not None and not page_limit:
+        # One rewrite per cards file up front instead of one per page; a limited run may not reach every page
+        flashcards.drop_cards(cached_pages, force)
+
+    # Plan page ranges of the PDFs to convert
+    raster_tasks = plan_page_ranges(
+        pdf_files,
+        processed_dir,
+        pages_per_task=config.get("PROCESS_SETTINGS_RASTER_PAGES_PER_TASK", 16),
+        page_window=config.get("PROCESS_SETTINGS_PDF_TO_IMAGE_PAGE_WINDOW", 4),
+        pages={pdf_file: plan["pages"] for pdf_file, plan in page_plans.items()},
+    )
+
+    queue_size = config.get("PIPELINE_QUEUE_SIZE", 4)
+    batch_timeout = config.get("PIPELINE_BATCH_TIMEOUT_SECONDS", 0.5)
+    preview_max_side = config.get("VISUALIZATION_PREVIEW_MAX_SIDE", 0) or None
+
+    with PageWriter.from_settings(config) as writer:
+        def rasterize(item):
+            # Cached pages pass through, page range tasks are rasterized with the images kept in memory
+            return [item] if isinstance(item, Page) else iter_page_range(item, writer)
+
+        def postprocess(item):
+            page, boxes = item
+            if use_cache and page.written is not None:
+                # Stored with the page's fingerprint, so the page counts as up to date until its content changes
+                fingerprints = page_plans.get(page.pdf_file, {}).get("fingerprints") or []
+                fingerprint = fingerprints[page.page_number - 1] if page.page_number and page.page_number <= len(fingerprints) else None
+                get_transformation_cache(config_loader).put_many([(page.wait_written(), page.pdf_file, page.page_number, fingerprint)])
+            if boxes is None:
+                page.release()
+                return None
+            return item
+
+        def generate_cards(item):
+            page, boxes = item
+            flashcards.generate_page(page, boxes, force)
+            return item
+
+        def visualize(item):
+            page, boxes = item
+            try:
+                return visualize_page(page, boxes, visualizations_dir, preview_max_side, preview_format, detections_dir)
+            finally:
+                page.release()
+
+        detect_stage, log_detection_summary = _detection_stage(config_loader, detections_dir, queue_size, batch_timeout, gemini_client)
+        card_stages = []
+        if flashcards is not None:
+            card_stages = [Stage("cards", generate_cards, workers=flashcards.max_in_flight, queue_size=queue_size)]
+            # Loads the model while the first pages are rasterized and detected
+            threading.Thread(target=flashcards.warm_up, name="ollama-warm-up", daemon=True).start()
+
+        pipeline = Pipeline([
+            Stage("rasterize", rasterize, workers=config.get("PROCESS_SETTINGS_RASTER_WORKERS", 0) or os.cpu_count() or 1,
+                  queue_size=queue_size, fan_out=True, limit=page_limit),
+            detect_stage,
+            Stage("postprocess", postprocess, workers=config.get("PIPELINE_POSTPROCESS_WORKERS", 1), queue_size=queue_size),
+            *card_stages,
+            Stage("visualize", visualize, workers=config.get("VISUALIZATION_WORKERS", 0) or os.cpu_count() or 1,
+                  queue_size=queue_size),
+        ])
+        # New documents first, so a page limit is spent on them rather than on already converted pages
+        pipeline.run(raster_tasks + cached_pages)
+        for task, produced, error in pipeline.stats["rasterize"].failed:
+            if not isinstance(task, Page):
+                # Pages of a range are produced in order, so the failure lost the rest of the range
+                pdf_file, _, _, first_page, last_page, _ = task
+                logger.error(f"❌ {pdf_file}: pages {first_page + produced}-{last_page} not converted: {error}")
+        log_detection_summary()
+        if flashcards is not None:
+            flashcards.log_summary()
+
+    return pipeline
 
-# Initialize configuration loader and retrieve config as dictionary
-config_loader = ConfigLoader()
-config = config_loader.to_dict()
 
-# Verify that required Ollama models are installed
-models_to_check = config.get("CHAT_MODELS_MODELS", [])
-check_ollama_and_models(models_to_check)
+def main():
+    parser = argparse.ArgumentParser(description="Rasterizes, detects and visualizes the PDFs in data/to_process.")
+    parser.add_argument("--page-limit", type=int, default=None,
+                        help="process at most this many pages (default: PIPELINE.PAGE_LIMIT, 0 = all pages)")
+    parser.add_argument("--force", action="store_true", help="re-run detection, visualization and card generation of up-to-date pages")
+    parser.add_argument("--visualize-only", action="store_true",
+                        help="only (re-)render the visualizations of the saved detections of all converted documents")
+    args = parser.parse_args()
+    phases = {"imports": time.perf_counter() - _STARTED}
 
-# Identify PDF files to process in the data directory
-pdf_files = [os.path.join("data/to_process", f) for f in os.listdir("data/to_process") if f.lower().endswith(".pdf")]
+    # Initialize configuration loader and retrieve the (read-only) flattened config
+    started = time.perf_counter()
+    config_loader = ConfigLoader()
+    config = config_loader.view()
+    phases["config"] = time.perf_counter() - started
 
-# If caching is enabled, filter out PDFs that have already been processed and are up-to-date
-if config.get("PROCESS_SETTINGS_CACHE_PDF_TO_IMAGE_CREATION", False):
-    pdf_files = load_cached_pdfs(set(pdf_files), config_loader)
+    # Verify that required Ollama models are installed (one HTTP request, cached for OLLAMA.TAGS_CACHE_TTL_SECONDS)
+    started = time.perf_counter()
+    models_to_check = config.get("CHAT_MODELS_MODELS", [])
+    check_ollama_and_models(
+        models_to_check,
+        host=config.get("OLLAMA_HOST") or None,
+        timeout=config.get("OLLAMA_TIMEOUT_SECONDS", 2.0),
+        cache_path=config.get("OLLAMA_TAGS_CACHE_FILE"),
+        ttl_seconds=config.get("OLLAMA_TAGS_CACHE_TTL_SECONDS", 300),
+    )
+    phases["ollama_check"] = time.perf_counter() - started
 
-# Convert PDFs to images and handle caching if enabled
-images = (pdfs_to_images(pdf_files, "data/processed"))
-if config.get("PROCESS_SETTINGS_CACHE_PDF_TO_IMAGE_CREATION", False):
-    cache_image_creation(images, config_loader)
-    # Load all cached images for processing
-    images = [img_path for img_path, _ in config_loader._config.get("CACHE", {}).get("CONVERTED_IMAGES", {}).items()]
+    # Identify PDF files to process in the data directory
+    pdf_files = {os.path.join("data/to_process", f) for f in os.listdir("data/to_process") if f.lower().endswith(".pdf")}
 
-# Detect logical blocks in images using Gemini API (test_mode limits to first 3 images)
-print(detect_logical_blocks_with_gemini(images, "data/detections", config_loader, test_mode=True))
+    page_limit = args.page_limit if args.page_limit is not None else config.get("PIPELINE_PAGE_LIMIT", 0)
+    metrics.configure(config)
+    try:
+        started = time.perf_counter()
+        if args.visualize_only:
+            from gemini_detection.visualize import visualize_bounding_boxes
 
-# Visualize detected bounding boxes on the images
-visualize_bounding_boxes(
-    image_dir="data/processed/Analysis",
-    boxes_dir="data/detections",
-    output_dir="data/visualizations",
-    show=False
-)
+            visualize_bounding_boxes(boxes_dir="data/detections", output_dir="data/visualizations", show=False,
+                                     config_loader=config_loader, workers=config.get("VISUALIZATION_WORKERS", 0) or None,
+                                     preview_max_side=config.get("VISUALIZATION_PREVIEW_MAX_SIDE", 0) or None,
+                                     preview_format=config.get("VISUALIZATION_PREVIEW_FORMAT", "png"), force=args.force)
+            phases["visualize"] = time.perf_counter() - started
+        else:
+            run_pipeline(config_loader, pdf_files, page_limit, force=args.force)
+            phases["pipeline"] = time.perf_counter() - started
+    finally:
+        phases["total"] = time.perf_counter() - _STARTED
+        logger.info("⏱️  Startup report: " + ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in phases.items()))
+        for phase, seconds in phases.items():
+            metrics.observe("startup_phase", seconds, phase=phase)
+        metrics.export(config)
 
 
+if __name__ == "__main__":
+    # The guard keeps spawned worker processes that import this module from re-running the pipeline
+    main()
@@ -0,0 +1,351 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+import toml
+from loguru import logger
+from util.config_reader import ConfigLoader
+from util import metrics
+
+
+def connect_sqlite(path: str, journal_mode: str = "WAL") -> sqlite3.Connection:
+    """
+    Opens a SQLite database in WAL mode; every commit is atomic and survives process crashes.
+    WAL needs all processes on one host; databases shared over a network filesystem use journal_mode "DELETE".
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # isolation_level=None: transactions are controlled explicitly via BEGIN/COMMIT
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    connection.execute(f"PRAGMA journal_mode={journal_mode}")
+    connection.execute("PRAGMA synchronous=NORMAL" if journal_mode.upper() == "WAL" else "PRAGMA synchronous=FULL")
+    return connection
+
+
+class SqliteStore:
+    """Base class for the SQLite-backed stores: one shared connection, guarded by a lock."""
+
+    def __init__(self, path: str, journal_mode: str = "WAL") -> None:
+        self._path = path
+        self._lock = threading.RLock()
+        self._connection = connect_sqlite(path, journal_mode)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs the enclosed statements in one write transaction (all or nothing)."""
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            else:
+                self._connection.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class TransformationCache(SqliteStore):
+    """
+    Indexed store for the image -> PDF mappings created by the PDF conversion.
+    Lookups are primary-key reads, writes are batched into a single transaction.
+    Each image also records its page number and the fingerprint of the PDF page it was rasterized from,
+    and every PDF its current page fingerprints (pdf_files), so a changed PDF is re-rasterized page by page.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Opens (and if needed creates) the cache database at path."""
+        super().__init__(path)
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS converted_images ("
+                " image_path TEXT PRIMARY KEY,"
+                " pdf_path TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS converted_images_pdf ON converted_images (pdf_path)")
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(converted_images)")}
+            # Databases created before page fingerprints get the columns added (NULL for existing rows)
+            if "page_number" not in columns:
+                connection.execute("ALTER TABLE converted_images ADD COLUMN page_number INTEGER")
+            if "fingerprint" not in columns:
+                connection.execute("ALTER TABLE converted_images ADD COLUMN fingerprint TEXT")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS pdf_files ("
+                " pdf_path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " fingerprints TEXT NOT NULL)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def get(self, image_path: str) -> str | None:
+        """Returns the source PDF of a cached image, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT pdf_path FROM converted_images WHERE image_path = ?", (image_path,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def images_for_pdf(self, pdf_path: str) -> list[str]:
+        """Returns all cached images of one PDF, ordered by path."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT image_path FROM converted_images WHERE pdf_path = ? ORDER BY image_path", (pdf_path,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def items(self) -> list[tuple[str, str]]:
+        """Returns all (image_path, pdf_path) pairs, ordered by image path."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT image_path, pdf_path FROM converted_images ORDER BY image_path"
+            ).fetchall()
+
+    def pages_for_pdf(self, pdf_path: str) -> list[tuple[str, int | None, str | None]]:
+        """Returns (image_path, page_number, fingerprint) of all cached images of one PDF, ordered by path."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT image_path, page_number, fingerprint FROM converted_images WHERE pdf_path = ? ORDER BY image_path",
+                (pdf_path,),
+            ).fetchall()
+
+    def put_many(self, image_paths: Iterable[tuple]) -> int:
+        """
+        Inserts or replaces (image_path, pdf_path) or (image_path, pdf_path, page_number, fingerprint) rows
+        in one transaction.
+        """
+        now = time.time()
+        rows = [(image_path, pdf_path, *(rest or (None, None)), now) for image_path, pdf_path, *rest in image_paths]
+        with metrics.span("transformation_cache_write"), self.transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO converted_images (image_path, pdf_path, page_number, fingerprint, created_at)"
+                " VALUES (?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def move_pages(self, moves: list[tuple[str, str, int]], removed: Iterable[str] = ()) -> None:
+        """
+        Renumbers cached images in one transaction: every (old image_path, new image_path, new page_number) keeps
+        its PDF and fingerprint; rows previously stored under a new path and the removed paths are dropped.
+        """
+        with self.transaction() as connection:
+            sources = {}
+            for old_path, _, _ in moves:
+                row = connection.execute(
+                    "SELECT pdf_path, fingerprint, created_at FROM converted_images WHERE image_path = ?", (old_path,)
+                ).fetchone()
+                if row is not None:
+                    sources[old_path] = row
+            connection.executemany(
+                "DELETE FROM converted_images WHERE image_path = ?",
+                [(path,) for old_path, new_path, _ in moves for path in (old_path, new_path)] + [(path,) for path in removed],
+            )
+            connection.executemany(
+                "INSERT INTO converted_images (image_path, pdf_path, page_number, fingerprint, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(new_path, sources[old_path][0], page_number, sources[old_path][1], sources[old_path][2])
+                 for old_path, new_path, page_number in moves if old_path in sources],
+            )
+
+    def pdf_fingerprints(self, pdf_path: str, size: int, mtime_ns: int) -> list[str] | None:
+        """Returns the page fingerprints stored for a PDF if the file still has the given size and mtime, else None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT fingerprints FROM pdf_files WHERE pdf_path = ? AND size = ? AND mtime_ns = ?", (pdf_path, size, mtime_ns)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_pdf_fingerprints(self, pdf_path: str, size: int, mtime_ns: int, fingerprints: list[str]) -> None:
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO pdf_files (pdf_path, size, mtime_ns, fingerprints) VALUES (?, ?, ?, ?)",
+                (pdf_path, size, mtime_ns, json.dumps(fingerprints)),
+            )
+
+    def delete_many(self, image_paths: Iterable[str]) -> None:
+        """Removes cached images in one transaction."""
+        with self.transaction() as connection:
+            connection.executemany("DELETE FROM converted_images WHERE image_path = ?", [(p,) for p in image_paths])
+
+    def delete_pdfs(self, pdf_paths: Iterable[str]) -> None:
+        """Forgets the page fingerprints of PDFs that no longer exist."""
+        with self.transaction() as connection:
+            connection.executemany("DELETE FROM pdf_files WHERE pdf_path = ?", [(p,) for p in pdf_paths])
+
+    def migrate_from_toml(self, toml_path: str) -> int:
+        """
+        One-time import of the legacy TOML cache ([CONVERTED_IMAGES] table).
+        The import is recorded in the database, so later calls are no-ops.
+        """
+        marker = f"migrated:{os.path.abspath(toml_path)}"
+        with self._lock:
+            if self._connection.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                return 0
+        if not os.path.exists(toml_path):
+            return 0
+
+        with open(toml_path, "r", encoding="utf-8") as file:
+            legacy = toml.load(file).get("CONVERTED_IMAGES", {})
+
+        now = time.time()
+        with self.transaction() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO converted_images (image_path, pdf_path, created_at) VALUES (?, ?, ?)",
+                [(image_path, pdf_path, now) for image_path, pdf_path in legacy.items()],
+            )
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (marker, str(now)))
+
+        logger.info(f"✅ Migrated {len(legacy)} cached images from {toml_path} to {self._path}")
+        return len(legacy)
+
+
+_transformation_caches: dict[str, TransformationCache] = {}
+
+
+def get_transformation_cache(config: ConfigLoader) -> TransformationCache:
+    """Returns the shared transformation cache configured in GENENERAL_CONFIGURATION.CACHE_DATABASES."""
+    databases = config._config["GENENERAL_CONFIGURATION"]["CACHE_DATABASES"]
+    path = databases["TRANSFORMATION"]
+
+    if path not in _transformation_caches:
+        cache = TransformationCache(path)
+        legacy_path = databases.get("TRANSFORMATION_LEGACY_TOML")
+        if legacy_path:
+            cache.migrate_from_toml(legacy_path)
+        _transformation_caches[path] = cache
+
+    return _transformation_caches[path]
+
+
+class DetectionCache(SqliteStore):
+    """
+    Content-addressed store for raw detection responses.
+    Entries are keyed by sha256(image bytes) and sha256(prompt, model, generation config) and evicted by age and count.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50_000, max_age_days: float = 30) -> None:
+        """Opens (and if needed creates) the cache database at path and applies eviction once."""
+        super().__init__(path)
+        self._max_entries = max_entries
+        self._max_age_seconds = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency_seconds = 0.0
+        self.saved_tokens = 0
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS detections ("
+                " image_digest TEXT NOT NULL,"
+                " request_digest TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " response_text TEXT NOT NULL,"
+                " latency_seconds REAL NOT NULL,"
+                " total_tokens INTEGER,"
+                " created_at REAL NOT NULL,"
+                " last_used_at REAL NOT NULL,"
+                " PRIMARY KEY (image_digest, request_digest))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used_at)")
+        self.evict()
+
+    @staticmethod
+    def request_digest(prompt: str, model: str, generation_config: str) -> str:
+        """Hashes everything besides the image that influences the response."""
+        return hashlib.sha256("\0".join([prompt, model, generation_config]).encode("utf-8")).hexdigest()
+
+    def lookup(self, image_digest: str, request_digests: list[tuple[str, str]]) -> tuple[str, str] | None:
+        """
+        Returns (response_text, model) for the first (model, request_digest) candidate with a cached entry.
+        Counts a hit or miss either way.
+        """
+        now = time.time()
+        with metrics.span("detection_cache_lookup") as span, self._lock:
+            for model, request_digest in request_digests:
+                row = self._connection.execute(
+                    "SELECT response_text, latency_seconds, total_tokens, created_at FROM detections"
+                    " WHERE image_digest = ? AND request_digest = ?", (image_digest, request_digest)
+                ).fetchone()
+                if row is None or now - row[3] > self._max_age_seconds:
+                    continue
+                self._connection.execute(
+                    "UPDATE detections SET last_used_at = ? WHERE image_digest = ? AND request_digest = ?",
+                    (now, image_digest, request_digest),
+                )
+                self.hits += 1
+                self.saved_latency_seconds += row[1]
+                self.saved_tokens += row[2] or 0
+                span.set(result="hit")
+                metrics.count("detection_cache_lookups", result="hit")
+                return row[0], model
+            self.misses += 1
+            span.set(result="miss")
+            metrics.count("detection_cache_lookups", result="miss")
+        return None
+
+    def put(self, image_digest: str, request_digest: str, model: str, response_text: str,
+            latency_seconds: float, total_tokens: int | None = None) -> None:
+        """Stores one response together with what it cost to obtain it."""
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO detections (image_digest, request_digest, model, response_text,"
+                " latency_seconds, total_tokens, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (image_digest, request_digest, model, response_text, latency_seconds, total_tokens, now, now),
+            )
+
+    def evict(self) -> int:
+        """Drops entries older than max age and the least recently used entries beyond max entries."""
+        with self.transaction() as connection:
+            removed = connection.execute(
+                "DELETE FROM detections WHERE created_at < ?", (time.time() - self._max_age_seconds,)
+            ).rowcount
+            overflow = connection.execute("SELECT COUNT(*) FROM detections").fetchone()[0] - self._max_entries
+            if overflow > 0:
+                removed += connection.execute(
+                    "DELETE FROM detections WHERE rowid IN"
+                    " (SELECT rowid FROM detections ORDER BY last_used_at LIMIT ?)", (overflow,)
+                ).rowcount
+        return removed
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the API latency and tokens saved in this process."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_latency_seconds": round(self.saved_latency_seconds, 3),
+                "saved_tokens": self.saved_tokens,
+                "entries": self._connection.execute("SELECT COUNT(*) FROM detections").fetchone()[0],
+            }
+
+
+_detection_caches: dict[str, DetectionCache] = {}
+
+
+def get_detection_cache(config: ConfigLoader) -> DetectionCache | None:
+    """Returns the shared detection cache, or None if GEMINI_SETTINGS.CACHE_ENABLED is off."""
+    settings = config._config.get("GEMINI_SETTINGS", {})
+    if not settings.get("CACHE_ENABLED", False):
+        return None
+
+    path = config._config["GENENERAL_CONFIGURATION"]["CACHE_DATABASES"]["DETECTION"]
+    if path not in _detection_caches:
+        _detection_caches[path] = DetectionCache(
+            path,
+            max_entries=settings.get("CACHE_MAX_ENTRIES", 50_000),
+            max_age_days=settings.get("CACHE_MAX_AGE_DAYS", 30),
+        )
+    return _detection_caches[path]
@@ -1,4 +1,9 @@
+import copy
 import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Mapping
 import toml
 from dotenv import load_dotenv
 from loguru import logger
@@ -6,24 +11,77 @@ from loguru import logger
 class ConfigLoader:
     """
     Manages configuration loading from TOML files, environment variables, and cache files.
+    Files are re-parsed lazily and individually when their mtime or size changes; the flattened view is
+    memoized and only rebuilt after something actually changed.
     """
 
-    def __init__(self, config_path='config/config.toml') -> None:
-        """Initialize with config path and load configuration."""
+    def __init__(self, config_path='config/config.toml', check_interval: float = 1.0) -> None:
+        """Initialize with config path and load configuration. Files are checked for changes at most every check_interval seconds."""
         self._config_path = config_path
-        self.reload()
+        self._check_interval = check_interval
+        self._lock = threading.RLock()
+        self._sources: dict[str, dict] = {}
+        self._stamps: dict[str, tuple[int, int] | None] = {}
+        self._view: Mapping | None = None
+        self._last_check = 0.0
+        self.reload(force=True)
 
         logger.info(f"✅ Configuration loaded from {config_path}")
 
-    def reload(self, config_path: str = None) -> None:
-        """Reloads configuration, env variables, and cache."""
-        if config_path is None:
-            config_path = self._config_path
-
-        self._config = self._load_toml(config_path)
+    def reload(self, config_path: str = None, force: bool = False) -> bool:
+        """
+        Reloads configuration, env variables, and cache, re-parsing only files whose mtime or size changed.
+        Returns True if anything changed.
+        """
+        with self._lock:
+            if config_path is not None and config_path != self._config_path:
+                self._config_path = config_path
+                force = True
+
+            changed = False
+            if force or self._has_changed(self._config_path):
+                self._stamps[self._config_path] = self._stamp(self._config_path)
+                self._sources[self._config_path] = self._load_toml(self._config_path)
+                changed = True
+
+            for cache_path in self._cache_paths():
+                if force or self._has_changed(cache_path):
+                    stamp = self._stamp(cache_path)
+                    self._stamps[cache_path] = stamp
+                    if stamp is None:
+                        logger.warning(f"Cache file not found: {cache_path}")
+                        self._sources.pop(cache_path, None)
+                    else:
+                        self._sources[cache_path] = self._load_toml(cache_path)
+                    changed = True
+
+            if changed:
+                self._rebuild()
+            self._last_check = time.monotonic()
+            return changed
+
+    def _stamp(self, path: str) -> tuple[int, int] | None:
+        """Returns (mtime_ns, size) of a file, or None if it does not exist."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _has_changed(self, path: str) -> bool:
+        return path not in self._stamps or self._stamp(path) != self._stamps[path]
+
+    def _cache_paths(self) -> list[str]:
+        """Returns the TOML cache files listed in GENENERAL_CONFIGURATION.CACHE_FILES."""
+        general = self._sources[self._config_path].get("GENENERAL_CONFIGURATION", {})
+        return list(general.get("CACHE_FILES", {}).values())
+
+    def _rebuild(self) -> None:
+        """Re-merges the parsed files into the configuration and drops the memoized views."""
+        self._config = copy.deepcopy(self._sources[self._config_path])
         self._load_env()
         self._add_cache_config()
-        self._config_keys = self._flatten_dict(self._config)
+        self._view = None
 
     def _load_toml(self, path: str) -> dict:
         """Loads and parses a TOML file."""
@@ -43,7 +101,7 @@ class ConfigLoader:
             else:
                 items[new_key] = value
         return items
-    
+
     def _merge_dict_no_overwrite(self, base: dict, updates: dict, wrap_key: str | None = None) -> None:
         """Recursively merges updates into base dictionary without overwriting existing keys."""
         if wrap_key:
@@ -58,51 +116,65 @@ class ConfigLoader:
                 base[key] = value
             elif isinstance(base[key], dict) and isinstance(value, dict):
                 self._merge_dict_no_overwrite(base[key], value)
-            
+
     def _add_cache_config(self) -> None:
-        """Merges cache files defined in configuration into the main config."""
-        cahe_paths = self._config["GENENERAL_CONFIGURATION"]["CACHE_FILES"]
-        
-        for _, cache_path in cahe_paths.items():
-            try:
-                cache_keys = self._load_toml(cache_path)
-                self._merge_dict_no_overwrite(self._config, cache_keys, wrap_key="CACHE")
-            except FileNotFoundError:
-                logger.warning(f"Cache file not found: {cache_path}")
-    
+        """Merges the already parsed cache files into the main config."""
+        for cache_path in self._cache_paths():
+            if cache_path in self._sources:
+                self._merge_dict_no_overwrite(self._config, copy.deepcopy(self._sources[cache_path]), wrap_key="CACHE")
+
     def cache_values(self, path: str, items: list[tuple[str, object]], split_char: str | None = "_", split: bool = True) -> None:
         """Writes key-value pairs to a TOML cache file, optionally splitting keys by separator."""
         if not isinstance(items, list):
             raise TypeError("items must be a list of (key, value) pairs")
 
-        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-        if not os.path.exists(path):
-            with open(path, "w", encoding="utf-8") as f:
-                f.write("")
-
-        data = self._load_toml(path)
-
-        for key_path, value in items:
-            if not isinstance(key_path, str):
-                raise TypeError("Each key must be a string")
+        with self._lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if not os.path.exists(path):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write("")
 
-            if split and split_char is not None:
-                parts = key_path.split(split_char)
+            # Reuse the parsed file if it has not changed on disk since
+            if path in self._sources and not self._has_changed(path):
+                data = copy.deepcopy(self._sources[path])
             else:
-                parts = [key_path]
-
-            current = data
-            for part in parts[:-1]:
-                if part not in current or not isinstance(current[part], dict):
-                    current[part] = {}
-                current = current[part]
-            current[parts[-1]] = value
-
-        with open(path, "w", encoding="utf-8") as f:
-            toml.dump(data, f)
-
-        self.reload()
-        logger.info(f"Cached {len(items)} items to {path}")
+                data = self._load_toml(path)
+            previous = copy.deepcopy(data)
+
+            for key_path, value in items:
+                if not isinstance(key_path, str):
+                    raise TypeError("Each key must be a string")
+
+                if split and split_char is not None:
+                    parts = key_path.split(split_char)
+                else:
+                    parts = [key_path]
+
+                current = data
+                for part in parts[:-1]:
+                    if part not in current or not isinstance(current[part], dict):
+                        current[part] = {}
+                    current = current[part]
+                current[parts[-1]] = value
+
+            if data == previous:
+                logger.info(f"Cache {path} already up to date ({len(items)} items)")
+                return
+
+            # Write to a temporary file first and swap it in atomically
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                toml.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+            # Update only this file's state instead of reloading everything
+            self._sources[path] = data
+            self._stamps[path] = self._stamp(path)
+            if path in self._cache_paths():
+                self._rebuild()
+            logger.info(f"Cached {len(items)} items to {path}")
 
     def _load_env(self) -> None:
         """Loads environment variables specified in config into the configuration dictionary."""
@@ -113,7 +185,22 @@ class ConfigLoader:
         except KeyError:
             logger.warning("No ENV_VALUES section found in configuration.")
 
+    def view(self) -> Mapping:
+        """
+        Returns the memoized, read-only flattened configuration.
+        O(1) unless a file changed since the last check (checked at most every check_interval seconds).
+        """
+        with self._lock:
+            if time.monotonic() - self._last_check >= self._check_interval:
+                self.reload()
+            if self._view is None:
+                self._view = MappingProxyType(self._flatten_dict(self._config))
+            return self._view
+
+    def get(self, key: str, default=None):
+        """Returns one flattened configuration value, e.g. get("CHAT_MODELS_GEMINI_MODELS", [])."""
+        return self.view().get(key, default)
+
     def to_dict(self) -> dict:
-        """Returns the flattened configuration dictionary."""
-        self._config_keys = self._flatten_dict(self._config)
-        return self._config_keys.copy()
\ No newline at end of file
+        """Returns the flattened configuration dictionary (a mutable copy of view())."""
+        return dict(self.view())
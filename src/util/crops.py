@@ -0,0 +1,168 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+import numpy as np
+from PIL import Image
+
+from util.detection_io import move_files, page_key
+from util.page import Page
+from util import metrics
+
+CROP_FORMATS = {"png": ("PNG", ".png"), "jpeg": ("JPEG", ".jpg"), "webp": ("WEBP", ".webp")}
+
+
+class Crop:
+    """
+    One detected block as a zero-copy view into its page raster. Encoding happens only on demand
+    and is remembered per (format, max_side, quality).
+    """
+
+    def __init__(self, key: str, index: int, box: list[int], array: np.ndarray, label: str = "", score: float = 1.0) -> None:
+        self.key = key
+        self.index = index
+        self.box = box
+        self.array = array
+        self.label = label
+        self.score = score
+        self._encoded: dict[tuple, bytes] = {}
+
+    @property
+    def image(self) -> Image.Image:
+        """PIL image of the block (copies the pixels)."""
+        return Image.fromarray(np.ascontiguousarray(self.array))
+
+    def encode(self, fmt: str = "png", max_side: int | None = None, quality: int = 85) -> bytes:
+        """Returns the block encoded as png, jpeg or webp, optionally downscaled so the longer side is max_side."""
+        cache_key = (fmt, max_side, quality)
+        if cache_key not in self._encoded:
+            with metrics.span("crop_encode", format=fmt):
+                image = self.image
+                if max_side:
+                    image.thumbnail((max_side, max_side), Image.LANCZOS)
+                buffer = io.BytesIO()
+                pil_format = CROP_FORMATS[fmt][0]
+                image.save(buffer, pil_format, **({"quality": quality} if pil_format in ("JPEG", "WEBP") else {"compress_level": 1}))
+                self._encoded[cache_key] = buffer.getvalue()
+        return self._encoded[cache_key]
+
+
+class RasterCache:
+    """
+    Decodes every page image once into an uncompressed .npy raster below cache_dir (<document>/<page>.npy)
+    and serves boxes as views into the memory-mapped array. At most max_mapped_pages rasters stay mapped (LRU).
+    A raster is rebuilt when its page image is newer.
+    """
+
+    def __init__(self, cache_dir: str = "data/raster_cache", max_mapped_pages: int = 16) -> None:
+        self.cache_dir = cache_dir
+        self.max_mapped_pages = max(1, max_mapped_pages)
+        self._mapped: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._page_locks: dict[str, threading.Lock] = {}
+        self.decodes = 0
+        self.hits = 0
+
+    @classmethod
+    def from_settings(cls, config: dict) -> "RasterCache":
+        """Creates the cache from the CROPS section of a flattened config (e.g. ConfigLoader.view())."""
+        return cls(config.get("CROPS_CACHE_DIR", "data/raster_cache/"), config.get("CROPS_MAX_MAPPED_PAGES", 16))
+
+    def raster_path(self, image_path: str) -> str:
+        return os.path.join(self.cache_dir, f"{page_key(image_path)}.npy")
+
+    def _page_lock(self, image_path: str) -> threading.Lock:
+        with self._lock:
+            return self._page_locks.setdefault(image_path, threading.Lock())
+
+    def page_array(self, page: Page | str) -> np.ndarray:
+        """Returns the read-only memory-mapped raster of a page (H x W for grayscale, H x W x 3 otherwise)."""
+        page = Page.of(page)
+        image_path = page.image_path
+        with self._lock:
+            if image_path in self._mapped:
+                self._mapped.move_to_end(image_path)
+                self.hits += 1
+                return self._mapped[image_path]
+
+        # One decode per page, even if several threads ask for it at once
+        with self._page_lock(image_path):
+            with self._lock:
+                if image_path in self._mapped:
+                    return self._mapped[image_path]
+
+            raster_path = self.raster_path(image_path)
+            if not (os.path.exists(raster_path) and os.stat(page.wait_written()).st_mtime <= os.stat(raster_path).st_mtime):
+                self._write_raster(page, raster_path)
+            array = np.load(raster_path, mmap_mode="r")
+
+            with self._lock:
+                self._mapped[image_path] = array
+                while len(self._mapped) > self.max_mapped_pages:
+                    # Views handed out earlier keep their mapping alive; the cache only drops its reference
+                    self._mapped.popitem(last=False)
+            return array
+
+    def _write_raster(self, page: Page, raster_path: str) -> None:
+        with metrics.span("raster_decode"):
+            image = page.image
+            if image.mode not in ("L", "RGB"):
+                image = image.convert("RGB")
+            os.makedirs(os.path.dirname(raster_path), exist_ok=True)
+            tmp_path = f"{raster_path}.tmp.npy"
+            array = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8,
+                                              shape=(image.size[1], image.size[0]) + ((3,) if image.mode == "RGB" else ()))
+            array[...] = np.asarray(image)
+            array.flush()
+            del array
+            os.replace(tmp_path, raster_path)
+        with self._lock:
+            self.decodes += 1
+
+    def crop(self, page: Page | str, box: list[int]) -> np.ndarray:
+        """Returns the [x1, y1, x2, y2] region (clamped to the page) as a view, without copying pixels."""
+        array = self.page_array(page)
+        height, width = array.shape[:2]
+        x1, y1, x2, y2 = (int(round(value)) for value in box[:4])
+        x1, x2 = min(max(x1, 0), width), min(max(x2, 0), width)
+        y1, y2 = min(max(y1, 0), height), min(max(y2, 0), height)
+        return array[y1:y2, x1:x2]
+
+    def crops(self, page: Page | str, boxes: list[list[int]], labels: list[str] | None = None,
+              scores: list[float] | None = None) -> list[Crop]:
+        """Returns a Crop per box of one page; the page is decoded at most once."""
+        page = Page.of(page)
+        key = page_key(page.image_path)
+        labels = labels or [""] * len(boxes)
+        scores = scores or [1.0] * len(boxes)
+        return [Crop(key, index, box, self.crop(page, box), label, score)
+                for index, (box, label, score) in enumerate(zip(boxes, labels, scores))]
+
+    def rename_pages(self, document: str, renames: dict[str, str], removed: Iterable[str] = ()) -> None:
+        """
+        Moves the rasters of renumbered pages (old page name -> new page name) and deletes those of removed pages.
+        A moved page image keeps its modification time, so a raster left under its new name would look up to date.
+        """
+        folder = os.path.join(self.cache_dir, document)
+        # Targets that are not moved away themselves are overwritten (or left stale if their source has no raster)
+        for page in set(removed) | (set(renames.values()) - set(renames)):
+            path = os.path.join(folder, f"{page}.npy")
+            if os.path.exists(path):
+                os.remove(path)
+        move_files({os.path.join(folder, f"{old}.npy"): os.path.join(folder, f"{new}.npy") for old, new in renames.items()})
+        self.release()
+
+    def release(self, page: Page | str | None = None) -> None:
+        """Unmaps one page (or all pages); the rasters stay on disk for the next run."""
+        with self._lock:
+            if page is None:
+                self._mapped.clear()
+            else:
+                self._mapped.pop(Page.of(page).image_path, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"decodes": self.decodes, "hits": self.hits, "mapped_pages": len(self._mapped)}
+
@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+# Re-detected pages append a new line; a document file is rewritten once it holds this many times more lines than pages
+_COMPACT_FACTOR = 2
+_COMPACT_MIN_LINES = 64
+
+_file_locks: dict[str, threading.Lock] = {}
+_file_locks_guard = threading.Lock()
+# path -> ((mtime_ns, size), {page: record}); documents are parsed once per change
+_loaded: dict[str, tuple[tuple[int, int], dict[str, dict]]] = {}
+
+
+def document_name(image_path: str) -> str:
+    """Returns the document a page image belongs to (its folder name below the processed directory)."""
+    return os.path.basename(os.path.dirname(image_path))
+
+
+def page_key(image_path: str) -> str:
+    """Returns a corpus-wide unique key for a page image, e.g. Analysis/page_00001."""
+    return f"{document_name(image_path)}/{os.path.splitext(os.path.basename(image_path))[0]}"
+
+
+def document_boxes_path(document: str, output_dir: str) -> str:
+    """Returns the path of the JSON Lines boxes file of a document (one line per detected page)."""
+    return os.path.join(output_dir, f"{document}.boxes.jsonl")
+
+
+def boxes_output_path(image_path: str, output_dir: str) -> str:
+    """Returns the path of the legacy per-page _boxes.json file for a page image (read-only fallback)."""
+    return os.path.join(output_dir, f"{page_key(image_path)}_boxes.json")
+
+
+def _thread_lock(path: str) -> threading.Lock:
+    with _file_locks_guard:
+        return _file_locks.setdefault(path, threading.Lock())
+
+
+@contextmanager
+def _file_lock(path: str):
+    """
+    Serializes appends and rewrites of a document file across threads and worker processes (flock on <path>.lock,
+    also honoured by other hosts on an NFSv4 share), so a line appended during a compaction is never lost.
+    """
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_boxes(image_path: str, boxes: list[list[int]], output_dir: str, labels: list[str] | None = None,
+                scores: list[float] | None = None, extra: dict | None = None) -> str:
+    """
+    Appends the absolute [x1, y1, x2, y2] pixel boxes of one page, with optional labels and scores, as one compact
+    columnar line to the document's JSON Lines file and returns the file path. A later line for the same page wins.
+    extra adds fields to the line, e.g. the page the boxes were reused from.
+    """
+    output_file = document_boxes_path(document_name(image_path), output_dir)
+    record = {
+        "page": os.path.splitext(os.path.basename(image_path))[0],
+        "written": time.time(),
+        "boxes": boxes,
+        "labels": labels if labels is not None else [""] * len(boxes),
+        "scores": scores if scores is not None else [1.0] * len(boxes),
+        **(extra or {}),
+    }
+    line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    with _file_lock(output_file):
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        with open(output_file, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    return output_file
+
+
+def _compact(path: str, records: dict[str, dict]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records.values():
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _read_records(path: str) -> tuple[dict[str, dict], int]:
+    """Parses a document file (caller holds its lock); returns ({page: latest record}, number of lines)."""
+    records, lines = {}, 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from an interrupted run; its page is detected again
+                continue
+            records[record["page"]] = record
+            lines += 1
+    return records, lines
+
+
+def _stamp(path: str) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_document_boxes(document: str, output_dir: str) -> dict[str, dict]:
+    """
+    Reads all pages of a document in one go and returns {page: {"boxes", "labels", "scores", "written"}}.
+    The parsed file is memoized until it changes.
+    """
+    path = document_boxes_path(document, output_dir)
+    stamp = _stamp(path)
+    if stamp is None:
+        return {}
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with _file_lock(path):
+        stamp = _stamp(path)
+        if stamp is None:
+            return {}
+        records, lines = _read_records(path)
+        if lines >= _COMPACT_MIN_LINES and lines > _COMPACT_FACTOR * len(records):
+            _compact(path, records)
+            stamp = _stamp(path)
+
+        _loaded[path] = (stamp, records)
+        return records
+
+
+def move_files(moves: dict[str, str]) -> None:
+    """
+    Renames files old path -> new path as one permutation (a target may be the source of another move):
+    all sources are moved aside first. Missing sources are skipped; modification times are kept.
+    """
+    staged = []
+    for old_path, new_path in moves.items():
+        if os.path.exists(old_path):
+            tmp_path = f"{new_path}.moving"
+            os.replace(old_path, tmp_path)
+            staged.append((tmp_path, new_path))
+    for tmp_path, new_path in staged:
+        os.replace(tmp_path, new_path)
+
+
+def rename_pages(document: str, output_dir: str, renames: dict[str, str], removed: Iterable[str] = ()) -> None:
+    """
+    Renumbers the saved pages of a document (old page name -> new page name, applied at once) and drops removed
+    pages; records keep their written time, so renamed pages stay up to date.
+    """
+    path = document_boxes_path(document, output_dir)
+    if not os.path.exists(path):
+        return
+    removed = set(removed)
+    # Read and rewritten under one lock, so boxes appended by another worker meanwhile are kept
+    with _file_lock(path):
+        records, _ = _read_records(path)
+        moved = {renames[page]: {**record, "page": renames[page]} for page, record in records.items() if page in renames}
+        kept = {page: record for page, record in records.items() if page not in renames and page not in removed and page not in moved}
+        _compact(path, dict(sorted({**kept, **moved}.items())))
+
+
+def _load_legacy_boxes(json_path: str) -> dict:
+    with open(json_path, "r", encoding="utf-8") as f:
+        boxes = json.load(f)
+    return {"boxes": boxes, "labels": [""] * len(boxes), "scores": [1.0] * len(boxes),
+            "written": os.stat(json_path).st_mtime}
+
+
+def read_page_boxes(image_path: str, output_dir: str) -> dict | None:
+    """Returns the saved record of one page (see load_document_boxes), falling back to a legacy _boxes.json file."""
+    record = load_document_boxes(document_name(image_path), output_dir).get(os.path.splitext(os.path.basename(image_path))[0])
+    if record is not None:
+        return record
+    legacy_path = boxes_output_path(image_path, output_dir)
+    return _load_legacy_boxes(legacy_path) if os.path.exists(legacy_path) else None
+
+
+def iter_saved_boxes(output_dir: str) -> Iterator[tuple[str, dict]]:
+    """Yields (page key, record) for every saved page: document files first, then legacy _boxes.json files."""
+    if not os.path.isdir(output_dir):
+        return
+    seen = set()
+    for file_name in sorted(os.listdir(output_dir)):
+        if file_name.endswith(".boxes.jsonl"):
+            document = file_name[:-len(".boxes.jsonl")]
+            for page, record in sorted(load_document_boxes(document, output_dir).items()):
+                seen.add(f"{document}/{page}")
+                yield f"{document}/{page}", record
+
+    for root, _, file_names in os.walk(output_dir):
+        for file_name in sorted(file_names):
+            if not file_name.endswith("_boxes.json"):
+                continue
+            json_path = os.path.join(root, file_name)
+            key = os.path.relpath(json_path, output_dir)[:-len("_boxes.json")].replace(os.sep, "/")
+            if key not in seen:
+                yield key, _load_legacy_boxes(json_path)
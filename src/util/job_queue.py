@@ -0,0 +1,270 @@
+import json
+import os
+import socket
+import threading
+import time
+from typing import Iterable
+
+from loguru import logger
+
+from util.cache_store import SqliteStore
+from util.config_reader import ConfigLoader
+from util import metrics
+
+JOB_STATES = ("pending", "leased", "done", "dead")
+
+
+def default_worker_id() -> str:
+    """host:pid, unique across the workers sharing one queue."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Job:
+    """One leased task: a page (key) in one stage, with its JSON payload and the version it was enqueued for."""
+
+    def __init__(self, stage: str, key: str, payload: dict, version: str, attempts: int) -> None:
+        self.stage = stage
+        self.key = key
+        self.payload = payload
+        self.version = version
+        self.attempts = attempts
+
+
+class JobQueue(SqliteStore):
+    """
+    Durable per-page task queue shared by worker processes (on one host, or on several hosts when the database lies
+    on a shared filesystem and journal_mode is "DELETE"). A worker leases jobs for lease_seconds and extends the lease
+    with heartbeats; a lease that expires (killed worker) makes the job available again. Failed jobs are retried with
+    exponential backoff until max_attempts, then parked as dead letters. Done jobs are never handed out again unless
+    they are enqueued with a new version (e.g. the page's content fingerprint changed).
+    Lease times are wall-clock times, so the clocks of all hosts must be synchronized (NTP).
+    """
+
+    def __init__(self, path: str, journal_mode: str = "WAL", max_attempts: int = 5, retry_backoff_seconds: float = 30.0,
+                 retry_backoff_max_seconds: float = 900.0) -> None:
+        super().__init__(path, journal_mode)
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.retry_backoff_max_seconds = retry_backoff_max_seconds
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " stage TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " version TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL,"
+                " available_at REAL NOT NULL,"
+                " lease_owner TEXT,"
+                " lease_expires REAL,"
+                " last_error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (stage, key))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (stage, state, key)")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_leases ON jobs (state, lease_expires)")
+
+    def _enqueue(self, connection, stage: str, jobs: Iterable[tuple[str, dict, str]], force: bool = False) -> int:
+        now = time.time()
+        before = connection.total_changes
+        # A job already known in the same version keeps its state (done stays done); a new version starts over
+        connection.executemany(
+            "INSERT INTO jobs (stage, key, payload, version, state, attempts, available_at, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, 'pending', 0, ?, ?, ?)"
+            " ON CONFLICT (stage, key) DO UPDATE SET payload = excluded.payload, version = excluded.version,"
+            " state = 'pending', attempts = 0, available_at = excluded.available_at, lease_owner = NULL,"
+            " lease_expires = NULL, last_error = NULL, updated_at = excluded.updated_at"
+            " WHERE jobs.version != excluded.version OR (? AND jobs.state != 'leased')",
+            [(stage, key, json.dumps(payload), version, now, now, now, force) for key, payload, version in jobs],
+        )
+        return connection.total_changes - before
+
+    def enqueue(self, stage: str, jobs: Iterable[tuple[str, dict, str]], force: bool = False) -> int:
+        """
+        Adds (key, payload, version) jobs to a stage in one transaction and returns how many were added or reset.
+        force also resets done and dead jobs of the same version.
+        """
+        with self.transaction() as connection:
+            return self._enqueue(connection, stage, jobs, force)
+
+    def lease(self, stage: str, owner: str, limit: int = 1, lease_seconds: float = 120.0) -> list[Job]:
+        """
+        Leases up to limit available jobs of a stage (in key order, so pages of one document stay together).
+        Expired leases of any stage are recovered first: retried, or dead letters once out of attempts.
+        """
+        now = time.time()
+        with metrics.span("job_queue_lease", stage=stage), self.transaction() as connection:
+            expired = connection.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END,"
+                " lease_owner = NULL, lease_expires = NULL, last_error = 'lease of ' || lease_owner || ' expired',"
+                " available_at = ?, updated_at = ? WHERE state = 'leased' AND lease_expires < ?",
+                (self.max_attempts, now, now, now),
+            ).rowcount
+            if expired:
+                logger.warning(f"⚠️ {expired} expired job leases recovered")
+                metrics.count("job_leases_expired", expired)
+
+            rows = connection.execute(
+                "SELECT key, payload, version, attempts FROM jobs"
+                " WHERE stage = ? AND state = 'pending' AND available_at <= ? ORDER BY key LIMIT ?",
+                (stage, now, limit),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE stage = ? AND key = ?",
+                [(owner, now + lease_seconds, now, stage, key) for key, _, _, _ in rows],
+            )
+        return [Job(stage, key, json.loads(payload), version, attempts + 1) for key, payload, version, attempts in rows]
+
+    def heartbeat(self, owner: str, jobs: Iterable[Job], lease_seconds: float = 120.0) -> int:
+        """Extends the leases the owner still holds on jobs; returns how many were extended."""
+        now = time.time()
+        with self.transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE stage = ? AND key = ? AND state = 'leased' AND lease_owner = ?",
+                [(now + lease_seconds, now, job.stage, job.key, owner) for job in jobs],
+            )
+            return connection.total_changes - before
+
+    def complete(self, job: Job, owner: str, next_jobs: Iterable[tuple[str, str, dict, str]] = ()) -> bool:
+        """
+        Marks a job done and enqueues its follow-up (stage, key, payload, version) jobs in the same transaction.
+        Only the lease owner can complete a job: a job whose lease expired and was taken over, or that was re-enqueued
+        with a new version meanwhile, is left alone and False is returned. Follow-ups with payload["force"] reset done jobs.
+        """
+        with self.transaction() as connection:
+            completed = connection.execute(
+                "UPDATE jobs SET state = 'done', lease_owner = NULL, lease_expires = NULL, last_error = NULL, updated_at = ?"
+                " WHERE stage = ? AND key = ? AND version = ? AND state = 'leased' AND lease_owner = ?",
+                (time.time(), job.stage, job.key, job.version, owner),
+            ).rowcount
+            if completed:
+                for stage, key, payload, version in next_jobs:
+                    self._enqueue(connection, stage, [(key, payload, version)], bool(payload.get("force")))
+        metrics.count("jobs", stage=job.stage, result="done" if completed else "lost")
+        return bool(completed)
+
+    def fail(self, job: Job, owner: str, error: str) -> str:
+        """Returns a job to the queue after a failure (with backoff) or parks it as dead letter; returns the new state."""
+        now = time.time()
+        dead = job.attempts >= self.max_attempts
+        delay = min(self.retry_backoff_seconds * 2 ** (job.attempts - 1), self.retry_backoff_max_seconds)
+        with self.transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?, available_at = ?, updated_at = ?"
+                " WHERE stage = ? AND key = ? AND state = 'leased' AND lease_owner = ?",
+                ("dead" if dead else "pending", error[:2000], now + delay, now, job.stage, job.key, owner),
+            )
+        metrics.count("jobs", stage=job.stage, result="dead" if dead else "retry")
+        return "dead" if dead else "pending"
+
+    def release(self, owner: str, jobs: Iterable[Job]) -> None:
+        """Hands leased jobs back unprocessed (e.g. on shutdown) without counting the attempt."""
+        with self.transaction() as connection:
+            connection.executemany(
+                "UPDATE jobs SET state = 'pending', attempts = attempts - 1, lease_owner = NULL, lease_expires = NULL,"
+                " updated_at = ? WHERE stage = ? AND key = ? AND state = 'leased' AND lease_owner = ?",
+                [(time.time(), job.stage, job.key, owner) for job in jobs],
+            )
+
+    def open_jobs(self, stages: Iterable[str]) -> int:
+        """Number of pending and leased jobs of the given stages (leases held by other workers may still expire)."""
+        stages = list(stages)
+        with self._lock:
+            return self._connection.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'leased') AND stage IN ({','.join('?' * len(stages))})",
+                stages,
+            ).fetchone()[0]
+
+    def dead_letters(self, stage: str | None = None) -> list[dict]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT stage, key, attempts, last_error, updated_at FROM jobs WHERE state = 'dead'"
+                + (" AND stage = ?" if stage else "") + " ORDER BY stage, key", (stage,) if stage else ()
+            ).fetchall()
+        return [{"stage": row[0], "key": row[1], "attempts": row[2], "last_error": row[3], "updated_at": row[4]} for row in rows]
+
+    def retry_dead(self, stage: str | None = None) -> int:
+        """Moves dead letters (of one stage) back to pending with fresh attempts; returns their number."""
+        with self.transaction() as connection:
+            return connection.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, available_at = ?, updated_at = ? WHERE state = 'dead'"
+                + (" AND stage = ?" if stage else ""), (time.time(), time.time(), *((stage,) if stage else ()))
+            ).rowcount
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Job counts per stage and state."""
+        with self._lock:
+            rows = self._connection.execute("SELECT stage, state, COUNT(*) FROM jobs GROUP BY stage, state").fetchall()
+        stats: dict[str, dict[str, int]] = {}
+        for stage, state, count in rows:
+            stats.setdefault(stage, dict.fromkeys(JOB_STATES, 0))[state] = count
+        return stats
+
+
+class LeaseKeeper:
+    """Background thread renewing the leases of the jobs a worker is processing, every heartbeat_seconds."""
+
+    def __init__(self, queue: JobQueue, owner: str, lease_seconds: float, heartbeat_seconds: float) -> None:
+        self.queue = queue
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._jobs: dict[tuple[str, str], Job] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-heartbeat", daemon=True)
+
+    def __enter__(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def hold(self, jobs: list[Job]) -> None:
+        with self._lock:
+            self._jobs.update({(job.stage, job.key): job for job in jobs})
+
+    def drop(self, job: Job) -> None:
+        with self._lock:
+            self._jobs.pop((job.stage, job.key), None)
+
+    def held(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.heartbeat_seconds):
+            jobs = self.held()
+            if not jobs:
+                continue
+            try:
+                extended = self.queue.heartbeat(self.owner, jobs, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"⚠️ Heartbeat failed: {e}")
+                continue
+            if extended < len(jobs):
+                logger.warning(f"⚠️ {len(jobs) - extended} job leases were lost (expired and taken over)")
+
+
+_job_queues: dict[str, JobQueue] = {}
+
+
+def get_job_queue(config: ConfigLoader) -> JobQueue:
+    """Returns the shared job queue configured in JOB_QUEUE."""
+    settings = config._config.get("JOB_QUEUE", {})
+    path = settings.get("PATH", "data/job_queue.sqlite3")
+    if path not in _job_queues:
+        _job_queues[path] = JobQueue(
+            path,
+            journal_mode=settings.get("JOURNAL_MODE", "WAL"),
+            max_attempts=settings.get("MAX_ATTEMPTS", 5),
+            retry_backoff_seconds=settings.get("RETRY_BACKOFF_SECONDS", 30.0),
+            retry_backoff_max_seconds=settings.get("RETRY_BACKOFF_MAX_SECONDS", 900.0),
+        )
+    return _job_queues[path]
@@ -0,0 +1,206 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "karteikarten"
+
+
+class _NoopSpan:
+    """Returned by span() while metrics are disabled; costs one attribute check per call site."""
+
+    def set(self, **labels) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Times a block; its duration is observed in the histogram <name>_seconds and optionally recorded as trace event."""
+
+    def __init__(self, registry: "_Registry", name: str, labels: dict) -> None:
+        self._registry = registry
+        self.name = name
+        self.labels = labels
+
+    def set(self, **labels) -> None:
+        """Adds labels that are only known inside the block, e.g. which model answered."""
+        self.labels.update(labels)
+
+    def __enter__(self) -> "Span":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        ended = time.perf_counter()
+        if exc_type is not None:
+            self.labels.setdefault("error", exc_type.__name__)
+        self._registry.observe(self.name, ended - self._started, self.labels)
+        self._registry.trace(self.name, self._started, ended, self.labels)
+
+
+class _Registry:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_enabled = False
+        self.max_trace_events = 200_000
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, list]] = {}
+        self._events: list[dict] = []
+        self._dropped_events = 0
+        self._origin = time.perf_counter()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._events.clear()
+            self._dropped_events = 0
+            self._origin = time.perf_counter()
+
+    def count(self, name: str, value: float, labels: dict) -> None:
+        key = tuple(sorted((key, str(label)) for key, label in labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, labels: dict) -> None:
+        key = tuple(sorted((key, str(label)) for key, label in labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # [bucket counts..., +Inf count, sum]
+            histogram = series.setdefault(key, [0] * (len(DEFAULT_BUCKETS) + 1) + [0.0])
+            histogram[bisect.bisect_left(DEFAULT_BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    def trace(self, name: str, started: float, ended: float, labels: dict) -> None:
+        if not self.trace_enabled:
+            return
+        with self._lock:
+            if len(self._events) >= self.max_trace_events:
+                self._dropped_events += 1
+                return
+            self._events.append({
+                "name": name,
+                "ph": "X",
+                "ts": round((started - self._origin) * 1e6, 1),
+                "dur": round((ended - started) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": dict(labels),
+            })
+
+    def prometheus_text(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{metric}{_format_labels(key)} {value:g}")
+
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{METRIC_PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, bucket in zip(DEFAULT_BUCKETS + (float("inf"),), histogram[:-1]):
+                        cumulative += bucket
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{metric}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{metric}_sum{_format_labels(key)} {histogram[-1]:.6f}")
+                    lines.append(f"{metric}_count{_format_labels(key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def chrome_trace(self) -> dict:
+        with self._lock:
+            return {"traceEvents": list(self._events), "displayTimeUnit": "ms",
+                    "otherData": {"dropped_events": self._dropped_events}}
+
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    escape = lambda value: value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in key) + "}"
+
+
+_registry = _Registry()
+
+
+def configure(config: dict) -> None:
+    """Enables metrics according to the METRICS section of a flattened config (e.g. ConfigLoader.view())."""
+    _registry.enabled = bool(config.get("METRICS_ENABLED", False))
+    _registry.trace_enabled = _registry.enabled and bool(config.get("METRICS_CHROME_TRACE_FILE"))
+    _registry.max_trace_events = config.get("METRICS_MAX_TRACE_EVENTS", 200_000)
+
+
+def enabled() -> bool:
+    return _registry.enabled
+
+
+def span(name: str, **labels) -> Span | _NoopSpan:
+    """
+    Context manager timing a block into the histogram <name>_seconds, e.g.
+    `with metrics.span("render", document=doc):`. A shared no-op object while metrics are disabled.
+    """
+    if not _registry.enabled:
+        return _NOOP_SPAN
+    return Span(_registry, name, labels)
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    """Adds value to the counter <name>_total."""
+    if _registry.enabled:
+        _registry.count(name, value, labels)
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Records a duration measured elsewhere in the histogram <name>_seconds."""
+    if _registry.enabled:
+        _registry.observe(name, seconds, labels)
+
+
+def reset() -> None:
+    _registry.reset()
+
+
+def _write_atomic(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def export(config: dict) -> None:
+    """
+    Writes the Prometheus textfile (METRICS_PROMETHEUS_FILE, e.g. for the node_exporter textfile collector)
+    and the Chrome trace (METRICS_CHROME_TRACE_FILE, for chrome://tracing or Perfetto) if configured.
+    """
+    if not _registry.enabled:
+        return
+
+    prometheus_file = config.get("METRICS_PROMETHEUS_FILE")
+    if prometheus_file:
+        _write_atomic(prometheus_file, _registry.prometheus_text())
+        logger.info(f"📈 Metrics written to {prometheus_file}")
+
+    trace_file = config.get("METRICS_CHROME_TRACE_FILE")
+    if trace_file:
+        _write_atomic(trace_file, json.dumps(_registry.chrome_trace()))
+        logger.info(f"📈 Trace written to {trace_file}")
@@ -1,37 +1,96 @@
-import subprocess
+import json
+import os
+import time
+import urllib.error
+import urllib.request
 from typing import List
 from loguru import logger
 
-def check_ollama_and_models(models: List[str]):
-    """
-    Verifies that Ollama is installed and the required models are available.
-    Logs errors or instructions if requirements are missing.
-    """
+DEFAULT_OLLAMA_HOST = "http://127.0.0.1:11434"
+
+
+def ollama_host(host: str | None = None) -> str:
+    """Returns the Ollama API base URL: host, else $OLLAMA_HOST (like the ollama CLI, scheme and port optional)."""
+    host = host or os.getenv("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST
+    if "://" not in host:
+        host = f"http://{host}"
+    scheme, address = host.split("://", 1)
+    address = address.rstrip("/")
+    if ":" not in address.split("/")[0]:
+        address = f"{address}:11434"
+    # 0.0.0.0 is a bind address; connect to the local machine instead
+    return f"{scheme}://{address.replace('0.0.0.0', '127.0.0.1', 1)}"
+
 
-    # --- Step 1: Check if Ollama is installed ---
+def _read_cached_tags(cache_path: str | None, host: str, ttl_seconds: float) -> list[str] | None:
+    """Returns the cached model list for host if it is younger than ttl_seconds."""
+    if not cache_path or ttl_seconds <= 0:
+        return None
     try:
-        subprocess.run(["ollama", "--version"], check=True, capture_output=True, text=True)
-    except FileNotFoundError:
-        logger.error("❌ Ollama isn't installed on your machine.")
-        logger.error("➡️  Install it here: https://ollama.ai/download")
-        return
-    except subprocess.CalledProcessError as e:
-        logger.error("⚠️ Ollama coudnt be executed correctly:", e)
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("host") != host or time.time() - cached.get("fetched_at", 0) > ttl_seconds:
+        return None
+    return cached.get("models")
+
+
+def _write_cached_tags(cache_path: str | None, host: str, models: list[str]) -> None:
+    if not cache_path:
         return
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"host": host, "fetched_at": time.time(), "models": models}, f)
+    os.replace(tmp_path, cache_path)
+
+
+def installed_models(host: str | None = None, timeout: float = 2.0, cache_path: str | None = None,
+                     ttl_seconds: float = 300) -> list[str] | None:
+    """
+    Returns the names of the models installed on the Ollama server (GET /api/tags), or None if it is unreachable.
+    Successful answers are cached in cache_path for ttl_seconds.
+    """
+    host = ollama_host(host)
+    cached = _read_cached_tags(cache_path, host, ttl_seconds)
+    if cached is not None:
+        return cached
 
-    # --- Step 2: Retrieve available models ---
     try:
-        result = subprocess.run(["ollama", "list"], check=True, capture_output=True, text=True)
-        installed_models = [line.split()[0] for line in result.stdout.strip().split("\n")[1:] if line.strip()]
-    except Exception as e:
-        logger.error("❌ coud't open modellist", e)
-        return
+        with urllib.request.urlopen(f"{host}/api/tags", timeout=timeout) as response:
+            payload = json.load(response)
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        logger.error(f"❌ Ollama isn't reachable at {host}: {e}")
+        logger.error("➡️  Install it here: https://ollama.ai/download and start it with 'ollama serve'.")
+        return None
 
-    # --- Step 3: Identify missing models ---
-    missing = [m for m in models if m not in installed_models]
+    models = [model.get("name") or model.get("model") for model in payload.get("models", [])]
+    _write_cached_tags(cache_path, host, models)
+    return models
+
+
+def check_ollama_and_models(models: List[str], host: str | None = None, timeout: float = 2.0,
+                            cache_path: str | None = None, ttl_seconds: float = 300) -> bool:
+    """
+    Verifies that the Ollama server is reachable and the required models are available.
+    A single query to the HTTP API replaces the `ollama` CLI probes; the answer is cached on disk for ttl_seconds.
+    Logs errors or instructions if requirements are missing and returns whether everything is available.
+    """
+    available = installed_models(host, timeout=timeout, cache_path=cache_path, ttl_seconds=ttl_seconds)
+    if available is None:
+        return False
+
+    # Models pulled without an explicit tag are listed as name:latest
+    missing = [m for m in models if m not in available and f"{m}:latest" not in available]
 
     if missing:
-        logger.error("⚠️ These models are missing:", missing)
-        logger.error("➡️ You can install it by executing 'ollama install modelname'.")
-    else:
-        logger.info("✅ All given models are installed correctly.")
\ No newline at end of file
+        logger.error(f"⚠️ These models are missing: {missing}")
+        logger.error("➡️ You can install it by executing 'ollama pull modelname'.")
+        # Do not keep a negative answer around, the user is about to pull the model
+        if cache_path and os.path.exists(cache_path):
+            os.remove(cache_path)
+        return False
+
+    logger.info("✅ All given models are installed correctly.")
+    return True
@@ -0,0 +1,126 @@
+import io
+import os
+import threading
+from concurrent.futures import Future
+from typing import TYPE_CHECKING
+
+from PIL import Image
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def letterbox_image(image: Image.Image, imgsz: int = 640, fill: int = 114) -> tuple[Image.Image, float, tuple[int, int]]:
+    """
+    Scales an image aspect-preserving onto an imgsz x imgsz gray RGB canvas (like Ultralytics).
+    Returns (canvas, scale factor, (pad_x, pad_y)).
+    """
+    image = image.convert("RGB")
+    width, height = image.size
+    ratio = min(imgsz / width, imgsz / height)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    pad_x, pad_y = (imgsz - new_width) // 2, (imgsz - new_height) // 2
+
+    canvas = Image.new("RGB", (imgsz, imgsz), (fill, fill, fill))
+    canvas.paste(image.resize((new_width, new_height), Image.BILINEAR), (pad_x, pad_y))
+    return canvas, ratio, (pad_x, pad_y)
+
+
+def letterbox(image: Image.Image, imgsz: int = 640, fill: int = 114) -> tuple["np.ndarray", float, tuple[int, int]]:
+    """
+    Letterboxes an image like letterbox_image for model input.
+    Returns (CHW float32 in [0, 1], scale factor, (pad_x, pad_y)).
+    """
+    # numpy is only needed by the local model backends; importing it lazily keeps startup fast
+    import numpy as np
+
+    canvas, ratio, (pad_x, pad_y) = letterbox_image(image, imgsz, fill)
+    array = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+    return array, ratio, (pad_x, pad_y)
+
+
+class Page:
+    """
+    A rasterized PDF page passed between stages in memory.
+    The full-resolution image is decoded at most once; each backend gets a derived copy sized and encoded for it,
+    while box coordinates always refer to the full-resolution pixels (`size`).
+    """
+
+    def __init__(self, image_path: str, pdf_file: str | None = None, page_number: int | None = None,
+                 image: Image.Image | None = None) -> None:
+        self.image_path = image_path
+        self.pdf_file = pdf_file
+        self.page_number = page_number
+        self._image = image
+        self._derived: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        # Set by the rasterizer while the image file is still being written in the background
+        self.written: Future | None = None
+
+    @classmethod
+    def of(cls, page: "Page | str") -> "Page":
+        """Wraps an image path into a Page; Page objects are returned unchanged."""
+        return page if isinstance(page, Page) else cls(page)
+
+    @property
+    def name(self) -> str:
+        """File name of the page image, e.g. page_00001.png."""
+        return os.path.basename(self.image_path)
+
+    @property
+    def image(self) -> Image.Image:
+        """Full-resolution image; loaded from image_path on first access if the page was not kept in memory."""
+        with self._lock:
+            if self._image is None:
+                self.wait_written()
+                with Image.open(self.image_path) as image:
+                    self._image = image.convert("RGB")
+            return self._image
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.image.size
+
+    def for_gemini(self, max_side: int = 1568, fmt: str = "JPEG", quality: int = 85) -> tuple[bytes, str]:
+        """Returns (encoded bytes, mime type) downscaled so the longer side is at most max_side."""
+        key = ("gemini", max_side, fmt.upper(), quality)
+        with self._lock:
+            if key in self._derived:
+                return self._derived[key]
+
+        image = self.image.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if fmt.upper() == "WEBP":
+            image.save(buffer, "WEBP", quality=quality, method=4)
+        else:
+            image.save(buffer, fmt.upper(), quality=quality, optimize=True)
+        encoded = (buffer.getvalue(), Image.MIME[fmt.upper()])
+
+        with self._lock:
+            self._derived[key] = encoded
+        return encoded
+
+    def for_yolo(self, imgsz: int = 640) -> tuple["np.ndarray", float, tuple[int, int]]:
+        """Returns the letterboxed CHW array plus the scale and padding needed to map boxes back."""
+        key = ("yolo", imgsz)
+        with self._lock:
+            if key in self._derived:
+                return self._derived[key]
+
+        letterboxed = letterbox(self.image, imgsz)
+        with self._lock:
+            self._derived[key] = letterboxed
+        return letterboxed
+
+    def wait_written(self) -> str:
+        """Blocks until the image file exists on disk and returns its path."""
+        if self.written is not None:
+            self.written.result()
+        return self.image_path
+
+    def release(self) -> None:
+        """Drops the decoded image and all derived copies (the page can still be reloaded from image_path)."""
+        with self._lock:
+            self._image = None
+            self._derived.clear()
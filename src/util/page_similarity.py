@@ -0,0 +1,330 @@
+import threading
+import time
+from typing import Callable, Iterable
+
+import numpy as np
+from PIL import Image
+from loguru import logger
+
+from util.cache_store import SqliteStore
+from util.config_reader import ConfigLoader
+from util import metrics
+
+# Side of the grayscale thumbnail kept per page; changed regions are located on it (about 20 px per cell on A4 at 300 dpi)
+THUMBNAIL_SIDE = 128
+# Gray levels a thumbnail cell must change by to count as different (rendering noise stays below)
+PIXEL_CHANGE_THRESHOLD = 24
+# Pages are only compared if their aspect ratios differ by less than this (relative)
+ASPECT_TOLERANCE = 0.01
+
+
+def page_thumbnail(image: Image.Image) -> np.ndarray:
+    """Returns the THUMBNAIL_SIDE x THUMBNAIL_SIDE grayscale thumbnail (aspect ratio is dropped) of a page."""
+    return np.asarray(image.convert("L").resize((THUMBNAIL_SIDE, THUMBNAIL_SIDE), Image.BOX, reducing_gap=2.0), dtype=np.uint8)
+
+
+def dhash(thumbnail: np.ndarray, hash_size: int = 8) -> int:
+    """Difference hash: one bit per horizontally adjacent pair of a (hash_size + 1) x hash_size downscale."""
+    small = np.asarray(Image.fromarray(thumbnail).resize((hash_size + 1, hash_size), Image.BOX), dtype=np.int16)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def diff_region(thumbnail: np.ndarray, other: np.ndarray, page_size: tuple[int, int]) -> tuple[list[int] | None, float]:
+    """
+    Compares two page thumbnails and returns ([x1, y1, x2, y2] in page pixels, fraction of the page area) of the
+    bounding box around all changed cells, grown by one cell; (None, 0.0) if no cell changed.
+    """
+    changed = np.abs(thumbnail.astype(np.int16) - other.astype(np.int16)) > PIXEL_CHANGE_THRESHOLD
+    if not changed.any():
+        return None, 0.0
+
+    rows, columns = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+    x1, x2 = max(0, int(columns[0]) - 1), min(THUMBNAIL_SIDE, int(columns[-1]) + 2)
+    y1, y2 = max(0, int(rows[0]) - 1), min(THUMBNAIL_SIDE, int(rows[-1]) + 2)
+    width, height = page_size
+    region = [x1 * width // THUMBNAIL_SIDE, y1 * height // THUMBNAIL_SIDE,
+              -(-x2 * width // THUMBNAIL_SIDE), -(-y2 * height // THUMBNAIL_SIDE)]
+    return region, (x2 - x1) * (y2 - y1) / THUMBNAIL_SIDE ** 2
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over hashes with the Hamming distance: a lookup within max_distance only descends into
+    children whose edge distance lies in [d - max_distance, d + max_distance], i.e. a small part of the corpus.
+    """
+
+    def __init__(self) -> None:
+        # node: [hash, keys with this hash, {edge distance: child node}]
+        self._root: list | None = None
+        self.size = 0
+
+    def add(self, value: int, key: str) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [key], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                if key not in node[1]:
+                    node[1].append(key)
+                return
+            if distance not in node[2]:
+                node[2][distance] = [value, [key], {}]
+                return
+            node = node[2][distance]
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, int, str]]:
+        """Returns (distance, hash, key) of every entry within max_distance, closest first."""
+        found, stack = [], [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, node[0], key) for key in node[1])
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return sorted(found)
+
+
+class PageFingerprint:
+    """dHash and thumbnail of one page image, taken once per page."""
+
+    def __init__(self, image: Image.Image, hash_size: int = 8) -> None:
+        self.size = image.size
+        self.thumbnail = page_thumbnail(image)
+        self.hash = dhash(self.thumbnail, hash_size)
+
+
+class PageMatch:
+    """An earlier page similar to the current one; region is None for an identical page, else the changed area."""
+
+    def __init__(self, key: str, size: tuple[int, int], region: list[int] | None, area: float) -> None:
+        self.key = key
+        self.size = size
+        self.region = region
+        self.area = area
+
+
+class PageSimilarityIndex(SqliteStore):
+    """
+    Corpus-wide index of page fingerprints (dHash plus thumbnail), persisted in SQLite and searched through an
+    in-memory BK-tree that is built when the index is opened. A page key that is indexed again replaces its entry.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS page_fingerprints ("
+                " page_key TEXT PRIMARY KEY,"
+                " dhash TEXT NOT NULL,"
+                " width INTEGER NOT NULL,"
+                " height INTEGER NOT NULL,"
+                " thumbnail BLOB NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+        self._tree = BKTree()
+        # page key -> (hash, page size) of its current entry; superseded tree entries are filtered on lookup
+        self._entries: dict[str, tuple[int, tuple[int, int]]] = {}
+        with self._lock:
+            for key, value, width, height in self._connection.execute(
+                    "SELECT page_key, dhash, width, height FROM page_fingerprints"):
+                self._entries[key] = (int(value, 16), (width, height))
+                self._tree.add(int(value, 16), key)
+
+    def put(self, key: str, fingerprint: PageFingerprint) -> None:
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO page_fingerprints (page_key, dhash, width, height, thumbnail, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, f"{fingerprint.hash:x}", *fingerprint.size, fingerprint.thumbnail.tobytes(), time.time()),
+            )
+            if self._entries.get(key, (None,))[0] != fingerprint.hash:
+                self._tree.add(fingerprint.hash, key)
+            self._entries[key] = (fingerprint.hash, fingerprint.size)
+
+    def find(self, fingerprint: PageFingerprint, max_distance: int) -> list[tuple[int, str, tuple[int, int]]]:
+        """Returns (distance, page key, page size) of the indexed pages with a similar hash and aspect ratio, closest first."""
+        with self._lock:
+            return [(distance, key, self._entries[key][1])
+                    for distance, value, key in self._tree.search(fingerprint.hash, max_distance)
+                    if self._entries.get(key, (None,))[0] == value and _same_aspect(fingerprint.size, self._entries[key][1])]
+
+    def rename_pages(self, renames: dict[str, str], removed: Iterable[str] = ()) -> None:
+        """Moves entries of renumbered pages to their new keys (applied at once) and drops removed pages."""
+        with self.transaction() as connection:
+            rows = [connection.execute(
+                "SELECT dhash, width, height, thumbnail, created_at FROM page_fingerprints WHERE page_key = ?", (old,)
+            ).fetchone() for old in renames]
+            connection.executemany(
+                "DELETE FROM page_fingerprints WHERE page_key = ?",
+                [(key,) for key in {*renames, *renames.values(), *removed}],
+            )
+            connection.executemany(
+                "INSERT INTO page_fingerprints (page_key, dhash, width, height, thumbnail, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(new, *row) for new, row in zip(renames.values(), rows) if row is not None],
+            )
+            for key in {*renames, *renames.values(), *removed}:
+                self._entries.pop(key, None)
+            for new, row in zip(renames.values(), rows):
+                if row is not None:
+                    self._entries[new] = (int(row[0], 16), (row[1], row[2]))
+                    self._tree.add(int(row[0], 16), new)
+
+    def thumbnail(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            row = self._connection.execute("SELECT thumbnail FROM page_fingerprints WHERE page_key = ?", (key,)).fetchone()
+        return np.frombuffer(row[0], dtype=np.uint8).reshape(THUMBNAIL_SIDE, THUMBNAIL_SIDE) if row else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def _same_aspect(size: tuple[int, int], other: tuple[int, int]) -> bool:
+    return abs(size[0] * other[1] - other[0] * size[1]) <= ASPECT_TOLERANCE * size[1] * other[0]
+
+
+class PageDeduplicator:
+    """
+    Finds an already detected page that is identical or nearly identical to the current one (incremental-reveal
+    slides, repeated title or agenda pages) within one document and across the corpus.
+    Pages still being detected are tracked as well, so a duplicate waits for its original instead of sending
+    a request of its own. has_boxes(key) tells whether saved boxes of an indexed page can be reused.
+    """
+
+    def __init__(self, index: PageSimilarityIndex, max_distance: int = 10, max_diff_area: float = 0.5,
+                 hash_size: int = 8) -> None:
+        self.index = index
+        self.max_distance = max_distance
+        self.max_diff_area = max_diff_area
+        self.hash_size = hash_size
+        self._lock = threading.Lock()
+        # page key -> (fingerprint, event set once its detection finished)
+        self._in_flight: dict[str, tuple[PageFingerprint, threading.Event]] = {}
+        self.pages = 0
+        self.duplicates = 0
+        self.partial = 0
+        self.partial_area = 0.0
+        self.near = 0
+
+    def match(self, key: str, image: Image.Image, has_boxes: Callable[[str], bool]) -> tuple[PageFingerprint, PageMatch | None]:
+        """
+        Returns the page fingerprint and the best reusable match (identical first, then the smallest changed area
+        up to max_diff_area), or None; in that case the page is registered as in flight until done() is called.
+        """
+        with metrics.span("page_fingerprint"):
+            fingerprint = PageFingerprint(image, self.hash_size)
+
+        waited = set()
+        while True:
+            candidates = [(other, size, self.index.thumbnail(other))
+                          for _, other, size in self.index.find(fingerprint, self.max_distance)
+                          if other != key and has_boxes(other)]
+            with self._lock:
+                best = self._best_match(fingerprint, candidates)
+                pending = None
+                if best is None or best.region is not None:
+                    pending = self._best_match(fingerprint, [
+                        (other, other_fingerprint.size, other_fingerprint.thumbnail)
+                        for other, (other_fingerprint, _) in self._in_flight.items()
+                        if other != key and other not in waited
+                        and hamming_distance(fingerprint.hash, other_fingerprint.hash) <= self.max_distance
+                        and _same_aspect(fingerprint.size, other_fingerprint.size)
+                    ])
+                # A page still in flight is worth waiting for if it is identical or nothing detected matches
+                if pending is not None and (best is None or pending.region is None):
+                    event = self._in_flight[pending.key][1]
+                else:
+                    self.pages += 1
+                    if best is None:
+                        self._in_flight[key] = (fingerprint, threading.Event())
+                    return fingerprint, best
+            waited.add(pending.key)
+            # The original was registered before any page waiting for it, so waits cannot form a cycle
+            event.wait()
+
+    def _best_match(self, fingerprint: PageFingerprint, candidates: list) -> PageMatch | None:
+        best = None
+        for other, size, thumbnail in candidates:
+            if thumbnail is None:
+                continue
+            region, area = diff_region(fingerprint.thumbnail, thumbnail, fingerprint.size)
+            if area > self.max_diff_area:
+                continue
+            if best is None or area < best.area:
+                best = PageMatch(other, size, region, area)
+            if region is None:
+                break
+        return best
+
+    def done(self, key: str, fingerprint: PageFingerprint, detected: bool) -> None:
+        """Indexes a page whose boxes were saved and releases pages waiting for it."""
+        if detected:
+            self.index.put(key, fingerprint)
+        with self._lock:
+            entry = self._in_flight.pop(key, None)
+        if entry is not None:
+            entry[1].set()
+
+    def record(self, result: str, area: float = 0.0) -> None:
+        """
+        Counts how a page was served: "duplicate" (boxes reused), "partial" (only the changed region of the given
+        page area fraction detected), "near" (near duplicate detected in full) or "unique".
+        """
+        with self._lock:
+            if result == "duplicate":
+                self.duplicates += 1
+            elif result == "partial":
+                self.partial += 1
+                self.partial_area += area
+            elif result == "near":
+                self.near += 1
+        metrics.count("page_dedup", result=result)
+
+    def stats(self) -> dict:
+        """Pages seen, duplicates served without an API call (= saved calls) and near duplicates (partially or fully detected)."""
+        with self._lock:
+            return {
+                "pages": self.pages,
+                "duplicates": self.duplicates,
+                "partial": self.partial,
+                "saved_api_calls": self.duplicates,
+                "partial_mean_area": round(self.partial_area / self.partial, 3) if self.partial else 0.0,
+                "near": self.near,
+                "indexed_pages": len(self.index),
+            }
+
+
+_similarity_indexes: dict[str, PageSimilarityIndex] = {}
+
+
+def get_page_similarity_index(config: ConfigLoader) -> PageSimilarityIndex | None:
+    """Returns the shared index in GENENERAL_CONFIGURATION.CACHE_DATABASES.PAGE_SIMILARITY, or None if none is configured."""
+    path = config._config["GENENERAL_CONFIGURATION"]["CACHE_DATABASES"].get("PAGE_SIMILARITY")
+    if not path:
+        return None
+    if path not in _similarity_indexes:
+        _similarity_indexes[path] = PageSimilarityIndex(path)
+        logger.debug(f"Page similarity index loaded: {len(_similarity_indexes[path])} pages")
+    return _similarity_indexes[path]
+
+
+def get_page_deduplicator(config: ConfigLoader) -> PageDeduplicator | None:
+    """Returns a deduplicator on the shared page similarity index, or None if GEMINI_SETTINGS.DEDUP_ENABLED is off."""
+    settings = config._config.get("GEMINI_SETTINGS", {})
+    index = get_page_similarity_index(config) if settings.get("DEDUP_ENABLED", False) else None
+    if index is None:
+        return None
+    return PageDeduplicator(
+        index,
+        max_distance=settings.get("DEDUP_MAX_DISTANCE", 10),
+        max_diff_area=settings.get("DEDUP_MAX_DIFF_AREA", 0.5),
+    )
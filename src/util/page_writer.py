@@ -0,0 +1,133 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image
+
+from util import metrics
+
+# Storage formats for rasterized pages: file extension and PIL save arguments
+PAGE_FORMATS = {
+    "png": (".png", lambda level: {"format": "PNG", "compress_level": level}),
+    "webp": (".webp", lambda level: {"format": "WEBP", "lossless": True, "quality": 0, "method": min(level, 6)}),
+    "tiff": (".tiff", lambda level: {"format": "TIFF", "compression": "raw"}),
+}
+PAGE_EXTENSIONS = tuple(extension for extension, _ in PAGE_FORMATS.values())
+
+
+class PageWriter:
+    """
+    Encodes and writes page images on a bounded pool of background threads, so rasterization never waits on disk.
+    At most `max_pending` pages are queued; `submit` blocks beyond that to keep memory bounded.
+    """
+
+    def __init__(self, fmt: str = "png", compress_level: int = 1, grayscale: bool = False,
+                 workers: int = 2, max_pending: int = 8) -> None:
+        if fmt not in PAGE_FORMATS:
+            raise ValueError(f"Unknown page image format: {fmt} (expected one of {', '.join(PAGE_FORMATS)})")
+        self.fmt = fmt
+        self.extension, save_args = PAGE_FORMATS[fmt]
+        self.save_args = save_args(compress_level)
+        self.grayscale = grayscale
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="page-writer") if workers > 0 else None
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._pending: set[Future] = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> "PageWriter":
+        """Creates a writer from the PROCESS_SETTINGS.PAGE_IMAGE_* / PAGE_WRITER_* values (flattened keys)."""
+        return cls(
+            fmt=settings.get("PROCESS_SETTINGS_PAGE_IMAGE_FORMAT", "png"),
+            compress_level=settings.get("PROCESS_SETTINGS_PAGE_IMAGE_COMPRESS_LEVEL", 1),
+            grayscale=settings.get("PROCESS_SETTINGS_PAGE_IMAGE_GRAYSCALE", False),
+            workers=settings.get("PROCESS_SETTINGS_PAGE_WRITER_THREADS", 2),
+            max_pending=settings.get("PROCESS_SETTINGS_PAGE_WRITER_MAX_PENDING", 8),
+        )
+
+    def path_for(self, folder: str, page_number: int) -> str:
+        """Returns the deterministic image path for a 1-based page number."""
+        return os.path.join(folder, f"page_{page_number:05d}{self.extension}")
+
+    def save(self, image: Image.Image, path: str) -> str:
+        """Encodes and writes one image synchronously; writes to a temp file first so readers never see partial pages."""
+        if self.grayscale and image.mode != "L":
+            image = image.convert("L")
+        tmp_path = f"{path}.part"
+        with metrics.span("page_write", format=self.fmt):
+            image.save(tmp_path, **self.save_args)
+            os.replace(tmp_path, path)
+        return path
+
+    def submit(self, image: Image.Image, path: str) -> Future:
+        """Queues one image for writing and returns a future resolving to its path."""
+        if self._executor is None:
+            future = Future()
+            future.set_result(self.save(image, path))
+            return future
+
+        self._slots.acquire()
+        future = self._executor.submit(self.save, image, path)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    def flush(self) -> None:
+        """Waits for all queued writes; re-raises the first write error."""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result()
+
+    def close(self) -> None:
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "PageWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def benchmark_page_formats(image: Image.Image, compress_levels=(0, 1, 6, 9)) -> list[dict]:
+    """
+    Encodes one page with every storage format and returns size, encode and decode time per variant,
+    to help pick the trade-off for PROCESS_SETTINGS.PAGE_IMAGE_FORMAT.
+    """
+    variants = [("png", level, False) for level in compress_levels]
+    variants += [("webp", 0, False), ("webp", 4, False), ("tiff", 0, False), ("png", 1, True), ("tiff", 0, True)]
+    report = []
+
+    for fmt, level, grayscale in variants:
+        source = image.convert("L") if grayscale else image
+        save_args = PAGE_FORMATS[fmt][1](level)
+        buffer = io.BytesIO()
+        started = time.perf_counter()
+        source.save(buffer, **save_args)
+        encode_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        Image.open(io.BytesIO(buffer.getvalue())).load()
+        decode_seconds = time.perf_counter() - started
+
+        report.append({
+            "format": fmt,
+            "compress_level": level if fmt != "tiff" else None,
+            "grayscale": grayscale,
+            "size_mb": round(buffer.tell() / 1e6, 2),
+            "encode_ms": round(encode_seconds * 1000, 1),
+            "decode_ms": round(decode_seconds * 1000, 1),
+        })
+
+    return report
+
@@ -0,0 +1,66 @@
+import hashlib
+
+
+def _object_digest(obj, memo: dict, resolving: set) -> bytes:
+    """
+    Content digest of a PDF object graph: dictionaries and arrays are hashed by their (resolved) entries, streams by
+    their still encoded bytes, so identical content gets the same digest after a re-save renumbers the objects.
+    Indirect objects shared between pages (fonts, images) are hashed once per document.
+    """
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+    if isinstance(obj, IndirectObject):
+        reference = (obj.idnum, obj.generation)
+        if reference in memo:
+            return memo[reference]
+        if reference in resolving:
+            # A reference back into an object being hashed (e.g. /Parent); its content is already covered
+            return b"cycle"
+        resolving.add(reference)
+        digest = _object_digest(obj.get_object(), memo, resolving)
+        resolving.discard(reference)
+        memo[reference] = digest
+        return digest
+
+    hasher = hashlib.sha256()
+    if isinstance(obj, DictionaryObject):
+        hasher.update(b"dict" if not isinstance(obj, StreamObject) else b"stream")
+        for key in sorted(obj.keys()):
+            if key == "/Length":
+                continue
+            hasher.update(str(key).encode("utf-8", "surrogatepass"))
+            hasher.update(_object_digest(obj.raw_get(key), memo, resolving))
+        if isinstance(obj, StreamObject):
+            # The encoded bytes are enough to tell content apart and spare decompressing images and fonts
+            data = getattr(obj, "_data", None)
+            hasher.update(data if isinstance(data, bytes) else obj.get_data())
+    elif isinstance(obj, ArrayObject):
+        hasher.update(b"array")
+        for item in obj:
+            hasher.update(_object_digest(item, memo, resolving))
+    else:
+        hasher.update(type(obj).__name__.encode("ascii"))
+        hasher.update(repr(obj).encode("utf-8", "surrogatepass"))
+    return hasher.digest()
+
+
+def page_fingerprints(pdf_file: str) -> list[str]:
+    """
+    Returns one fingerprint per page (in page order) from the page's content streams, resources, page boxes
+    and rotation, without rasterizing. Pages rendering the same content get the same fingerprint, in any PDF.
+    """
+    # pypdf is only needed when a PDF changed since its last fingerprinting
+    from pypdf import PdfReader
+
+    reader = PdfReader(pdf_file)
+    memo: dict[tuple[int, int], bytes] = {}
+    fingerprints = []
+    for page in reader.pages:
+        hasher = hashlib.sha256()
+        hasher.update(repr([list(page.mediabox), list(page.cropbox), page.rotation]).encode("ascii"))
+        for key in ("/Contents", "/Resources"):
+            hasher.update(key.encode("ascii"))
+            if key in page:
+                hasher.update(_object_digest(page.raw_get(key), memo, set()))
+        fingerprints.append(hasher.hexdigest())
+    return fingerprints
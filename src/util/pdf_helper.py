@@ -1,87 +1,383 @@
 import os
-from pdf2image import convert_from_path
+import re
 from loguru import logger
 from util.config_reader import ConfigLoader
+from util.cache_store import get_transformation_cache
+from util.detection_io import document_name, move_files
+from util import metrics
+from util.page import Page
+from util.page_writer import PageWriter
 from pathlib import Path
+from typing import Callable, Iterator
 
-def pdfs_to_images(source_pdf_files: set, target_folder: str, dpi: int = 300) -> list[tuple[str, str]]:
-    """Converts PDF pages to images and saves them to the target folder."""
+def _output_subfolder(pdf_file: str, target_folder: str) -> str:
+    """Returns (and creates) the per-document image folder."""
+    pdf_name = os.path.splitext(os.path.basename(pdf_file))[0]
+    output_subfolder = os.path.join(target_folder, pdf_name)
+    os.makedirs(output_subfolder, exist_ok=True)
+    return output_subfolder
+
+def _storage_settings(storage: dict | None) -> dict:
+    """Picks the page storage settings (PROCESS_SETTINGS_PAGE_*) out of a flattened config."""
+    return {key: value for key, value in (storage or {}).items() if key.startswith("PROCESS_SETTINGS_PAGE_")}
+
+def _iter_page_range(pdf_file: str, output_subfolder: str, dpi: int, first_page: int, last_page: int, page_window: int,
+                     writer: PageWriter) -> Iterator[Page]:
+    """
+    Rasterizes pages first_page..last_page in windows of page_window pages and yields each page, image still in memory.
+    Encoding and writing run on the writer's background threads; Page.wait_written() blocks until the file exists.
+    """
+    # pdf2image is imported on first use, so fully cached runs start faster
+    from pdf2image import convert_from_path
+
+    for window_start in range(first_page, last_page + 1, page_window):
+        window_end = min(window_start + page_window - 1, last_page)
+        with metrics.span("rasterize_window", document=os.path.basename(output_subfolder)):
+            images = convert_from_path(pdf_file, dpi=dpi, first_page=window_start, last_page=window_end, grayscale=writer.grayscale)
+        metrics.count("pages_rasterized", len(images))
+        for offset, image in enumerate(images):
+            image_path = writer.path_for(output_subfolder, window_start + offset)
+            page = Page(image_path, pdf_file, window_start + offset, image=image)
+            page.written = writer.submit(image, image_path)
+            yield page
+        # Drop the window before decoding the next one
+        del images
+
+def _page_runs(page_numbers: list[int], pages_per_task: int) -> Iterator[tuple[int, int]]:
+    """Groups sorted page numbers into (first_page, last_page) runs of consecutive pages, at most pages_per_task long."""
+    first_page = last_page = None
+    for page_number in page_numbers:
+        if first_page is not None and page_number == last_page + 1 and page_number - first_page < pages_per_task:
+            last_page = page_number
+            continue
+        if first_page is not None:
+            yield first_page, last_page
+        first_page = last_page = page_number
+    if first_page is not None:
+        yield first_page, last_page
+
+def plan_page_ranges(source_pdf_files, target_folder: str, dpi: int = 300, pages_per_task: int = 16, page_window: int = 4,
+                     report: dict | None = None, pages: dict[str, list[int] | None] | None = None) -> list[tuple]:
+    """
+    Splits the documents into page range tasks (pdf_file, output_subfolder, dpi, first_page, last_page, page_window).
+    pages limits a document to the given page numbers (e.g. the changed pages found by plan_page_updates; None = all).
+    Documents whose page count cannot be read are logged and skipped; their error and the page counts are recorded in report.
+    """
+    if not source_pdf_files:
+        return []
+
+    tasks = []
+    for pdf_file in sorted(source_pdf_files):
+        page_numbers = (pages or {}).get(pdf_file)
+        if page_numbers is None:
+            from pdf2image import pdfinfo_from_path
+
+            try:
+                page_count = pdfinfo_from_path(pdf_file)["Pages"]
+            except Exception as e:
+                logger.error(f"❌ Error at {pdf_file}: {e}")
+                if report is not None:
+                    report[pdf_file]["errors"].append(str(e))
+                continue
+            page_numbers = range(1, page_count + 1)
+
+        if report is not None:
+            report[pdf_file]["page_count"] = len(page_numbers)
+        output_subfolder = _output_subfolder(pdf_file, target_folder)
+        for first_page, last_page in _page_runs(sorted(page_numbers), pages_per_task):
+            tasks.append((pdf_file, output_subfolder, dpi, first_page, last_page, page_window))
+    return tasks
+
+def iter_page_range(task: tuple, writer: PageWriter) -> Iterator[Page]:
+    """Rasterizes one planned page range task, yielding each page with its image still in memory (see plan_page_ranges)."""
+    pdf_file, output_subfolder, dpi, first_page, last_page, page_window = task
+    return _iter_page_range(pdf_file, output_subfolder, dpi, first_page, last_page, page_window, writer)
+
+def iter_pdf_images(source_pdf_files: set, target_folder: str, dpi: int = 300, page_window: int = 4, pages_per_task: int = 16,
+                    storage: dict | None = None) -> Iterator[tuple[str, str]]:
+    """
+    Converts PDF pages to images in bounded page windows and yields (image_path, pdf_file) as soon as each page is written.
+    At most `page_window` decoded pages are held in memory at any time, independent of the document length.
+    A failing document (or page range) is logged and skipped; the remaining documents are still converted.
+    """
     os.makedirs(target_folder, exist_ok=True)
-    image_paths = []
+    if not source_pdf_files:
+        logger.info("ℹ️  No pdf documents were found to convert.")
+        return
+    logger.info(f"ℹ️  Found pdf documents: {len(source_pdf_files)}. starting conversion...")
+
+    page_window = max(1, int(page_window))
+    with PageWriter.from_settings(_storage_settings(storage)) as writer:
+        for task in plan_page_ranges(source_pdf_files, target_folder, dpi, max(1, int(pages_per_task)), page_window):
+            try:
+                for page in iter_page_range(task, writer):
+                    page.wait_written()
+                    page.release()
+                    yield page.image_path, page.pdf_file
+            except Exception as e:
+                logger.error(f"❌ Error at {task[0]} (pages {task[3]}-{task[4]}): {e}")
+
+def _rasterize_page_range(task: tuple, storage: dict) -> list[str]:
+    """Process pool task: rasterizes one planned page range (see plan_page_ranges) and waits until all pages are written."""
+    with PageWriter.from_settings(storage) as writer:
+        return [page.wait_written() for page in iter_page_range(task, writer)]
+
+def rasterize_pdfs(
+    source_pdf_files: set,
+    target_folder: str,
+    dpi: int = 300,
+    workers: int | None = None,
+    pages_per_task: int = 16,
+    page_window: int = 4,
+    storage: dict | None = None,
+) -> dict[str, dict]:
+    """
+    Converts PDFs to images on a process pool, split by document and page range.
+    Pages are stored in the format given by the PROCESS_SETTINGS_PAGE_* keys of storage (e.g. the flattened config).
+    Returns a per-document report: {pdf_file: {"pages": [(image_path, pdf_file), ...], "page_count": int, "errors": [str, ...]}}.
+    Errors are isolated to the failing task; a document with errors keeps no pages in its report.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    os.makedirs(target_folder, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    pages_per_task = max(1, int(pages_per_task))
+    page_window = max(1, min(int(page_window), pages_per_task))
+    storage = _storage_settings(storage)
 
     if not source_pdf_files:
         logger.info("ℹ️  No pdf documents were found to convert.")
-        return []
-    else:
-        logger.info(f"ℹ️  Found pdf documents: {len(source_pdf_files)}. starting converison...")
+        return {}
+    logger.info(f"ℹ️  Found pdf documents: {len(source_pdf_files)}. starting conversion with {workers} workers...")
 
-    for pdf_file in source_pdf_files:
-        pdf_name = os.path.splitext(os.path.basename(pdf_file))[0]
-        output_subfolder = os.path.join(target_folder, pdf_name)
-        os.makedirs(output_subfolder, exist_ok=True)
+    report = {pdf_file: {"pages": [], "page_count": 0, "errors": []} for pdf_file in sorted(source_pdf_files)}
+    tasks = plan_page_ranges(report, target_folder, dpi, pages_per_task, page_window, report)
 
+    page_paths = {pdf_file: [] for pdf_file in report}
+
+    def collect(task, run):
+        pdf_file, first_page, last_page = task[0], task[3], task[4]
         try:
-            images = convert_from_path(pdf_file, dpi=dpi)
-            for i, image in enumerate(images):
-                image_path = os.path.join(output_subfolder, f"page_{i+1:05d}.png")
-                image.save(image_path, "PNG")
-                image_paths.append((image_path, pdf_file))
-            logger.info(f"✅ {pdf_file} -> {len(images)} pages exportet.")
+            page_paths[pdf_file].extend(run())
         except Exception as e:
-            logger.error(f"❌ Error ar {pdf_file}: {e}")
-            return []
-    
-    return image_paths
+            logger.error(f"❌ Error at {pdf_file} (pages {first_page}-{last_page}): {e}")
+            report[pdf_file]["errors"].append(f"pages {first_page}-{last_page}: {e}")
 
-def cache_image_creation(image_paths: list[tuple[str, str]], config: ConfigLoader) -> None:
-    """Caches the mapping between created images and their source PDFs."""
-    cache_list = []
-
-    for image_path, pdf_file in image_paths:
-        cache_list.append(("CONVERTED_IMAGES <--> " + image_path, pdf_file))
-    
-    config.cache_values(
-        path=config._config["GENENERAL_CONFIGURATION"]["CACHE_FILES"]["TRANSFORMATION"],
-        items=cache_list,
-        split_char=" <--> ",
-        split=True
-    )
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            collect(task, lambda task=task: _rasterize_page_range(task, storage))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            futures = {executor.submit(_rasterize_page_range, task, storage): task for task in tasks}
+            for future in as_completed(futures):
+                collect(futures[future], future.result)
 
-def load_cached_pdfs(pdf_paths: set[str], config: ConfigLoader) -> set[str]:
+    for pdf_file, result in report.items():
+        if result["errors"]:
+            continue
+        result["pages"] = [(image_path, pdf_file) for image_path in sorted(page_paths[pdf_file])]
+        logger.info(f"✅ {pdf_file} -> {len(result['pages'])} pages exported.")
+
+    return report
+
+def pdfs_to_images(
+    source_pdf_files: set,
+    target_folder: str,
+    dpi: int = 300,
+    page_window: int = 4,
+    workers: int | None = 1,
+    pages_per_task: int = 16,
+    storage: dict | None = None,
+) -> list[tuple[str, str]]:
     """
-    Checks for cached PDF conversions. 
-    Deletes orphaned images and removes up-to-date PDFs from the processing list.
+    Converts PDF pages to images and saves them to the target folder; returns [(image_path, pdf_file), ...].
+    Streams through iter_pdf_images, or uses the process pool of rasterize_pdfs if more than one worker is asked for.
     """
-    image_pdf_pairs = config._config.get("CACHE", {}).get("CONVERTED_IMAGES", {}).items()
-    
-    for image_path, pdf_path in image_pdf_pairs:
+    with metrics.span("pdfs_to_images"):
+        if workers == 1:
+            return list(iter_pdf_images(source_pdf_files, target_folder, dpi=dpi, page_window=page_window,
+                                        pages_per_task=pages_per_task, storage=storage))
+        report = rasterize_pdfs(source_pdf_files, target_folder, dpi=dpi, workers=workers, pages_per_task=pages_per_task,
+                                page_window=page_window, storage=storage)
+    return [page for result in report.values() for page in result["pages"]]
+
+def cache_image_creation(image_paths: list[tuple[str, str]], config: ConfigLoader) -> None:
+    """Caches the mapping between created images and their source PDFs."""
+    cache = get_transformation_cache(config)
+    count = cache.put_many(image_paths)
+    logger.info(f"Cached {count} items to {cache.path}")
+
+def load_cached_images(config: ConfigLoader) -> list[str]:
+    """Returns all cached image paths."""
+    return [image_path for image_path, _ in get_transformation_cache(config).items()]
+
+def _remove_orphaned_images(cache) -> None:
+    """Deletes cached images (and their cache entries) whose PDF no longer exists."""
+    orphaned_images = []
+    orphaned_pdfs = set()
+
+    for image_path, pdf_path in cache.items():
         image_file = Path(image_path)
         pdf_file = Path(pdf_path)
-        
-        # Cleanup: Delete image if PDF is missing
-        if (not pdf_file.exists()) and image_file.exists():
+        if pdf_file.exists():
+            continue
+
+        orphaned_images.append(image_path)
+        orphaned_pdfs.add(pdf_path)
+        if image_file.exists():
             try:
                 image_file.unlink()
-                print(f"Deleted image: {image_path}")
-                
+                logger.info(f"🗑️  Deleted image: {image_path}")
+
                 parent_dir = image_file.parent
                 if parent_dir.exists() and not any(parent_dir.iterdir()):
                     parent_dir.rmdir()
-                    print(f"Deleted empty directory: {parent_dir}")
+                    logger.info(f"🗑️  Deleted empty directory: {parent_dir}")
             except Exception as e:
-                print(f"Error deleting image or directory: {e}")
+                logger.error(f"❌ Error deleting image or directory: {e}")
 
-        # Skip processing if PDF is older than cached image
-        if pdf_file.exists() and image_file.exists():
-            try:
-                pdf_mtime = pdf_file.stat().st_mtime
-                image_mtime = image_file.stat().st_mtime
-                
-                if pdf_mtime < image_mtime and pdf_path in pdf_paths:
-                    pdf_paths.remove(pdf_path)
-                    
-            except Exception as e:
-                print(f"Error checking modification times: {e}")
-    
-    return pdf_paths
-    
\ No newline at end of file
+    if orphaned_images:
+        cache.delete_many(orphaned_images)
+        cache.delete_pdfs(orphaned_pdfs)
+
+def _page_number(image_path: str, page_number: int | None) -> int | None:
+    """Page number of a cached image; rows cached before page numbers were stored fall back to the file name."""
+    if page_number is not None:
+        return page_number
+    match = re.fullmatch(r"page_(\d+)", os.path.splitext(os.path.basename(image_path))[0])
+    return int(match.group(1)) if match else None
+
+def _current_fingerprints(pdf_file: str, cache) -> list[str] | None:
+    """Page fingerprints of a PDF, computed only if the file changed since they were stored; None if it cannot be parsed."""
+    stat = os.stat(pdf_file)
+    fingerprints = cache.pdf_fingerprints(pdf_file, stat.st_size, stat.st_mtime_ns)
+    if fingerprints is None:
+        from util.pdf_fingerprint import page_fingerprints
+
+        try:
+            with metrics.span("pdf_fingerprint", document=os.path.basename(pdf_file)):
+                fingerprints = page_fingerprints(pdf_file)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not fingerprint the pages of {pdf_file}, it is converted completely: {e}")
+            return None
+        cache.put_pdf_fingerprints(pdf_file, stat.st_size, stat.st_mtime_ns, fingerprints)
+    return fingerprints
+
+def _plan_pdf(pdf_file: str, cache) -> dict | None:
+    """
+    Compares the current page fingerprints of a PDF with its cached images. Returns None if every page is up to date,
+    else {"pages": page numbers to rasterize (None = all), "fingerprints": [...], "kept": int,
+    "moves": [(old image path, new image path, new page number)], "removed": [image paths of dropped pages]}.
+    """
+    fingerprints = _current_fingerprints(pdf_file, cache)
+    pdf_mtime = os.stat(pdf_file).st_mtime
+    rows = [(image_path, _page_number(image_path, page_number), fingerprint)
+            for image_path, page_number, fingerprint in cache.pages_for_pdf(pdf_file) if os.path.exists(image_path)]
+
+    if fingerprints is None:
+        # Without fingerprints a PDF is up to date as long as one of its images is newer
+        if any(os.stat(image_path).st_mtime > pdf_mtime for image_path, _, _ in rows):
+            return None
+        return {"pages": None, "fingerprints": None, "kept": 0, "moves": [], "removed": []}
+
+    # Images cached before page fingerprints existed adopt the current fingerprint if they are newer than the PDF
+    adopted = {image_path: fingerprints[page_number - 1] for image_path, page_number, fingerprint in rows
+               if fingerprint is None and page_number and page_number <= len(fingerprints)
+               and os.stat(image_path).st_mtime > pdf_mtime}
+    if adopted:
+        cache.put_many([(image_path, pdf_file, _page_number(image_path, None), fingerprint)
+                        for image_path, fingerprint in adopted.items()])
+        rows = [(image_path, page_number, fingerprint or adopted.get(image_path)) for image_path, page_number, fingerprint in rows]
+
+    cached = {page_number: fingerprint for _, page_number, fingerprint in rows if page_number}
+    kept = {page_number for page_number, fingerprint in enumerate(fingerprints, 1) if cached.get(page_number) == fingerprint}
+
+    # Images no longer matching their own page can serve a page whose content moved (inserted or removed pages)
+    spare: dict[str, list[str]] = {}
+    for image_path, page_number, fingerprint in rows:
+        if page_number not in kept and fingerprint:
+            spare.setdefault(fingerprint, []).append(image_path)
+
+    moves, pages = [], []
+    for page_number, fingerprint in enumerate(fingerprints, 1):
+        if page_number in kept:
+            continue
+        if spare.get(fingerprint):
+            image_path = spare[fingerprint].pop(0)
+            new_path = os.path.join(os.path.dirname(image_path), f"page_{page_number:05d}{os.path.splitext(image_path)[1]}")
+            moves.append((image_path, new_path, page_number))
+        else:
+            pages.append(page_number)
+
+    moved_from = {old_path for old_path, _, _ in moves}
+    removed = [image_path for image_path, page_number, _ in rows
+               if page_number and page_number > len(fingerprints) and image_path not in moved_from]
+    if not pages and not moves and not removed:
+        return None
+    return {"pages": pages, "fingerprints": fingerprints, "kept": len(kept), "moves": moves, "removed": removed}
+
+def _apply_renumbering(plan: dict, cache, on_renumber: Callable[[str, dict[str, str], list[str]], None] | None) -> None:
+    """Renames the images of moved pages, deletes those of removed pages and updates the cache (and derived outputs)."""
+    moves, removed = plan["moves"], plan["removed"]
+    move_files({old_path: new_path for old_path, new_path, _ in moves if old_path != new_path})
+    for image_path in removed:
+        os.remove(image_path)
+    cache.move_pages(moves, removed)
+
+    if on_renumber is not None:
+        documents: dict[str, tuple[dict[str, str], list[str]]] = {}
+        for old_path, new_path, _ in moves:
+            documents.setdefault(document_name(old_path), ({}, []))[0][_page_name(old_path)] = _page_name(new_path)
+        for image_path in removed:
+            documents.setdefault(document_name(image_path), ({}, []))[1].append(_page_name(image_path))
+        for document, (renames, removed_pages) in documents.items():
+            on_renumber(document, renames, removed_pages)
+
+def _page_name(image_path: str) -> str:
+    return os.path.splitext(os.path.basename(image_path))[0]
+
+def _changed_pages(pdf_file: str, plan: dict, cache) -> list[str]:
+    """Page names to rasterize again; a PDF converted completely (pages None) changes every page it had cached."""
+    if plan["pages"] is None:
+        return sorted(_page_name(image_path) for image_path, _, _ in cache.pages_for_pdf(pdf_file))
+    return [f"page_{page_number:05d}" for page_number in plan["pages"]]
+
+def plan_page_updates(pdf_paths: set[str], config: ConfigLoader,
+                      on_renumber: Callable[[str, dict[str, str], list[str]], None] | None = None) -> dict[str, dict]:
+    """
+    Decides page by page what has to be converted again: each PDF page is fingerprinted from its content streams
+    and resources (only when the file changed) and compared with the fingerprints stored with its cached image.
+    Pages whose content moved (inserted or removed pages) get their cached image renamed instead of being converted;
+    on_renumber(document, {old page name: new page name}, [removed page names]) lets callers move derived outputs;
+    it is called once more with the pages to convert as removed, so their outputs of the old content are dropped.
+    Deletes orphaned images and returns {pdf_file: plan} for the PDFs with pages to convert (see _plan_pdf).
+    """
+    cache = get_transformation_cache(config)
+    _remove_orphaned_images(cache)
+
+    plans = {}
+    for pdf_file in sorted(pdf_paths):
+        plan = _plan_pdf(pdf_file, cache)
+        if plan is None:
+            continue
+        if plan["moves"] or plan["removed"]:
+            _apply_renumbering(plan, cache, on_renumber)
+        changed = _changed_pages(pdf_file, plan, cache)
+        if on_renumber is not None and changed:
+            # Outputs of pages whose content changed are stale; they are regenerated after rasterizing
+            on_renumber(os.path.splitext(os.path.basename(pdf_file))[0], {}, changed)
+        if plan["pages"] is None:
+            logger.info(f"ℹ️  {pdf_file}: converting all pages")
+        else:
+            logger.info(f"ℹ️  {pdf_file}: {plan['kept']} pages unchanged, {len(plan['moves'])} renumbered, "
+                        f"{len(plan['removed'])} removed, {len(plan['pages'])} to convert")
+        if plan["pages"] is None or plan["pages"]:
+            plans[pdf_file] = plan
+    return plans
+
+def load_cached_pdfs(pdf_paths: set[str], config: ConfigLoader) -> set[str]:
+    """
+    Checks for cached PDF conversions. 
+    Deletes orphaned images and removes up-to-date PDFs from the processing list (see plan_page_updates).
+    """
+    return set(plan_page_updates(pdf_paths, config))
@@ -0,0 +1,304 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable
+
+from loguru import logger
+
+from util import metrics
+
+# End-of-stream marker passed between stages
+_DONE = object()
+
+
+class Stage:
+    """
+    One pipeline step run by `workers` threads, reading from a bounded input queue of `queue_size` items.
+    fn receives one item (or a list of up to batch_size items, returning one result per item) and returns its result;
+    None drops the item. With fan_out, fn returns an iterable and every element is passed on.
+    With limit, the stage passes on at most `limit` items and then stops all stages upstream of it.
+    """
+
+    def __init__(self, name: str, fn: Callable, workers: int = 1, queue_size: int = 4, batch_size: int = 1,
+                 batch_timeout: float = 0.5, fan_out: bool = False, limit: int | None = None) -> None:
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_timeout = batch_timeout
+        self.fan_out = fan_out
+        self.limit = limit or None
+
+
+class StageStats:
+    """Counters of one stage, updated by its workers."""
+
+    def __init__(self, name: str, workers: int) -> None:
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0  # waiting for room in the downstream queue (backpressure)
+        self.idle_seconds = 0.0  # waiting for input
+        self.latencies: list[float] = []  # seconds per item
+        # (item, results it produced before the error, error) of every failed item; a fan-out item may fail midway
+        self.failed: list[tuple[object, int, str]] = []
+        self.lock = threading.Lock()
+
+    def record_latency(self, seconds: float, items: int = 1) -> None:
+        with self.lock:
+            self.latencies.extend([seconds] * items)
+        for _ in range(items if metrics.enabled() else 0):
+            metrics.observe("pipeline_item", seconds, stage=self.name)
+
+    def latency_percentiles(self, percentiles=(50, 95, 99)) -> dict[str, float | None]:
+        """Per-item latency percentiles in milliseconds (nearest rank)."""
+        with self.lock:
+            latencies = sorted(self.latencies)
+        return {
+            f"p{percentile}_ms": round(latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)] * 1000, 2)
+            if latencies else None
+            for percentile in percentiles
+        }
+
+    def summary(self, wall_seconds: float) -> dict:
+        wall_seconds = max(wall_seconds, 1e-9)
+        # Time spent waiting on a full downstream queue is not work
+        busy_seconds = max(0.0, self.busy_seconds - self.blocked_seconds)
+        return {
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "errors": self.errors,
+            "items_per_second": round(self.items_out / wall_seconds, 2),
+            "busy_seconds": round(busy_seconds, 2),
+            "utilization": round(busy_seconds / (wall_seconds * self.workers), 2),
+            "blocked_seconds": round(self.blocked_seconds, 2),
+            "idle_seconds": round(self.idle_seconds, 2),
+            **self.latency_percentiles(),
+        }
+
+
+class Pipeline:
+    """
+    Connects stages with bounded queues so items flow through as soon as they are ready, e.g.
+    rasterize -> detect -> postprocess -> visualize. A full queue blocks its producer (backpressure), so at most
+    sum(queue_size) + workers items are in flight at any time.
+    Errors are isolated per item: a failing item is logged, counted, recorded in stats[stage].failed and dropped.
+    A fan-out item failing midway keeps the results it produced so far; the rest of its expansion is lost.
+    cancel() stops feeding new items and lets items already in flight finish; cancel(drain=False) stops every stage
+    after its current item.
+    """
+
+    def __init__(self, stages: list[Stage], poll_interval: float = 0.1) -> None:
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.stats = {stage.name: StageStats(stage.name, stage.workers) for stage in stages}
+        self.results: list = []
+        self._poll_interval = poll_interval
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        # Stages with an index below _closed_below accept no new input
+        self._closed_below = 0
+        self._emitted = [0] * len(stages)
+        self._running_workers = [stage.workers for stage in stages]
+        self._lock = threading.Lock()
+        self._wall_seconds = 0.0
+
+    def _close_upstream(self, index: int) -> None:
+        """Stops feeding the stages up to and including index."""
+        with self._lock:
+            self._closed_below = max(self._closed_below, index + 1)
+
+    def _is_closed(self, index: int) -> bool:
+        return index < self._closed_below
+
+    def cancel(self, drain: bool = True) -> None:
+        """Stops the source; with drain=False every stage stops after its current item."""
+        self._close_upstream(len(self.stages) - 1 if not drain else 0)
+        logger.warning("🛑 Pipeline cancelled" + (", finishing items in flight" if drain else ""))
+
+    def _put(self, index: int, item, stats: StageStats | None = None) -> bool:
+        """Puts an item into the input queue of stage index, waiting for room; False if that stage is closed."""
+        if index == len(self.stages):
+            with self._lock:
+                self.results.append(item)
+            return True
+
+        started = time.perf_counter()
+        try:
+            while not self._is_closed(index):
+                try:
+                    self._queues[index].put(item, timeout=self._poll_interval)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            if stats is not None:
+                with stats.lock:
+                    stats.blocked_seconds += time.perf_counter() - started
+
+    def _emit(self, index: int, result, stats: StageStats) -> bool:
+        """Passes one result of stage index downstream, honouring its limit; False once the stage must stop."""
+        stage = self.stages[index]
+        with self._lock:
+            if stage.limit is not None and self._emitted[index] >= stage.limit:
+                return False
+            self._emitted[index] += 1
+            reached_limit = stage.limit is not None and self._emitted[index] >= stage.limit
+
+        if not self._put(index + 1, result, stats):
+            return False
+        with stats.lock:
+            stats.items_out += 1
+        if reached_limit:
+            logger.info(f"ℹ️  Stage '{stage.name}' reached its limit of {stage.limit} items")
+            self._close_upstream(index)
+            return False
+        return True
+
+    def _take(self, index: int, stats: StageStats) -> list | None:
+        """Waits for the next item (or batch) of stage index; None at end of stream or once the stage is closed."""
+        stage = self.stages[index]
+        input_queue = self._queues[index]
+        started = time.perf_counter()
+        items = []
+
+        try:
+            while not items:
+                if self._is_closed(index):
+                    return None
+                try:
+                    item = input_queue.get(timeout=self._poll_interval)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    # Leave the marker for the sibling workers
+                    input_queue.put(_DONE)
+                    return None
+                items.append(item)
+
+            # Collect a batch, waiting at most batch_timeout for it to fill
+            deadline = time.monotonic() + stage.batch_timeout
+            while len(items) < stage.batch_size:
+                try:
+                    item = input_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    input_queue.put(_DONE)
+                    break
+                items.append(item)
+            return items
+        finally:
+            with stats.lock:
+                stats.idle_seconds += time.perf_counter() - started
+
+    def _work(self, index: int) -> None:
+        stage = self.stages[index]
+        stats = self.stats[stage.name]
+
+        try:
+            while (items := self._take(index, stats)) is not None:
+                with stats.lock:
+                    stats.items_in += len(items)
+
+                started = time.perf_counter()
+                produced_results = 0
+                try:
+                    results = stage.fn(items) if stage.batch_size > 1 else [stage.fn(items[0])]
+                    if stage.fan_out:
+                        results = (element for result in results for element in result or ())
+                    else:
+                        stats.record_latency((time.perf_counter() - started) / len(items), len(items))
+
+                    keep_going = True
+                    produced = time.perf_counter()
+                    for result in results:
+                        if stage.fan_out:
+                            # Per produced element, excluding the time spent waiting on the downstream queue
+                            stats.record_latency(time.perf_counter() - produced)
+                        # A closed fan-out stage stops expanding (e.g. no further pages of a cancelled document)
+                        if stage.fan_out and self._is_closed(index):
+                            keep_going = False
+                            break
+                        if result is not None and not self._emit(index, result, stats):
+                            keep_going = False
+                            break
+                        produced_results += 1
+                        produced = time.perf_counter()
+                except Exception as e:
+                    after = f" after {produced_results} result(s)" if stage.fan_out and produced_results else ""
+                    logger.error(f"❌ Stage '{stage.name}' failed for {len(items)} item(s){after}: {e}")
+                    with stats.lock:
+                        stats.errors += len(items)
+                        stats.failed.extend((item, produced_results, str(e)) for item in items)
+                    keep_going = True
+                finally:
+                    with stats.lock:
+                        stats.busy_seconds += time.perf_counter() - started
+
+                if not keep_going:
+                    break
+        finally:
+            with self._lock:
+                self._running_workers[index] -= 1
+                last_worker = self._running_workers[index] == 0
+            if last_worker and index + 1 < len(self.stages):
+                self._put(index + 1, _DONE)
+
+    def _feed(self, source: Iterable) -> None:
+        try:
+            for item in source:
+                if not self._put(0, item):
+                    break
+        except Exception as e:
+            logger.error(f"❌ Pipeline source failed: {e}")
+        finally:
+            self._put(0, _DONE)
+
+    def run(self, source: Iterable) -> list:
+        """
+        Feeds the source items into the first stage and blocks until every stage has finished.
+        Returns the results of the last stage (in completion order). The first Ctrl+C cancels gracefully,
+        the second stops every stage after its current item.
+        """
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._feed, args=(source,), name="pipeline-source", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            threads += [
+                threading.Thread(target=self._work, args=(index,), name=f"pipeline-{stage.name}-{worker}", daemon=True)
+                for worker in range(stage.workers)
+            ]
+        for thread in threads:
+            thread.start()
+
+        interrupts = 0
+        for thread in threads:
+            while thread.is_alive():
+                try:
+                    thread.join(timeout=self._poll_interval)
+                except KeyboardInterrupt:
+                    interrupts += 1
+                    self.cancel(drain=interrupts == 1)
+
+        self._wall_seconds = time.perf_counter() - started
+        self.log_summary()
+        return self.results
+
+    def summary(self) -> dict[str, dict]:
+        """Per-stage throughput and time split of the last run."""
+        return {name: stats.summary(self._wall_seconds) for name, stats in self.stats.items()}
+
+    def log_summary(self) -> None:
+        logger.info(f"📊 Pipeline finished in {self._wall_seconds:.1f}s")
+        for name, summary in self.summary().items():
+            logger.info(
+                f"   {name:<12} {summary['items_out']:>6} items ({summary['items_per_second']}/s), "
+                f"{summary['errors']} errors, utilization {summary['utilization']:.0%}, "
+                f"blocked {summary['blocked_seconds']}s, idle {summary['idle_seconds']}s, "
+                f"p50 {summary['p50_ms']}ms, p95 {summary['p95_ms']}ms"
+            )
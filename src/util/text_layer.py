@@ -0,0 +1,296 @@
+import io
+import os
+import shutil
+import subprocess
+import threading
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+
+from loguru import logger
+
+from util.config_reader import ConfigLoader
+from util.detection_io import write_boxes
+from util.page import Page
+from util import metrics
+
+TEXT_LABEL = "text"
+
+
+class TextPage:
+    """The text layer of one PDF page in PDF points: line boxes, character count, text area and raster image area."""
+
+    def __init__(self, width: float, height: float) -> None:
+        self.width = width
+        self.height = height
+        self.lines: list[list[float]] = []
+        self.chars = 0
+        self.text_area = 0.0
+        self.image_area = 0.0
+
+    @property
+    def text_coverage(self) -> float:
+        """Fraction of the page covered by word boxes."""
+        return self.text_area / (self.width * self.height) if self.width and self.height else 0.0
+
+    @property
+    def image_coverage(self) -> float:
+        """Fraction of the page covered by raster images (at most 1, even if images overlap)."""
+        return min(1.0, self.image_area / (self.width * self.height)) if self.width and self.height else 0.0
+
+
+def _poppler(arguments: list[str], timeout: float) -> str:
+    return subprocess.run(arguments, capture_output=True, timeout=timeout, check=True).stdout.decode("utf-8", "replace")
+
+
+def _page_arguments(first_page: int | None, last_page: int | None) -> list[str]:
+    return (["-f", str(first_page)] if first_page else []) + (["-l", str(last_page)] if last_page else [])
+
+
+def read_text_layer(pdf_file: str, first_page: int | None = None, last_page: int | None = None,
+                    timeout: float = 60.0) -> dict[int, TextPage]:
+    """
+    Reads the word and line boxes of the pages first_page..last_page (default: all) with poppler's
+    `pdftotext -bbox-layout` and returns {page number: TextPage}; nothing is rasterized.
+    """
+    output = _poppler(["pdftotext", "-bbox-layout", *_page_arguments(first_page, last_page), pdf_file, "-"], timeout)
+
+    # XHTML: <page width height> <flow> <block> <line xMin yMin xMax yMax> <word xMin yMin xMax yMax>text</word>
+    pages: dict[int, TextPage] = {}
+    page_number = (first_page or 1) - 1
+    current = None
+    for event, element in ElementTree.iterparse(io.StringIO(output), events=("start", "end")):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if event == "start":
+            if tag == "page":
+                page_number += 1
+                current = pages[page_number] = TextPage(float(element.get("width")), float(element.get("height")))
+            continue
+
+        if tag == "word" and current is not None:
+            text = (element.text or "").strip()
+            if text:
+                current.chars += len(text)
+                current.text_area += (max(float(element.get("xMax")) - float(element.get("xMin")), 0.0)
+                                      * max(float(element.get("yMax")) - float(element.get("yMin")), 0.0))
+        elif tag == "line" and current is not None:
+            if any((word.text or "").strip() for word in element):
+                current.lines.append([float(element.get(name)) for name in ("xMin", "yMin", "xMax", "yMax")])
+            element.clear()
+    return pages
+
+
+def read_image_areas(pdf_file: str, first_page: int | None = None, last_page: int | None = None,
+                     timeout: float = 60.0) -> dict[int, float]:
+    """
+    Returns {page number: area in square points covered by raster images} from `pdfimages -list`, which reports
+    every placed image with its pixel size and placement resolution (a scanned page is one image the size of the page).
+    """
+    output = _poppler(["pdfimages", "-list", *_page_arguments(first_page, last_page), pdf_file], timeout)
+
+    # Columns: page num type width height color comp bpc enc interp object ID x-ppi y-ppi size ratio, after 2 header lines
+    areas: dict[int, float] = {}
+    for row in output.splitlines()[2:]:
+        parts = row.split()
+        if len(parts) < 14 or parts[2] not in ("image", "stencil"):
+            continue
+        try:
+            page_number, width, height = int(parts[0]), int(parts[3]), int(parts[4])
+            x_ppi, y_ppi = float(parts[12]), float(parts[13])
+        except ValueError:
+            continue
+        if x_ppi > 0 and y_ppi > 0:
+            areas[page_number] = areas.get(page_number, 0.0) + (width / x_ppi * 72) * (height / y_ppi * 72)
+    return areas
+
+
+def cluster_lines(lines: list[list[float]], line_gap: float = 0.8, column_gap: float = 1.0,
+                  size_ratio: float = 1.5) -> list[list[int]]:
+    """
+    Groups text lines ([x1, y1, x2, y2]) into logical blocks and returns the line indices of each block in reading order.
+    Two lines are neighbours if they are stacked at most line_gap line heights apart, overlap horizontally and have
+    similar heights (at most size_ratio apart, so headings stay separate from body text), or if they share a row at
+    most column_gap line heights apart. Blocks are the connected components of the neighbour graph; columns and
+    paragraphs separated by more than the gaps become blocks of their own.
+    """
+    if not lines:
+        return []
+    # numpy is only needed for pages that take the text layer path
+    import numpy as np
+
+    x1, y1, x2, y2 = np.asarray(lines, dtype=np.float64).reshape(-1, 4).T
+    heights = np.maximum(y2 - y1, 1e-6)
+    min_height = np.minimum(heights[:, None], heights[None, :])
+    ratio = np.maximum(heights[:, None], heights[None, :]) / min_height
+    # Negative gaps are overlaps
+    vertical_gap = np.maximum(y1[:, None], y1[None, :]) - np.minimum(y2[:, None], y2[None, :])
+    horizontal_gap = np.maximum(x1[:, None], x1[None, :]) - np.minimum(x2[:, None], x2[None, :])
+    stacked = (vertical_gap <= line_gap * min_height) & (horizontal_gap < 0) & (ratio <= size_ratio)
+    same_row = (vertical_gap <= -0.5 * min_height) & (horizontal_gap <= column_gap * min_height)
+    neighbours = stacked | same_row
+
+    component = np.full(len(heights), -1)
+    for start in range(len(heights)):
+        if component[start] >= 0:
+            continue
+        component[start] = start
+        stack = [start]
+        while stack:
+            line = stack.pop()
+            for other in np.flatnonzero(neighbours[line] & (component < 0)):
+                component[other] = start
+                stack.append(other)
+
+    blocks: dict[int, list[int]] = {}
+    for line, block in enumerate(component.tolist()):
+        blocks.setdefault(block, []).append(line)
+    return sorted(blocks.values(), key=lambda indices: (min(y1[indices]), min(x1[indices])))
+
+
+def block_boxes(lines: list[list[float]], blocks: list[list[int]], padding: float = 0.15) -> list[list[float]]:
+    """Encloses the lines of each block, padded by a fraction of its median line height (ascenders, descenders)."""
+    boxes = []
+    for indices in blocks:
+        block_lines = [lines[index] for index in indices]
+        heights = sorted(line[3] - line[1] for line in block_lines)
+        pad = heights[len(heights) // 2] * padding
+        boxes.append([min(line[0] for line in block_lines) - pad, min(line[1] for line in block_lines) - pad,
+                      max(line[2] for line in block_lines) + pad, max(line[3] for line in block_lines) + pad])
+    return boxes
+
+
+class TextLayerAnalyzer:
+    """
+    Fast path for born-digital PDFs: finds the text blocks of a page in the PDF's own text layer (poppler's bbox output)
+    instead of asking a detector. A page qualifies if its text layer holds at least min_chars characters covering at
+    least min_text_coverage of the page and raster images cover at most max_image_coverage; scanned and image-heavy
+    pages are left to the detectors. Each document is read once (per change) for all of its pages; the last
+    max_documents documents are kept.
+    """
+
+    def __init__(self, min_chars: int = 20, min_text_coverage: float = 0.002, max_image_coverage: float = 0.1,
+                 line_gap: float = 0.8, column_gap: float = 1.0, size_ratio: float = 1.5, timeout: float = 60.0,
+                 max_documents: int = 8) -> None:
+        self.min_chars = min_chars
+        self.min_text_coverage = min_text_coverage
+        self.max_image_coverage = max_image_coverage
+        self.line_gap = line_gap
+        self.column_gap = column_gap
+        self.size_ratio = size_ratio
+        self.timeout = timeout
+        self.max_documents = max(1, max_documents)
+        self._documents: OrderedDict[tuple, dict[int, TextPage] | None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._document_locks: dict[str, threading.Lock] = {}
+        self.text_pages = 0
+        self.fallbacks = {"no_text": 0, "images": 0, "unreadable": 0}
+
+    @classmethod
+    def from_settings(cls, config: dict) -> "TextLayerAnalyzer":
+        """Creates the analyzer from the TEXT_LAYER section of a flattened config (e.g. ConfigLoader.view())."""
+        return cls(
+            min_chars=config.get("TEXT_LAYER_MIN_CHARS", 20),
+            min_text_coverage=config.get("TEXT_LAYER_MIN_TEXT_COVERAGE", 0.002),
+            max_image_coverage=config.get("TEXT_LAYER_MAX_IMAGE_COVERAGE", 0.1),
+            line_gap=config.get("TEXT_LAYER_LINE_GAP", 0.8),
+            column_gap=config.get("TEXT_LAYER_COLUMN_GAP", 1.0),
+            size_ratio=config.get("TEXT_LAYER_SIZE_RATIO", 1.5),
+            timeout=config.get("TEXT_LAYER_TIMEOUT_SECONDS", 60.0),
+        )
+
+    def _document_lock(self, pdf_file: str) -> threading.Lock:
+        with self._lock:
+            return self._document_locks.setdefault(pdf_file, threading.Lock())
+
+    def document(self, pdf_file: str) -> dict[int, TextPage] | None:
+        """Text layer and image areas of every page of a PDF, or None if poppler cannot read it."""
+        stat = os.stat(pdf_file)
+        key = (pdf_file, stat.st_mtime_ns, stat.st_size)
+        # One poppler run per document, even if several pages of it are detected at once
+        with self._document_lock(pdf_file):
+            with self._lock:
+                if key in self._documents:
+                    self._documents.move_to_end(key)
+                    return self._documents[key]
+
+            try:
+                with metrics.span("text_layer_read", document=os.path.basename(pdf_file)):
+                    pages = read_text_layer(pdf_file, timeout=self.timeout)
+                    for page_number, area in read_image_areas(pdf_file, timeout=self.timeout).items():
+                        if page_number in pages:
+                            pages[page_number].image_area = area
+            except (OSError, subprocess.SubprocessError, ElementTree.ParseError, ValueError) as e:
+                logger.warning(f"⚠️ Could not read the text layer of {pdf_file}, its pages go to the detector: {e}")
+                pages = None
+
+            with self._lock:
+                self._documents[key] = pages
+                while len(self._documents) > self.max_documents:
+                    self._documents.popitem(last=False)
+            return pages
+
+    def _fallback(self, reason: str) -> None:
+        with self._lock:
+            self.fallbacks[reason] += 1
+        metrics.count("text_layer_pages", result=reason)
+
+    def page_blocks(self, pdf_file: str, page_number: int) -> tuple[TextPage, list[list[float]]] | None:
+        """(text page, block boxes in PDF points) of a page with a usable text layer, or None if it needs a detector."""
+        pages = self.document(pdf_file)
+        text_page = pages.get(page_number) if pages is not None else None
+        if text_page is None:
+            self._fallback("unreadable")
+            return None
+        if text_page.chars < self.min_chars or text_page.text_coverage < self.min_text_coverage:
+            self._fallback("no_text")
+            return None
+        if text_page.image_coverage > self.max_image_coverage:
+            self._fallback("images")
+            return None
+
+        blocks = cluster_lines(text_page.lines, self.line_gap, self.column_gap, self.size_ratio)
+        return text_page, block_boxes(text_page.lines, blocks)
+
+    def detect_page(self, page: Page, output_dir: str) -> list[list[int]] | None:
+        """
+        Saves the text blocks of a page in the detector format (pixel boxes labelled "text", score 1) and returns the
+        boxes, or returns None if the page has no usable text layer and must go to a detector.
+        """
+        if page.pdf_file is None or page.page_number is None or not os.path.exists(page.pdf_file):
+            return None
+        with metrics.span("text_layer_page"):
+            result = self.page_blocks(page.pdf_file, page.page_number)
+            if result is None:
+                return None
+            text_page, blocks = result
+
+            width, height = page.size
+            scale_x, scale_y = width / text_page.width, height / text_page.height
+            boxes = [[max(0, round(x1 * scale_x)), max(0, round(y1 * scale_y)), min(width, round(x2 * scale_x)),
+                      min(height, round(y2 * scale_y))] for x1, y1, x2, y2 in blocks]
+            write_boxes(page.image_path, boxes, output_dir, [TEXT_LABEL] * len(boxes), [1.0] * len(boxes),
+                        {"source": "text_layer"})
+        with self._lock:
+            self.text_pages += 1
+        metrics.count("text_layer_pages", result="text")
+        return boxes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"text_pages": self.text_pages, **{f"fallback_{reason}": count for reason, count in self.fallbacks.items()}}
+
+    def log_summary(self) -> None:
+        stats = self.stats()
+        logger.info(f"📝 Text layer: {stats['text_pages']} pages without detector, {stats['fallback_no_text']} without text, "
+                    f"{stats['fallback_images']} image pages and {stats['fallback_unreadable']} unreadable pages sent to the detector")
+
+
+def get_text_layer_analyzer(config: ConfigLoader) -> TextLayerAnalyzer | None:
+    """Returns the text layer analyzer if TEXT_LAYER.ENABLED and poppler's pdftotext and pdfimages are installed."""
+    settings = config.view()
+    if not settings.get("TEXT_LAYER_ENABLED", False):
+        return None
+    missing = [tool for tool in ("pdftotext", "pdfimages") if shutil.which(tool) is None]
+    if missing:
+        logger.warning(f"⚠️ Text layer fast path disabled, poppler tools not found: {', '.join(missing)}")
+        return None
+    return TextLayerAnalyzer.from_settings(settings)
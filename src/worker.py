@@ -0,0 +1,314 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from typing import Callable, Iterator
+
+from loguru import logger
+
+from main import detection_backend, renumber_outputs
+from util.cache_store import get_transformation_cache
+from util.config_reader import ConfigLoader
+from util.detection_io import read_page_boxes
+from util.job_queue import Job, LeaseKeeper, default_worker_id, get_job_queue
+from util.page import Page
+from util.page_writer import PageWriter
+from util.pdf_helper import iter_page_range, plan_page_ranges, plan_page_updates
+from util import metrics
+from gemini_detection.visualize import is_page_done, visualize_page
+
+# A job handler gets a group of leased jobs and yields (job, follow-up jobs) for every job it finished;
+# jobs it does not yield are failed
+Handler = Callable[[list[Job]], Iterator[tuple[Job, list[tuple[str, str, dict, str]]]]]
+
+
+class QueueWorker:
+    """
+    Processes pages from the persistent job queue (util/job_queue.py), stage by stage: rasterize -> detect ->
+    cards (with FLASHCARDS.ENABLED) -> visualize. Every page is one job per stage, keyed by its image path and
+    versioned with its content fingerprint, so finished pages are not processed again and any number of workers
+    (processes, or hosts sharing the data directory) can work on the same queue.
+    """
+
+    def __init__(self, config_loader: ConfigLoader, worker_id: str | None = None, processed_dir: str = "data/processed",
+                 detections_dir: str = "data/detections", visualizations_dir: str = "data/visualizations",
+                 flashcards_dir: str | None = None, gemini_client=None, ollama_client=None) -> None:
+        self.config_loader = config_loader
+        self.config = config_loader.view()
+        self.settings = config_loader._config.get("JOB_QUEUE", {})
+        self.queue = get_job_queue(config_loader)
+        self.worker_id = worker_id or default_worker_id()
+        self.processed_dir = processed_dir
+        self.detections_dir = detections_dir
+        self.visualizations_dir = visualizations_dir
+        self.flashcards_dir = flashcards_dir
+        self.gemini_client = gemini_client
+        self.lease_seconds = self.settings.get("LEASE_SECONDS", 120)
+        self.batch_size = self.settings.get("BATCH_SIZE", 8)
+        self.preview_format = self.config.get("VISUALIZATION_PREVIEW_FORMAT", "png")
+        self.preview_max_side = self.config.get("VISUALIZATION_PREVIEW_MAX_SIDE", 0) or None
+
+        self.flashcards = None
+        if self.config.get("FLASHCARDS_ENABLED", False):
+            from flashcards.generate import FlashcardGenerator
+            self.flashcards = FlashcardGenerator(config_loader, flashcards_dir, ollama_client)
+        self.stages = ["rasterize", "detect", *(["cards"] if self.flashcards is not None else []), "visualize"]
+        # The detector is created on the first detect job, so workers busy with other stages need no API client or model
+        self._detection = None
+        self.leases: LeaseKeeper | None = None
+
+    def _next(self, stage: str, job: Job) -> list[tuple[str, str, dict, str]]:
+        """The follow-up job of a page after stage (same key, payload and version)."""
+        index = self.stages.index(stage) + 1
+        return [(self.stages[index], job.key, job.payload, job.version)] if index < len(self.stages) else []
+
+    def enqueue(self, pdf_files: set[str], force: bool = False) -> int:
+        """
+        Adds a rasterize job for every page with changed content and a detect job for every converted page that is
+        not done yet; returns the number of new or reset jobs. Pages enqueued before in the same version keep their state.
+        """
+        plans = plan_page_updates(set(pdf_files), self.config_loader,
+                                  renumber_outputs(self.config_loader, self.detections_dir, self.visualizations_dir, self.flashcards_dir))
+        tasks = plan_page_ranges(set(plans), self.processed_dir, pages={pdf_file: plan["pages"] for pdf_file, plan in plans.items()})
+
+        rasterize_jobs = []
+        writer = PageWriter.from_settings(self.config)
+        for pdf_file, output_subfolder, dpi, first_page, last_page, _ in tasks:
+            for page_number in range(first_page, last_page + 1):
+                payload = {"pdf_file": pdf_file, "output_subfolder": output_subfolder, "dpi": dpi, "page_number": page_number}
+                if force:
+                    payload["force"] = True
+                rasterize_jobs.append((writer.path_for(output_subfolder, page_number), payload,
+                                       self._version(pdf_file, page_number, plans[pdf_file]["fingerprints"])))
+        writer.close()
+
+        cache = get_transformation_cache(self.config_loader)
+        detect_jobs, detect_pages = [], []
+        for pdf_file in sorted({pdf_file for _, pdf_file in cache.items()}):
+            plan = plans.get(pdf_file)
+            for image_path, page_number, fingerprint in cache.pages_for_pdf(pdf_file):
+                if not os.path.exists(image_path) or (plan is not None and (plan["pages"] is None or page_number in plan["pages"])):
+                    continue
+                page = Page(image_path, pdf_file, page_number)
+                if not force and is_page_done(image_path, self.detections_dir, self.visualizations_dir, self.preview_format) \
+                        and (self.flashcards is None or self.flashcards.has_cards(page)):
+                    continue
+                payload = {"pdf_file": pdf_file, "page_number": page_number}
+                if force:
+                    payload["force"] = True
+                detect_jobs.append((image_path, payload,
+                                    fingerprint or self._version(pdf_file, page_number, None)))
+                detect_pages.append(page)
+
+        if force and self.flashcards is not None:
+            # One rewrite per cards file instead of one per forced card job
+            self.flashcards.drop_cards(detect_pages, force=True)
+        added = self.queue.enqueue("rasterize", rasterize_jobs, force) + self.queue.enqueue("detect", detect_jobs, force)
+        logger.info(f"📥 {added} jobs enqueued ({len(rasterize_jobs)} pages to convert, {len(detect_jobs)} converted pages to finish)")
+        return added
+
+    @staticmethod
+    def _version(pdf_file: str, page_number: int, fingerprints: list[str] | None) -> str:
+        """The page's content fingerprint; PDFs that cannot be fingerprinted are versioned by their modification time."""
+        if fingerprints and page_number <= len(fingerprints):
+            return fingerprints[page_number - 1]
+        return f"mtime:{os.stat(pdf_file).st_mtime_ns}"
+
+    def _rasterize(self, jobs: list[Job]):
+        """Rasterizes a run of consecutive pages of one PDF and records every written image in the transformation cache."""
+        payload = jobs[0].payload
+        by_page = {job.payload["page_number"]: job for job in jobs}
+        task = (payload["pdf_file"], payload["output_subfolder"], payload["dpi"], min(by_page), max(by_page),
+                self.config.get("PROCESS_SETTINGS_PDF_TO_IMAGE_PAGE_WINDOW", 4))
+        cache = get_transformation_cache(self.config_loader)
+        with PageWriter.from_settings(self.config) as writer:
+            for page in iter_page_range(task, writer):
+                job = by_page[page.page_number]
+                version = None if job.version.startswith("mtime:") else job.version
+                cache.put_many([(page.wait_written(), page.pdf_file, page.page_number, version)])
+                page.release()
+                yield job, self._next("rasterize", job)
+
+    def _detect(self, jobs: list[Job]):
+        detect_batch = self._detection[0]
+        by_key = {job.key: job for job in jobs}
+        pages = [Page(job.key, job.payload["pdf_file"], job.payload["page_number"]) for job in jobs]
+        for page, boxes in detect_batch(pages):
+            page.release()
+            if boxes is not None:
+                yield by_key[page.image_path], self._next("detect", by_key[page.image_path])
+
+    def _saved_boxes(self, job: Job) -> tuple[Page, list]:
+        record = read_page_boxes(job.key, self.detections_dir)
+        if record is None:
+            raise RuntimeError("no saved boxes")
+        return Page(job.key, job.payload["pdf_file"], job.payload["page_number"]), record["boxes"]
+
+    def _cards(self, jobs: list[Job]):
+        for job in jobs:
+            page, boxes = self._saved_boxes(job)
+            try:
+                self.flashcards.generate_page(page, boxes, job.payload.get("force", False))
+            finally:
+                page.release()
+            yield job, self._next("cards", job)
+
+    def _visualize(self, jobs: list[Job]):
+        for job in jobs:
+            page, boxes = self._saved_boxes(job)
+            try:
+                visualize_page(page, boxes, self.visualizations_dir, self.preview_max_side, self.preview_format, self.detections_dir)
+            finally:
+                page.release()
+            yield job, []
+
+    def _lease_limit(self, stage: str) -> int:
+        """How many jobs of a stage to lease at once."""
+        if stage == "detect":
+            if self._detection is None:
+                # The detector's batch size is known once it exists; it is only created for leased jobs
+                return self.batch_size
+            _, batch_size, workers, _ = self._detection
+            return batch_size * workers
+        if stage == "cards":
+            return self.flashcards.max_in_flight
+        return self.batch_size
+
+    def _plan(self, stage: str) -> tuple[Handler, int, Callable[[list[Job]], list[list[Job]]]]:
+        """(handler, worker threads, grouping of the leased jobs) of a stage; creates the detector on the first detect jobs."""
+        single = lambda jobs: [[job] for job in jobs]
+        if stage == "rasterize":
+            pages_per_task = self.config.get("PROCESS_SETTINGS_RASTER_PAGES_PER_TASK", 16)
+            workers = self.config.get("PROCESS_SETTINGS_RASTER_WORKERS", 0) or os.cpu_count() or 1
+            return self._rasterize, workers, lambda jobs: _page_runs(jobs, pages_per_task)
+        if stage == "detect":
+            if self._detection is None:
+                self._detection = detection_backend(self.config_loader, self.detections_dir, self.gemini_client)
+            _, batch_size, workers, _ = self._detection
+            return self._detect, workers, \
+                lambda jobs: [jobs[start:start + batch_size] for start in range(0, len(jobs), batch_size)]
+        if stage == "cards":
+            return self._cards, self.flashcards.max_in_flight, single
+        workers = self.config.get("VISUALIZATION_WORKERS", 0) or os.cpu_count() or 1
+        return self._visualize, workers, single
+
+    def _process(self, stage: str, jobs: list[Job], handler: Handler, workers: int, groups: list[list[Job]]) -> None:
+        """Runs the job groups on worker threads; every job is completed as soon as it is finished, the rest are failed."""
+        def run(group: list[Job]) -> None:
+            pending = {job.key: job for job in group}
+            error = "no result"
+            try:
+                for job, next_jobs in handler(group):
+                    if not self.queue.complete(job, self.worker_id, next_jobs):
+                        logger.warning(f"⚠️ {stage} {job.key} finished after its lease was taken over, result not recorded")
+                    self.leases.drop(job)
+                    pending.pop(job.key, None)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            for job in pending.values():
+                state = self.queue.fail(job, self.worker_id, error)
+                self.leases.drop(job)
+                logger.warning(f"⚠️ {stage} {job.key} failed (attempt {job.attempts}, {state}): {error}")
+
+        with metrics.span("job_stage", stage=stage, jobs=len(jobs)):
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(groups))), thread_name_prefix=f"job-{stage}") as executor:
+                list(executor.map(run, groups))
+
+    def run(self, poll: bool = False) -> int:
+        """
+        Works on the queue until no job is pending or leased (or forever with poll); returns the number of jobs processed.
+        Later stages are served first, so pages already in progress are finished before new ones are started.
+        """
+        processed = 0
+        poll_seconds = self.settings.get("POLL_SECONDS", 5)
+        heartbeat_seconds = self.settings.get("HEARTBEAT_SECONDS", 30)
+        logger.info(f"👷 Worker {self.worker_id} started ({', '.join(self.stages)})")
+        with LeaseKeeper(self.queue, self.worker_id, self.lease_seconds, heartbeat_seconds) as self.leases:
+            try:
+                while True:
+                    for stage in reversed(self.stages):
+                        jobs = self.queue.lease(stage, self.worker_id, self._lease_limit(stage), self.lease_seconds)
+                        if jobs:
+                            self.leases.hold(jobs)
+                            handler, workers, grouping = self._plan(stage)
+                            self._process(stage, jobs, handler, workers, grouping(jobs))
+                            processed += len(jobs)
+                            break
+                    else:
+                        if not poll and not self.queue.open_jobs(self.stages):
+                            break
+                        # Jobs waiting for a retry or leased by other workers (whose leases may still expire)
+                        time.sleep(poll_seconds)
+            finally:
+                # Jobs not started yet (e.g. on Ctrl+C) go back to the queue right away instead of waiting for their lease
+                held = self.leases.held()
+                if held:
+                    self.queue.release(self.worker_id, held)
+                    logger.info(f"↩️  {len(held)} unfinished jobs released")
+
+        if self._detection is not None:
+            self._detection[3]()
+        if self.flashcards is not None:
+            self.flashcards.log_summary()
+        logger.info(f"✅ Worker {self.worker_id} processed {processed} jobs")
+        return processed
+
+
+def _page_runs(jobs: list[Job], pages_per_task: int) -> list[list[Job]]:
+    """Groups rasterize jobs into runs of consecutive pages of one PDF, at most pages_per_task long."""
+    runs = []
+    for _, document_jobs in groupby(sorted(jobs, key=lambda job: (job.payload["pdf_file"], job.payload["page_number"])),
+                                    key=lambda job: job.payload["pdf_file"]):
+        for job in document_jobs:
+            if runs and runs[-1][0].payload["pdf_file"] == job.payload["pdf_file"] and len(runs[-1]) < pages_per_task \
+                    and job.payload["page_number"] == runs[-1][-1].payload["page_number"] + 1:
+                runs[-1].append(job)
+            else:
+                runs.append([job])
+    return runs
+
+
+def log_status(config_loader: ConfigLoader) -> None:
+    """Logs the job counts per stage and the dead letters."""
+    queue = get_job_queue(config_loader)
+    for stage, counts in sorted(queue.stats().items()):
+        logger.info(f"📊 {stage}: " + ", ".join(f"{count} {state}" for state, count in counts.items()))
+    for letter in queue.dead_letters():
+        logger.error(f"💀 {letter['stage']} {letter['key']} ({letter['attempts']} attempts): {letter['last_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Processes the pages of data/to_process from the persistent job queue. "
+                                                 "Start it on several processes or hosts to share the work.")
+    parser.add_argument("--enqueue", action="store_true", help="add the changed pages of data/to_process before working")
+    parser.add_argument("--force", action="store_true", help="with --enqueue: process up-to-date and finished pages again")
+    parser.add_argument("--poll", action="store_true", help="keep waiting for new jobs instead of exiting when the queue is empty")
+    parser.add_argument("--status", action="store_true", help="log the job counts and dead letters and exit")
+    parser.add_argument("--retry-dead", action="store_true", help="put the dead letters back into the queue")
+    parser.add_argument("--worker-id", default=None, help="name of this worker in leases (default: host:pid)")
+    args = parser.parse_args()
+
+    config_loader = ConfigLoader()
+    config = config_loader.view()
+    if args.status:
+        log_status(config_loader)
+        return
+    if args.retry_dead:
+        logger.info(f"🔁 {get_job_queue(config_loader).retry_dead()} dead letters queued again")
+
+    metrics.configure(config)
+    try:
+        worker = QueueWorker(config_loader, args.worker_id)
+        if args.enqueue:
+            pdf_files = {os.path.join("data/to_process", f) for f in os.listdir("data/to_process") if f.lower().endswith(".pdf")}
+            worker.enqueue(pdf_files, args.force)
+        worker.run(poll=args.poll)
+    except KeyboardInterrupt:
+        logger.info("⏹️  Worker stopped")
+    finally:
+        metrics.export(config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+import time
+
+from util.detection_io import load_document_boxes, rename_pages, write_boxes
+
+
+def _redetect(output_dir: str, rounds: int) -> None:
+    """Re-detects the same pages over and over and reads the file, which compacts it again and again."""
+    for round_number in range(rounds):
+        write_boxes(os.path.join("processed", "Deck", f"page_{round_number % 4 + 1:05d}.png"), [[0, 0, 1, 1]], output_dir)
+        load_document_boxes("Deck", output_dir)
+
+
+def _detect_new_pages(output_dir: str, first: int, count: int) -> None:
+    for page_number in range(first, first + count):
+        time.sleep(0.002)
+        write_boxes(os.path.join("processed", "Deck", f"page_{page_number:05d}.png"), [[page_number, 0, 9, 9]], output_dir)
+
+
+def test_compaction_keeps_lines_appended_by_other_processes(tmp_path):
+    output_dir = str(tmp_path / "detections")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_redetect, args=(output_dir, 3000)),
+               context.Process(target=_detect_new_pages, args=(output_dir, 100, 60)),
+               context.Process(target=_detect_new_pages, args=(output_dir, 1000, 60))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    pages = load_document_boxes("Deck", output_dir)
+    expected = {f"page_{number:05d}" for number in [*range(1, 5), *range(100, 160), *range(1000, 1060)]}
+    assert set(pages) == expected
+
+
+def test_rename_pages_renumbers_and_drops(tmp_path):
+    output_dir = str(tmp_path / "detections")
+    for page_number in range(1, 4):
+        write_boxes(os.path.join("processed", "Deck", f"page_{page_number:05d}.png"), [[page_number, 0, 9, 9]], output_dir)
+
+    rename_pages("Deck", output_dir, {"page_00002": "page_00003"}, removed=["page_00001"])
+    pages = load_document_boxes("Deck", output_dir)
+    assert sorted(pages) == ["page_00003"]
+    assert pages["page_00003"]["boxes"] == [[2, 0, 9, 9]]
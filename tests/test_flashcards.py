@@ -0,0 +1,76 @@
+from flashcards import generate
+from flashcards.generate import CardStreamParser, CardWriter, FlashcardGenerator
+from util.config_reader import ConfigLoader
+from util.page import Page
+
+
+def _parse(chunks: list[str]) -> list[tuple[str, str]]:
+    parser = CardStreamParser()
+    cards = []
+    for chunk in chunks:
+        cards += parser.feed(chunk)
+    return cards + parser.close()
+
+
+def test_cards_split_across_chunks():
+    text = "Q: Was ist ein Stack?\nA: Eine LIFO-Datenstruktur.\n\n**Q:** Was ist eine Queue?\nA: FIFO,\nmit push und pop.\n"
+    expected = [("Was ist ein Stack?", "Eine LIFO-Datenstruktur."), ("Was ist eine Queue?", "FIFO,\nmit push und pop.")]
+
+    assert _parse([text]) == expected
+    # Split inside a line, inside the "Q:" marker and one character at a time
+    assert _parse([text[:9], text[9:30], text[30:50], text[50:]]) == expected
+    assert _parse([text[:text.index("Q:", 5) + 1], text[text.index("Q:", 5) + 1:]]) == expected
+    assert _parse(list(text)) == expected
+
+
+def test_card_is_emitted_once_the_next_question_starts():
+    parser = CardStreamParser()
+    assert parser.feed("Q: Eins?\nA: 1\n") == []
+    assert parser.feed("Q: Zwei?\n") == [("Eins?", "1")]
+    # A question without answer is dropped
+    assert parser.close() == []
+
+
+def test_page_counts_only_once_completed(tmp_path):
+    writer = CardWriter(str(tmp_path))
+    writer.append({"document": "Deck", "page": "page_00001", "question": "q", "answer": "a"})
+    assert not writer.has_page("Deck", "page_00001")
+
+    writer.complete_page("Deck", "page_00001")
+    assert writer.has_page("Deck", "page_00001")
+
+    # Dropped by another writer (e.g. another process renumbering the document)
+    CardWriter(str(tmp_path)).drop_pages("Deck", ["page_00001"])
+    assert not writer.has_page("Deck", "page_00001")
+
+
+def test_forced_pages_are_dropped_with_one_rewrite_per_document(tmp_path, monkeypatch):
+    config_path = tmp_path / "config.toml"
+    config_path.write_text(f'[CROPS]\nCACHE_DIR = "{tmp_path / "rasters"}"\n')
+    generator = FlashcardGenerator(ConfigLoader(str(config_path)), str(tmp_path / "cards"), client=object())
+    writer = generator.writer
+    for document in ("Deck", "Notes"):
+        for number in range(1, 4):
+            writer.append({"document": document, "page": f"page_{number:05d}", "question": "q", "answer": "a"})
+            # The third page of every document was interrupted before completion
+            if number < 3:
+                writer.complete_page(document, f"page_{number:05d}")
+    pages = [Page(str(tmp_path / "processed" / document / f"page_{number:05d}.png"))
+             for document in ("Deck", "Notes") for number in range(1, 4)]
+
+    rewrites = []
+    replace = generate.os.replace
+    monkeypatch.setattr(generate.os, "replace", lambda source, target: rewrites.append(target) or replace(source, target))
+
+    # Without force only the cards of the interrupted pages go
+    generator.drop_cards(pages)
+    assert len(rewrites) == 2
+    assert [writer.has_page("Deck", f"page_{number:05d}") for number in range(1, 4)] == [True, True, False]
+    assert "page_00003" not in writer._state("Deck")[1]
+
+    generator.drop_cards(pages, force=True)
+    assert len(rewrites) == 4
+    assert not any(writer.has_page(document, f"page_{number:05d}") for document in ("Deck", "Notes") for number in range(1, 4))
+    # Nothing left to drop: generate_page's own drop is a no-op
+    generator.drop_cards(pages, force=True)
+    assert len(rewrites) == 4
@@ -0,0 +1,62 @@
+import time
+
+from util.job_queue import JobQueue
+
+
+def _queue(tmp_path, **kwargs) -> JobQueue:
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), retry_backoff_seconds=0, **kwargs)
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("detect", [("Deck/page_00001", {"page_number": 1}, "v1")])
+
+    first = queue.lease("detect", "worker-a", lease_seconds=0.05)
+    assert [job.key for job in first] == ["Deck/page_00001"]
+    assert queue.lease("detect", "worker-b") == []
+
+    time.sleep(0.1)
+    taken_over = queue.lease("detect", "worker-b")
+    assert [(job.key, job.attempts) for job in taken_over] == [("Deck/page_00001", 2)]
+    # The killed worker no longer holds the lease
+    assert queue.heartbeat("worker-a", first) == 0
+    assert queue.heartbeat("worker-b", taken_over) == 1
+
+    # A late result of the old owner neither completes the job nor enqueues its follow-ups
+    assert not queue.complete(first[0], "worker-a", [("cards", first[0].key, {}, "v1")])
+    assert queue.stats()["detect"]["leased"] == 1 and "cards" not in queue.stats()
+    assert queue.complete(taken_over[0], "worker-b")
+    assert queue.stats()["detect"]["done"] == 1
+
+
+def test_failures_end_as_dead_letter(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    queue.enqueue("detect", [("Deck/page_00001", {}, "v1")])
+
+    job, = queue.lease("detect", "worker-a")
+    assert queue.fail(job, "worker-a", "boom") == "pending"
+    job, = queue.lease("detect", "worker-a")
+    assert queue.fail(job, "worker-a", "boom again") == "dead"
+
+    assert queue.lease("detect", "worker-a") == []
+    assert [(letter["key"], letter["attempts"], letter["last_error"]) for letter in queue.dead_letters("detect")] == \
+        [("Deck/page_00001", 2, "boom again")]
+    assert queue.retry_dead("detect") == 1
+    assert [job.key for job in queue.lease("detect", "worker-a")] == ["Deck/page_00001"]
+
+
+def test_reenqueue_keeps_done_jobs_of_the_same_version(tmp_path):
+    queue = _queue(tmp_path)
+    jobs = [("Deck/page_00001", {}, "v1"), ("Deck/page_00002", {}, "v1")]
+    assert queue.enqueue("detect", jobs) == 2
+
+    for job in queue.lease("detect", "worker-a", limit=2):
+        assert queue.complete(job, "worker-a", [("cards", job.key, job.payload, job.version)])
+    assert queue.enqueue("detect", jobs) == 0
+    assert queue.stats()["detect"]["done"] == 2
+    assert queue.stats()["cards"]["pending"] == 2
+
+    # A new content version starts over, force resets the same version
+    assert queue.enqueue("detect", [("Deck/page_00001", {}, "v2")]) == 1
+    assert queue.enqueue("detect", [("Deck/page_00002", {}, "v1")], force=True) == 1
+    assert queue.stats()["detect"]["pending"] == 2
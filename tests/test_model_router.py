@@ -0,0 +1,127 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from gemini_detection.detect import _generate_with_fallback
+from gemini_detection.fake_client import FakeAPIError
+from gemini_detection.model_router import CLOSED, HALF_OPEN, OPEN, ModelRouter
+from gemini_detection.scheduler import ModelRateLimiter, is_retryable, is_timeout
+
+SETTINGS = {"MAX_RETRIES": 3, "BACKOFF_BASE_SECONDS": 0.0}
+
+
+class ScriptedClient:
+    """Answers generate_content per model with the scripted errors (status codes or exceptions) first, then a response."""
+
+    def __init__(self, script: dict[str, list]) -> None:
+        self.models = self
+        self.script = {model: list(outcomes) for model, outcomes in script.items()}
+        self.calls: list[str] = []
+
+    def generate_content(self, model: str, contents=None, config=None):
+        self.calls.append(model)
+        outcome = self.script.get(model, []).pop(0) if self.script.get(model) else None
+        if isinstance(outcome, int):
+            raise FakeAPIError(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(text="[]", usage_metadata=None)
+
+
+def _generate(client, router: ModelRouter):
+    return _generate_with_fallback(client, router, ["page"], None, ModelRateLimiter({}), 1000, SETTINGS, "Deck/page_00001.png")
+
+
+def _state(router: ModelRouter, model: str) -> str:
+    return router.snapshot()[model]["state"]
+
+
+def test_circuit_opens_probes_and_closes():
+    router = ModelRouter(["a", "b"], failure_threshold=2, cooldown_seconds=0.05)
+    router.record_failure("a", 0.1)
+    assert _state(router, "a") == CLOSED
+    router.record_failure("a", 0.1)
+    assert _state(router, "a") == OPEN and not router.is_available("a")
+    assert router.candidates() == ["b"]
+
+    time.sleep(0.06)
+    # Due for a probe: tried first, but only by one request
+    assert router.candidates() == ["a", "b"]
+    assert _state(router, "a") == HALF_OPEN
+    assert router.candidates() == ["b"]
+
+    # A failed probe opens the circuit again right away, a successful one closes it
+    router.record_failure("a", 0.1)
+    assert _state(router, "a") == OPEN
+    time.sleep(0.06)
+    assert router.candidates()[0] == "a"
+    router.record_success("a", 0.1)
+    assert _state(router, "a") == CLOSED
+    # Back in rotation, but behind the healthy model while its error rate (3 of 4) stays above DEGRADED_ERROR_RATE
+    assert router.candidates() == ["b", "a"]
+
+
+def test_candidates_wait_for_the_cooldown_at_most_max_wait():
+    router = ModelRouter(["a"], failure_threshold=1, cooldown_seconds=0.1, max_wait_seconds=5)
+    router.record_failure("a", 0.1)
+    started = time.monotonic()
+    assert router.candidates() == ["a"]
+    assert 0.05 < time.monotonic() - started < 1
+
+    router = ModelRouter(["a"], failure_threshold=1, cooldown_seconds=60, max_wait_seconds=0.05)
+    router.record_failure("a", 0.1)
+    started = time.monotonic()
+    assert router.candidates() == []
+    assert time.monotonic() - started < 1
+
+    client = ScriptedClient({})
+    assert _generate(client, router) == (None, None) and client.calls == []
+
+
+def test_client_errors_do_not_count_against_the_model():
+    router = ModelRouter(["a", "b"], failure_threshold=1)
+    client = ScriptedClient({"a": [400, 404]})
+
+    for _ in range(2):
+        response, model = _generate(client, router)
+        assert model == "b"
+    # Not retried, the next model answers; the circuit stays closed
+    assert client.calls == ["a", "b", "a", "b"]
+    assert router.snapshot()["a"]["consecutive_failures"] == 0 and _state(router, "a") == CLOSED
+
+
+@pytest.mark.parametrize("error", [503, 429, TimeoutError("read timed out")])
+def test_retryable_errors_open_the_circuit(error):
+    router = ModelRouter(["a", "b"], failure_threshold=2, cooldown_seconds=60)
+    client = ScriptedClient({"a": [error, error]})
+
+    response, model = _generate(client, router)
+    # Retried once, then the open circuit moves the request to the next model
+    assert model == "b" and client.calls == ["a", "a", "b"]
+    assert _state(router, "a") == OPEN
+
+    assert _generate(client, router)[1] == "b"
+    assert client.calls[3:] == ["b"]
+
+
+def test_other_exceptions_are_raised():
+    router = ModelRouter(["a", "b"])
+    with pytest.raises(ValueError):
+        _generate(ScriptedClient({"a": [ValueError("bad request body")]}), router)
+    assert _state(router, "a") == CLOSED
+
+
+@pytest.mark.parametrize("status_code, retryable", [
+    (408, True), (429, True), (500, True), (503, True), (400, False), (403, False), (404, False), (None, False),
+])
+def test_is_retryable(status_code, retryable):
+    assert is_retryable(status_code) == retryable
+
+
+def test_is_timeout():
+    class ReadTimeout(Exception):
+        pass
+
+    assert is_timeout(TimeoutError()) and is_timeout(ReadTimeout())
+    assert not is_timeout(ValueError("Timeout in the message only"))
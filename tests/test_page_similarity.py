@@ -0,0 +1,45 @@
+import random
+
+import numpy as np
+
+from util.page_similarity import THUMBNAIL_SIDE, BKTree, diff_region, hamming_distance
+
+
+def test_bktree_search_matches_linear_scan():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(300)]
+    # Near-duplicates of the first pages
+    hashes += [value ^ (1 << rng.randrange(64)) for value in hashes[:20]]
+    tree = BKTree()
+    for index, value in enumerate(hashes):
+        tree.add(value, f"Deck/page_{index:05d}")
+
+    for query in hashes[:20] + [rng.getrandbits(64)]:
+        expected = sorted((hamming_distance(query, value), value, f"Deck/page_{index:05d}")
+                          for index, value in enumerate(hashes) if hamming_distance(query, value) <= 4)
+        assert tree.search(query, 4) == expected
+    assert tree.size == len(hashes)
+
+
+def test_bktree_keeps_every_key_of_a_hash():
+    tree = BKTree()
+    tree.add(0b1010, "A/page_00001")
+    tree.add(0b1010, "B/page_00001")
+    tree.add(0b1011, "A/page_00002")
+    assert tree.search(0b1010, 0) == [(0, 0b1010, "A/page_00001"), (0, 0b1010, "B/page_00001")]
+    assert [key for _, _, key in tree.search(0b1010, 1)] == ["A/page_00001", "B/page_00001", "A/page_00002"]
+
+
+def test_diff_region_covers_the_changed_cells():
+    thumbnail = np.full((THUMBNAIL_SIDE, THUMBNAIL_SIDE), 255, dtype=np.uint8)
+    assert diff_region(thumbnail, thumbnail.copy(), (2480, 3508)) == (None, 0.0)
+
+    other = thumbnail.copy()
+    other[10:20, 30:40] = 0
+    # Changes below the threshold are rendering noise
+    other[100:110, 100:110] = 250
+    region, fraction = diff_region(thumbnail, other, (THUMBNAIL_SIDE * 10, THUMBNAIL_SIDE * 20))
+
+    # Grown by one cell on every side, scaled to page pixels
+    assert region == [29 * 10, 9 * 20, 41 * 10, 21 * 20]
+    assert fraction == 12 * 12 / THUMBNAIL_SIDE ** 2
@@ -0,0 +1,162 @@
+import os
+
+import pytest
+
+from util.cache_store import TransformationCache
+from util import pdf_helper
+from util.pdf_helper import _apply_renumbering, _plan_pdf
+
+
+@pytest.fixture
+def deck(tmp_path):
+    """A cached three-page document (page contents a, b, c) and a function changing the PDF's page fingerprints."""
+    pdf_file = tmp_path / "to_process" / "Deck.pdf"
+    pdf_file.parent.mkdir()
+    pdf_file.write_bytes(b"%PDF-1.4")
+    folder = tmp_path / "processed" / "Deck"
+    folder.mkdir(parents=True)
+    cache = TransformationCache(str(tmp_path / "transformation_cache.sqlite3"))
+
+    rows = []
+    for page_number, fingerprint in enumerate("abc", 1):
+        image_path = folder / f"page_{page_number:05d}.png"
+        image_path.write_text(fingerprint)
+        rows.append((str(image_path), str(pdf_file), page_number, fingerprint))
+    cache.put_many(rows)
+
+    def edit(fingerprints: str) -> dict | None:
+        stat = os.stat(pdf_file)
+        cache.put_pdf_fingerprints(str(pdf_file), stat.st_size, stat.st_mtime_ns, list(fingerprints))
+        return _plan_pdf(str(pdf_file), cache)
+
+    return cache, str(pdf_file), folder, edit
+
+
+def _renumber(plan, cache) -> list:
+    calls = []
+    _apply_renumbering(plan, cache, lambda document, renames, removed: calls.append((document, renames, removed)))
+    return calls
+
+
+def _contents(folder) -> dict[str, str]:
+    return {path.stem: path.read_text() for path in sorted(folder.iterdir())}
+
+
+def test_unchanged_pdf_is_up_to_date(deck):
+    _, _, _, edit = deck
+    assert edit("abc") is None
+
+
+def test_inserted_page_renumbers_the_following_pages(deck):
+    cache, pdf_file, folder, edit = deck
+    plan = edit("axbc")
+
+    assert plan["pages"] == [2]
+    assert plan["kept"] == 1
+    assert [(os.path.basename(old), os.path.basename(new), number) for old, new, number in plan["moves"]] == \
+        [("page_00002.png", "page_00003.png", 3), ("page_00003.png", "page_00004.png", 4)]
+    assert plan["removed"] == []
+
+    assert _renumber(plan, cache) == [("Deck", {"page_00002": "page_00003", "page_00003": "page_00004"}, [])]
+    assert _contents(folder) == {"page_00001": "a", "page_00003": "b", "page_00004": "c"}
+    assert [(os.path.basename(path), number, fingerprint) for path, number, fingerprint in sorted(cache.pages_for_pdf(pdf_file))] == \
+        [("page_00001.png", 1, "a"), ("page_00003.png", 3, "b"), ("page_00004.png", 4, "c")]
+
+
+def test_removed_page_moves_the_following_pages_up(deck):
+    cache, pdf_file, folder, edit = deck
+    plan = edit("ac")
+
+    assert plan["pages"] == []
+    assert [(os.path.basename(old), os.path.basename(new), number) for old, new, number in plan["moves"]] == \
+        [("page_00003.png", "page_00002.png", 2)]
+
+    assert _renumber(plan, cache) == [("Deck", {"page_00003": "page_00002"}, [])]
+    assert _contents(folder) == {"page_00001": "a", "page_00002": "c"}
+    assert [(os.path.basename(path), number) for path, number, _ in sorted(cache.pages_for_pdf(pdf_file))] == \
+        [("page_00001.png", 1), ("page_00002.png", 2)]
+
+
+def test_truncated_pdf_removes_the_last_pages(deck):
+    cache, pdf_file, folder, edit = deck
+    plan = edit("ab")
+
+    assert plan["pages"] == [] and plan["moves"] == []
+    assert [os.path.basename(path) for path in plan["removed"]] == ["page_00003.png"]
+    assert _renumber(plan, cache) == [("Deck", {}, ["page_00003"])]
+    assert _contents(folder) == {"page_00001": "a", "page_00002": "b"}
+
+
+def test_changed_pages_drop_their_outputs(deck, monkeypatch):
+    cache, pdf_file, _, edit = deck
+    edit("axbd")
+    monkeypatch.setattr(pdf_helper, "get_transformation_cache", lambda config: cache)
+
+    calls = []
+    plans = pdf_helper.plan_page_updates({pdf_file}, None, lambda document, renames, removed: calls.append((document, renames, removed)))
+
+    assert plans[pdf_file]["pages"] == [2, 4]
+    # Renumbered first, then the outputs of the old content of the pages to convert are dropped
+    assert calls == [("Deck", {"page_00002": "page_00003"}, []), ("Deck", {}, ["page_00002", "page_00004"])]
+
+
+@pytest.fixture
+def fake_poppler(monkeypatch):
+    """Replaces pdftoppm/pdfinfo: every PDF has as many pages as its name says (e.g. Deck_3.pdf); returns the rendered windows."""
+    import pdf2image
+    from PIL import Image
+
+    windows = []
+
+    def convert_from_path(pdf_file, dpi=300, first_page=1, last_page=None, grayscale=False):
+        windows.append((os.path.basename(pdf_file), first_page, last_page))
+        return [Image.new("L" if grayscale else "RGB", (20, 30), "white") for _ in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(pdf2image, "convert_from_path", convert_from_path)
+    monkeypatch.setattr(pdf2image, "pdfinfo_from_path",
+                        lambda pdf_file: {"Pages": int(os.path.splitext(pdf_file)[0].rsplit("_", 1)[1])})
+    return windows
+
+
+def test_iter_pdf_images_streams_written_pages(tmp_path, fake_poppler):
+    pdf_files = {str(tmp_path / "Deck_5.pdf"), str(tmp_path / "Notes_1.pdf")}
+    target = tmp_path / "processed"
+
+    images = pdf_helper.iter_pdf_images(pdf_files, str(target), page_window=2, pages_per_task=4)
+    image_path, pdf_file = next(images)
+    # The first page is on disk before the rest of the document is rasterized
+    assert os.path.exists(image_path) and pdf_file.endswith("Deck_5.pdf")
+    assert fake_poppler == [("Deck_5.pdf", 1, 2)]
+
+    rest = list(images)
+    assert [os.path.relpath(path, target) for path, _ in [(image_path, pdf_file)] + rest] == \
+        [os.path.join("Deck_5", f"page_{number:05d}.png") for number in range(1, 6)] + [os.path.join("Notes_1", "page_00001.png")]
+    assert fake_poppler == [("Deck_5.pdf", 1, 2), ("Deck_5.pdf", 3, 4), ("Deck_5.pdf", 5, 5), ("Notes_1.pdf", 1, 1)]
+
+
+def test_pdfs_to_images_returns_every_page(tmp_path, fake_poppler):
+    pages = pdf_helper.pdfs_to_images({str(tmp_path / "Deck_3.pdf")}, str(tmp_path / "processed"))
+    assert [os.path.basename(path) for path, _ in pages] == ["page_00001.png", "page_00002.png", "page_00003.png"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rasterize_pdfs_isolates_failures_per_document(tmp_path, fake_poppler, monkeypatch, workers):
+    import pdf2image
+
+    convert_from_path = pdf2image.convert_from_path
+
+    def failing_pages(pdf_file, first_page=1, last_page=None, **kwargs):
+        if "Broken" in pdf_file and last_page >= 3:
+            raise RuntimeError("damaged page")
+        return convert_from_path(pdf_file, first_page=first_page, last_page=last_page, **kwargs)
+
+    monkeypatch.setattr(pdf2image, "convert_from_path", failing_pages)
+    pdf_files = {str(tmp_path / "Deck_3.pdf"), str(tmp_path / "Broken_4.pdf"), str(tmp_path / "Missing.pdf")}
+    report = pdf_helper.rasterize_pdfs(pdf_files, str(tmp_path / "processed"), workers=workers, pages_per_task=2, page_window=2)
+
+    deck, broken, missing = (report[str(tmp_path / name)] for name in ("Deck_3.pdf", "Broken_4.pdf", "Missing.pdf"))
+    assert [os.path.basename(path) for path, _ in deck["pages"]] == ["page_00001.png", "page_00002.png", "page_00003.png"]
+    assert deck["page_count"] == 3 and deck["errors"] == []
+    # Only the failing range is reported, but a document with errors keeps no pages
+    assert broken["pages"] == [] and broken["errors"] == ["pages 3-4: damaged page"]
+    assert missing["pages"] == [] and len(missing["errors"]) == 1
@@ -0,0 +1,92 @@
+import itertools
+import threading
+import time
+
+from util.pipeline import Pipeline, Stage
+
+
+def _pipeline(stages: list[Stage]) -> Pipeline:
+    return Pipeline(stages, poll_interval=0.01)
+
+
+def test_results_and_stats():
+    pipeline = _pipeline([
+        # Odd items are dropped
+        Stage("even", lambda item: item if item % 2 == 0 else None, workers=2),
+        Stage("double", lambda items: [item * 2 for item in items], batch_size=3, batch_timeout=0.05),
+        Stage("fail", lambda item: item if item != 8 else 1 / 0),
+    ])
+    assert sorted(pipeline.run(range(10))) == [0, 4, 12, 16]
+
+    summary = pipeline.summary()
+    assert (summary["even"]["items_in"], summary["even"]["items_out"], summary["even"]["errors"]) == (10, 5, 0)
+    assert (summary["double"]["items_in"], summary["double"]["items_out"]) == (5, 5)
+    assert (summary["fail"]["items_in"], summary["fail"]["items_out"], summary["fail"]["errors"]) == (5, 4, 1)
+    assert pipeline.stats["fail"].failed == [(8, 0, "division by zero")]
+    assert all(stage["p50_ms"] is not None for stage in summary.values())
+
+
+def test_failing_fan_out_item_keeps_its_produced_results():
+    def pages(task):
+        name, count = task
+        for number in range(1, count + 1):
+            if name == "broken" and number == 3:
+                raise RuntimeError("damaged page")
+            yield f"{name}/{number}"
+
+    pipeline = _pipeline([Stage("expand", pages, fan_out=True), Stage("collect", lambda page: page)])
+    results = pipeline.run([("deck", 2), ("broken", 5), ("notes", 1)])
+
+    assert sorted(results) == ["broken/1", "broken/2", "deck/1", "deck/2", "notes/1"]
+    assert pipeline.summary()["expand"]["errors"] == 1
+    # Pages 3 to 5 of the broken range are lost
+    assert pipeline.stats["expand"].failed == [(("broken", 5), 2, "damaged page")]
+
+
+def test_limit_stops_the_stages_upstream():
+    source = itertools.count()
+    pipeline = _pipeline([
+        Stage("expand", lambda item: [item] * 3, fan_out=True, limit=5),
+        Stage("collect", lambda item: item),
+    ])
+    results = pipeline.run(source)
+
+    assert sorted(results) == [0, 0, 0, 1, 1]
+    # The endless source was not drained
+    assert next(source) < 50
+
+
+def test_cancel_finishes_items_in_flight():
+    pipeline = _pipeline([Stage("cancel", lambda item: pipeline.cancel() or item if item == 10 else item),
+                          Stage("collect", lambda item: item)])
+    assert pipeline.run(itertools.count()) == list(range(11))
+
+
+def test_cancel_without_drain_stops_every_stage():
+    pipeline = _pipeline([Stage("forward", lambda item: item),
+                          Stage("cancel", lambda item: pipeline.cancel(drain=False) or item)])
+    assert pipeline.run(itertools.count()) == [0]
+
+
+def test_full_queues_block_the_source():
+    produced = []
+    release = threading.Event()
+
+    def source():
+        for item in itertools.count():
+            produced.append(item)
+            yield item
+
+    pipeline = _pipeline([Stage("forward", lambda item: item, queue_size=1),
+                          Stage("slow", lambda item: release.wait() and item, queue_size=1)])
+    runner = threading.Thread(target=pipeline.run, args=(source(),))
+    runner.start()
+    time.sleep(0.3)
+    # One item in each stage, one in each queue and one held by the blocked source
+    assert len(produced) <= 5
+
+    pipeline.cancel(drain=False)
+    release.set()
+    runner.join(timeout=5)
+    assert not runner.is_alive()
+    assert pipeline.summary()["forward"]["blocked_seconds"] > 0.1
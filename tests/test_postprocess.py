@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from gemini_detection.postprocess import _pairwise_overlaps, _score, merge_overlapping_boxes, postprocess_gemini_boxes
+
+
+def test_pairwise_overlaps():
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [2, 2, 4, 4], [20, 20, 20, 30]], dtype=np.float64)
+    iou, containment = _pairwise_overlaps(boxes)
+
+    assert iou[0, 1] == iou[1, 0] == pytest.approx(50 / 150)
+    assert iou[0, 2] == pytest.approx(4 / 100)
+    # Containment is relative to the row box: the small box lies fully inside the first one
+    assert containment[2, 0] == 1.0 and containment[0, 2] == pytest.approx(0.04)
+    # A degenerate box overlaps nothing instead of dividing by zero
+    assert iou[3].tolist() == [0.0, 0.0, 0.0, 0.0] and containment[3].tolist() == [0.0, 0.0, 0.0, 0.0]
+
+
+@pytest.mark.parametrize("threshold, kept", [(0.3, [0]), (0.4, [0, 1])])
+def test_iou_merges_above_the_threshold(threshold, kept):
+    # IoU of the two boxes is 1/3; the higher score is kept
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10]], dtype=np.float64)
+    keep = merge_overlapping_boxes(boxes, ["text", "image"], np.array([0.9, 0.5]), iou_threshold=threshold)
+    assert sorted(keep.tolist()) == kept
+
+
+def test_containment_merges_only_the_same_label():
+    boxes = np.array([[0, 0, 100, 100], [10, 10, 30, 30]], dtype=np.float64)
+    scores = np.ones(2)
+    # The larger box wins on equal scores and absorbs the nested box of its own label
+    assert merge_overlapping_boxes(boxes, ["text", "text"], scores).tolist() == [0]
+    # An image inside a text block is kept
+    assert merge_overlapping_boxes(boxes, ["text", "image"], scores).tolist() == [0, 1]
+
+
+def test_empty_input():
+    assert merge_overlapping_boxes(np.zeros((0, 4)), [], np.zeros(0)).tolist() == []
+    assert postprocess_gemini_boxes([], (1000, 1000)) == {"boxes": [], "labels": [], "scores": []}
+    assert postprocess_gemini_boxes([{"label": "text"}, "box", {"box_2d": [1, 2]}], (1000, 1000))["boxes"] == []
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0.25, 0.25), ("0.5", 0.5), (None, 1.0), (True, 1.0), ("high", 1.0), ([0.3], 1.0), (float("nan"), 1.0), (float("inf"), 1.0),
+])
+def test_score_coercion(value, expected):
+    assert _score(value) == expected
+
+
+def test_postprocess_gemini_boxes():
+    result = postprocess_gemini_boxes([
+        # Swapped corners are ordered, coordinates clamped to the image
+        {"box_2d": [600, 500, 500, 100], "label": "image", "score": "0.8"},
+        {"box_2d": [100, 100, 200, 900], "label": "text", "score": None},
+        # Near-duplicate of the text block with a lower score
+        {"box_2d": [101, 100, 200, 890], "label": "text", "score": 0.4},
+        {"box_2d": [900, 0, 1200, 1000], "label": "text", "score": "broken"},
+        # Thinner than min_side pixels
+        {"box_2d": [300, 100, 300, 900], "label": "text"},
+        # Non-numeric coordinates are dropped entry by entry
+        {"box_2d": [1, "a", 2, 3], "label": "text"},
+    ], (200, 100))
+
+    assert result == {
+        "boxes": [[20, 10, 180, 20], [20, 50, 100, 60], [0, 90, 200, 100]],
+        "labels": ["text", "image", "text"],
+        "scores": [1.0, 0.8, 1.0],
+    }
@@ -0,0 +1,90 @@
+import pytest
+
+from gemini_detection import scheduler
+from gemini_detection.scheduler import ModelRateLimiter, TokenBucket, backoff_delay
+
+
+class FakeClock:
+    """Monotonic clock that only moves when slept on."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_bucket_starts_full_and_refills_continuously():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock, sleep=clock.sleep)
+
+    assert [bucket.acquire() for _ in range(60)] == [0.0] * 60
+    # One token per second
+    assert bucket.acquire() == pytest.approx(1.0)
+    clock.now += 2.5
+    assert bucket.acquire(2) == 0.0
+    assert bucket.acquire() == pytest.approx(0.5)
+
+
+def test_bucket_refills_at_most_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(60, capacity=10, clock=clock, sleep=clock.sleep)
+    bucket.acquire(10)
+
+    clock.now += 3600
+    assert bucket.acquire(10) == 0.0
+    assert bucket.acquire(3) == pytest.approx(3.0)
+    # Requests above the capacity wait for a full bucket only
+    assert bucket.acquire(50) == pytest.approx(10.0)
+
+
+def test_adjust_books_corrections_without_waiting():
+    clock = FakeClock()
+    bucket = TokenBucket(600, clock=clock, sleep=clock.sleep)  # 10 tokens per second
+    bucket.acquire(600)
+
+    bucket.adjust(100)
+    assert clock.sleeps == []
+    # The negative balance is paid back before the next request
+    assert bucket.acquire(50) == pytest.approx(15.0)
+    bucket.adjust(-10_000)
+    assert bucket.acquire(600) == 0.0
+
+
+def test_rate_limiter_requests_per_minute():
+    clock = FakeClock()
+    limiter = ModelRateLimiter({"pro": {"RPM": 2, "TPM": 1_000_000}}, default_rpm=60, clock=clock, sleep=clock.sleep)
+
+    assert limiter.acquire("pro", 100) == 0.0
+    assert limiter.acquire("pro", 100) == 0.0
+    assert limiter.acquire("pro", 100) == pytest.approx(30.0)
+    # Every model has its own buckets
+    assert limiter.acquire("flash", 100) == 0.0
+
+
+def test_rate_limiter_tokens_per_minute_with_reported_usage():
+    clock = FakeClock()
+    limiter = ModelRateLimiter({"pro": {"RPM": 1000, "TPM": 600}}, clock=clock, sleep=clock.sleep)
+
+    assert limiter.acquire("pro", 600) == 0.0
+    # The response used fewer tokens than estimated: the difference is returned
+    limiter.record_usage("pro", 600, 400)
+    assert limiter.acquire("pro", 200) == 0.0
+    limiter.record_usage("pro", 200, None)
+    assert limiter.acquire("pro", 100) == pytest.approx(10.0)
+    assert clock.now == pytest.approx(10.0)
+
+
+@pytest.mark.parametrize("attempt, bound", [(0, 1.0), (1, 2.0), (3, 8.0), (10, 30.0)])
+def test_backoff_delay_uses_full_jitter(monkeypatch, attempt, bound):
+    calls = []
+    monkeypatch.setattr(scheduler.random, "uniform", lambda low, high: calls.append((low, high)) or high)
+
+    # Uniform between 0 and the capped exponential delay
+    assert backoff_delay(attempt, base=1.0, maximum=30.0) == bound
+    assert calls == [(0, bound)]
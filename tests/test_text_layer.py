@@ -0,0 +1,134 @@
+import subprocess
+
+import pytest
+from PIL import Image
+
+from util import text_layer
+from util.detection_io import read_page_boxes
+from util.page import Page
+from util.text_layer import TextLayerAnalyzer, block_boxes, cluster_lines, read_image_areas, read_text_layer
+
+
+def _line(x1, y1, x2, y2, text):
+    return f'<line xMin="{x1}" yMin="{y1}" xMax="{x2}" yMax="{y2}"><word xMin="{x1}" yMin="{y1}" xMax="{x2}" yMax="{y2}">{text}</word></line>'
+
+
+# pdftotext -bbox-layout output of three 720x540 pt slides: a heading above two body lines next to a second column,
+# a nearly empty page and a page with text on a full-page image
+BBOX_LAYOUT = f"""<!DOCTYPE html><html xmlns="http://www.w3.org/1999/xhtml"><head><title></title></head><body><doc>
+<page width="720.000000" height="540.000000"><flow><block>
+{_line(50, 80, 400, 116, "Einführung &amp; Überblick")}
+{_line(50, 120, 330, 138, "Erster Punkt der Liste")}
+{_line(65, 142, 300, 160, "zweite Zeile eingerückt")}
+<line xMin="50" yMin="170" xMax="60" yMax="180"><word xMin="50" yMin="170" xMax="60" yMax="180"> </word></line>
+{_line(420, 120, 680, 138, "Zweite Spalte mit Text")}
+</block></flow></page>
+<page width="720.000000" height="540.000000"><flow><block>{_line(50, 40, 90, 60, "Ende")}</block></flow></page>
+<page width="720.000000" height="540.000000"><flow><block>{_line(50, 40, 600, 60, "Beschriftung eines gescannten Fotos")}</block></flow></page>
+</doc></body></html>"""
+
+# pdfimages -list output: a small logo on page 1, a full-page image with its soft mask on page 3
+IMAGE_LIST = """page   num  type   width height color comp bpc  enc interp  object ID x-ppi y-ppi size ratio
+--------------------------------------------------------------------------------------------
+   1     0 image      40    40  rgb     3   8  jpeg   no        10  0   144   144  2K 1.5%
+   3     1 image    2000  1500  rgb     3   8  jpeg   no        12  0   200   200  171K 1.5%
+   3     2 smask    2000  1500  gray    1   8  jpx    no        13  0   200   200  171K 1.5%
+"""
+
+
+@pytest.fixture
+def poppler(monkeypatch):
+    """Replaces the poppler calls by the fixtures above; returns the tools called."""
+    calls = []
+
+    def run(arguments, timeout):
+        calls.append(arguments[0])
+        return BBOX_LAYOUT if arguments[0] == "pdftotext" else IMAGE_LIST
+
+    monkeypatch.setattr(text_layer, "_poppler", run)
+    return calls
+
+
+def test_read_text_layer(poppler):
+    pages = read_text_layer("slides.pdf")
+
+    assert sorted(pages) == [1, 2, 3]
+    first = pages[1]
+    assert (first.width, first.height) == (720, 540)
+    # The line holding only whitespace is skipped
+    assert first.lines == [[50, 80, 400, 116], [50, 120, 330, 138], [65, 142, 300, 160], [420, 120, 680, 138]]
+    assert first.chars == len("Einführung & Überblick") + len("Erster Punkt der Liste") + len("zweite Zeile eingerückt") \
+        + len("Zweite Spalte mit Text")
+    assert first.text_area == 350 * 36 + 280 * 18 + 235 * 18 + 260 * 18
+
+    # Pages are numbered from first_page
+    assert sorted(read_text_layer("slides.pdf", first_page=5)) == [5, 6, 7]
+
+
+def test_read_image_areas(poppler):
+    # Pixels at the placement resolution, in points; soft masks are no extra area
+    assert read_image_areas("slides.pdf") == {1: 20 * 20, 3: 720 * 540}
+
+
+def test_cluster_lines():
+    lines = [
+        [50, 80, 400, 116],  # heading, twice the height of the body text
+        [50, 120, 330, 138],
+        [65, 142, 300, 160],  # stacked under the line above
+        [420, 120, 680, 138],  # second column, five line heights to the right
+        [50, 300, 200, 318],  # paragraph further down
+        [215, 300, 400, 318],  # same row, less than a line height apart
+    ]
+    assert cluster_lines(lines) == [[0], [1, 2], [3], [4, 5]]
+    # A larger size ratio joins the heading with the body text below it
+    assert cluster_lines(lines, size_ratio=2.5)[0] == [0, 1, 2]
+    # A smaller column gap splits the row
+    assert cluster_lines(lines, column_gap=0.5)[-2:] == [[4], [5]]
+    assert cluster_lines([]) == []
+
+
+def test_block_boxes_pad_by_the_median_line_height():
+    lines = [[50, 120, 330, 138], [65, 142, 300, 160], [60, 164, 310, 174]]
+    box, = block_boxes(lines, [[0, 1, 2]])
+    assert box == pytest.approx([50 - 2.7, 120 - 2.7, 330 + 2.7, 174 + 2.7])
+
+
+def test_detect_page(tmp_path, poppler):
+    pdf_file = tmp_path / "slides.pdf"
+    pdf_file.write_bytes(b"%PDF-1.4")
+    folder = tmp_path / "processed" / "slides"
+    folder.mkdir(parents=True)
+    pages = []
+    for page_number in (1, 2, 3):
+        image_path = folder / f"page_{page_number:05d}.png"
+        # Rendered at twice the PDF's point size
+        Image.new("RGB", (1440, 1080), "white").save(image_path)
+        pages.append(Page(str(image_path), str(pdf_file), page_number))
+    detections = str(tmp_path / "detections")
+    analyzer = TextLayerAnalyzer()
+
+    boxes = analyzer.detect_page(pages[0], detections)
+    assert boxes == [[89, 149, 811, 243], [95, 235, 665, 325], [835, 235, 1365, 281]]
+    record = read_page_boxes(pages[0].image_path, detections)
+    assert record["boxes"] == boxes and record["labels"] == ["text"] * 3 and record["source"] == "text_layer"
+
+    # Too little text and a scanned page are left to the detector
+    assert analyzer.detect_page(pages[1], detections) is None
+    assert analyzer.detect_page(pages[2], detections) is None
+    assert analyzer.stats() == {"text_pages": 1, "fallback_no_text": 1, "fallback_images": 1, "fallback_unreadable": 0}
+    # The document was read once for all of its pages
+    assert poppler == ["pdftotext", "pdfimages"]
+    assert read_page_boxes(pages[1].image_path, detections) is None
+
+
+def test_unreadable_document_goes_to_the_detector(tmp_path, monkeypatch):
+    def failing(arguments, timeout):
+        raise subprocess.CalledProcessError(1, arguments)
+
+    monkeypatch.setattr(text_layer, "_poppler", failing)
+    pdf_file = tmp_path / "broken.pdf"
+    pdf_file.write_bytes(b"%PDF-1.4")
+    analyzer = TextLayerAnalyzer()
+
+    assert analyzer.page_blocks(str(pdf_file), 1) is None
+    assert analyzer.stats()["fallback_unreadable"] == 1
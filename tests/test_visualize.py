@@ -0,0 +1,40 @@
+import os
+
+from PIL import Image
+
+from gemini_detection.visualize import visualization_path, visualize_bounding_boxes
+from util.detection_io import write_boxes
+
+
+def _document(tmp_path, pages: int) -> list[str]:
+    folder = tmp_path / "processed" / "Deck"
+    folder.mkdir(parents=True)
+    image_paths = []
+    for page_number in range(1, pages + 1):
+        image_path = str(folder / f"page_{page_number:05d}.png")
+        Image.new("RGB", (120, 160), "white").save(image_path)
+        write_boxes(image_path, [[10, 10, 60, 40 + page_number]], str(tmp_path / "detections"))
+        image_paths.append(image_path)
+    return image_paths
+
+
+def test_renders_on_a_process_pool_and_skips_up_to_date_pages(tmp_path):
+    image_paths = _document(tmp_path, 3)
+    output_dir = str(tmp_path / "visualizations")
+    render = lambda **kwargs: visualize_bounding_boxes(str(tmp_path / "processed" / "Deck"), str(tmp_path / "detections"),
+                                                       output_dir, show=False, workers=2, **kwargs)
+
+    results = render()
+    assert sorted(results) == ["Deck/page_00001", "Deck/page_00002", "Deck/page_00003"]
+    assert results["Deck/page_00002"] == visualization_path(image_paths[1], output_dir)
+    with Image.open(results["Deck/page_00001"]) as image:
+        assert image.getpixel((10, 20)) == (255, 0, 0)
+    mtimes = {key: os.stat(path).st_mtime_ns for key, path in results.items()}
+
+    # Nothing changed: every visualization is kept
+    assert {key: os.stat(path).st_mtime_ns for key, path in render().items()} == mtimes
+    # New boxes for one page re-render only that page
+    write_boxes(image_paths[2], [[0, 0, 5, 5]], str(tmp_path / "detections"))
+    changed = {key for key, path in render().items() if os.stat(path).st_mtime_ns != mtimes[key]}
+    assert changed == {"Deck/page_00003"}
+    assert render(force=True).keys() == mtimes.keys()